@@ -7,8 +7,9 @@ SRC_PATH = PROJECT_ROOT / "src"
 if str(SRC_PATH) not in sys.path:
     sys.path.insert(0, str(SRC_PATH))
 
-from codex_ai_teams.ui.main_window import run_app
-
 
 if __name__ == "__main__":
+    # Imported here: the runtime worker process re-imports this file and should not load Qt.
+    from codex_ai_teams.ui.main_window import run_app
+
     run_app()
@@ -0,0 +1,62 @@
+from pathlib import Path
+import argparse
+import signal
+import sys
+
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_PATH = PROJECT_ROOT / "src"
+if str(SRC_PATH) not in sys.path:
+    sys.path.insert(0, str(SRC_PATH))
+
+from codex_ai_teams.agent_runtime import AgentRuntimeManager  # noqa: E402
+from codex_ai_teams.batch_runner import BatchRunner, BatchTaskResult, load_tasks  # noqa: E402
+from codex_ai_teams.config import load_settings  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="批量执行任务文件（JSONL/CSV）中的 prompt")
+    parser.add_argument("tasks", type=Path, help="任务文件，字段：id / agent / prompt / work_path")
+    parser.add_argument("--results", type=Path, default=None, help="结果 JSONL，默认 logs/batch_<任务文件名>.jsonl")
+    parser.add_argument("--agent", default="", help="任务未指定 agent 时使用的默认 agent")
+    parser.add_argument("--concurrency", type=int, default=4, help="最大并发任务数")
+    parser.add_argument("--timeout", type=int, default=0, help="单任务超时(秒)，默认取配置 bridge.timeout_sec")
+    parser.add_argument("--work-path", default=str(PROJECT_ROOT), help="默认工作路径")
+    parser.add_argument(
+        "--shared-session",
+        action="store_true",
+        help="续用各 agent 的 session（同一 agent 的任务串行执行）；默认每个任务使用独立会话",
+    )
+    args = parser.parse_args()
+
+    settings = load_settings(PROJECT_ROOT / "config" / "teams.yaml")
+    tasks = load_tasks(args.tasks, default_agent=args.agent)
+    results_path = args.results or PROJECT_ROOT / "logs" / f"batch_{args.tasks.stem}.jsonl"
+
+    runtime = AgentRuntimeManager(settings.agents, PROJECT_ROOT, settings.runtime, settings.hosts)
+    runner = BatchRunner(
+        runtime,
+        settings.agents,
+        concurrency=args.concurrency,
+        timeout_sec=args.timeout or max(30, settings.bridge.timeout_sec),
+        isolated=not args.shared_session,
+    )
+
+    def _on_interrupt(_signum, _frame) -> None:
+        print("收到中断信号，停止派发新任务，等待执行中的任务结束……")
+        runner.request_stop()
+        runtime.stop()
+
+    signal.signal(signal.SIGINT, _on_interrupt)
+
+    def _on_task_done(result: BatchTaskResult) -> None:
+        print(f"[{result.status}] {result.task_id} ({result.agent_id}) {result.latency_sec:.1f}s")
+
+    report = runner.run(tasks, results_path, args.work_path, on_task_done=_on_task_done)
+    print(f"结果文件: {results_path}")
+    for line in report.summary_lines():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import json
+import math
+import os
+import re
+from collections import deque
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Tuple
+
+HISTORY_SIZE = 50
+MIN_SAMPLES = 5
+PERCENTILE = 95
+PAD_SEC = 5.0
+
+_CODE_HINTS = re.compile(
+    r"实现|开发|编写|修改|改成|重构|修复|生成|新增|添加|删除|删掉|更新|重命名|提交|测试|代码|脚本|接口|页面|"
+    # Whole English words only ("latest" is not "test"); \b would not split them from adjacent Chinese.
+    r"(?<![a-z])(?:implement|refactor|fix|write|build|create|add|remove|delete|rename|update|test|code|script)(?:s|es|d|ed|ing)?(?![a-z])",
+    re.IGNORECASE,
+)
+
+
+def classify_task(text: str) -> str:
+    """粗分任务类型：quick（简短提问）、code（需要改动/生成代码）、general（其余）。"""
+    if _CODE_HINTS.search(text):
+        return "code"
+    if len(text) <= 120 and text.count("\n") <= 2:
+        return "quick"
+    return "general"
+
+
+@dataclass
+class RunTiming:
+    first_line_sec: float
+    max_gap_sec: float
+    total_sec: float
+
+
+@dataclass
+class Deadlines:
+    first_line_sec: float
+    idle_sec: float
+    total_sec: float
+    reason: str
+
+    def describe(self) -> str:
+        return f"首行 {self.first_line_sec:.0f}s / 空闲 {self.idle_sec:.0f}s / 总 {self.total_sec:.0f}s（{self.reason}）"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+class LatencyHistory:
+    """按 (agent, 任务类型) 记录最近成功运行的耗时，据此给出空闲/总耗时的超时阈值。
+
+    阈值 = 观测到的 p95 × margin + PAD_SEC，再夹在 [min_sec, max_sec] 之间；
+    样本少于 MIN_SAMPLES 时沿用旧的固定公式。历史保存在 JSON 文件中，重启后继续生效。
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        margin: float = 2.0,
+        min_sec: float = 15.0,
+        max_sec: float = 1800.0,
+    ) -> None:
+        self.path = path
+        self.margin = margin
+        self.min_sec = min_sec
+        self.max_sec = max(min_sec, max_sec)
+        self._samples: Dict[Tuple[str, str], Deque[RunTiming]] = {}
+        self._lock = Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        for key, rows in data.items():
+            agent_id, _, task_class = key.partition("/")
+            bucket: Deque[RunTiming] = deque(maxlen=HISTORY_SIZE)
+            for row in rows[-HISTORY_SIZE:]:
+                try:
+                    bucket.append(RunTiming(**row))
+                except TypeError:
+                    continue
+            self._samples[(agent_id, task_class)] = bucket
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            data = {f"{a}/{c}": [asdict(t) for t in rows] for (a, c), rows in self._samples.items()}
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def record(self, agent_id: str, task_class: str, timing: RunTiming) -> None:
+        with self._lock:
+            self._samples.setdefault((agent_id, task_class), deque(maxlen=HISTORY_SIZE)).append(timing)
+        self._save()
+
+    def samples(self, agent_id: str, task_class: str) -> List[RunTiming]:
+        with self._lock:
+            return list(self._samples.get((agent_id, task_class), ()))
+
+    def first_line_percentile(self, agent_id: str, task_class: str, pct: float) -> Optional[float]:
+        rows = self.samples(agent_id, task_class)
+        if len(rows) < MIN_SAMPLES:
+            return None
+        return percentile([r.first_line_sec for r in rows], pct)
+
+    def _bound(self, value: float) -> float:
+        return min(self.max_sec, max(self.min_sec, value))
+
+    def deadlines(self, agent_id: str, task_class: str, timeout_sec: int, scale: float = 1.0) -> Deadlines:
+        """scale：超时重试时按倍数放宽，结果仍受 [min_sec, max_sec] 约束；默认公式只看 timeout_sec。"""
+        rows = self.samples(agent_id, task_class)
+        if len(rows) < MIN_SAMPLES:
+            idle = max(20, timeout_sec)
+            total = max(60, timeout_sec * 4)
+            return Deadlines(idle, idle, total, f"{agent_id}/{task_class} 样本 {len(rows)} 条，不足 {MIN_SAMPLES} 条，使用默认公式")
+        first = percentile([r.first_line_sec for r in rows], PERCENTILE)
+        gap = percentile([r.max_gap_sec for r in rows], PERCENTILE)
+        total = percentile([r.total_sec for r in rows], PERCENTILE)
+        idle_sec = self._bound((gap * self.margin + PAD_SEC) * scale)
+        first_sec = self._bound((first * self.margin + PAD_SEC) * scale)
+        # The whole run can never be shorter than the wait allowed for a single gap.
+        total_sec = max(self._bound((total * self.margin + PAD_SEC) * scale), idle_sec, first_sec)
+        reason = (
+            f"依据 {agent_id}/{task_class} 最近 {len(rows)} 次：首行 p{PERCENTILE} {first:.1f}s，"
+            f"最大间隔 p{PERCENTILE} {gap:.1f}s，总耗时 p{PERCENTILE} {total:.1f}s，余量 ×{self.margin:g}"
+        )
+        if scale != 1.0:
+            reason += f"，重试放宽 ×{scale:g}"
+        return Deadlines(first_sec, idle_sec, total_sec, reason)
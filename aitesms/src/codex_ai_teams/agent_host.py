@@ -0,0 +1,180 @@
+import argparse
+import hmac
+import ipaddress
+import os
+import socket
+import socketserver
+from dataclasses import asdict
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Dict
+
+from .agent_runtime import AgentRuntimeManager
+from .config import DEFAULT_CODEX_JS, RuntimeSettings
+from .models import AgentConfig, AgentLogEvent, AgentResult
+from .remote_runtime import HEARTBEAT_SEC, PROTOCOL_VERSION, read_message, send_message
+
+
+def is_loopback(bind: str) -> bool:
+    if bind.strip().lower() == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(bind.strip().strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def host_load(runtime: AgentRuntimeManager) -> Dict[str, object]:
+    try:
+        load_avg = os.getloadavg()[0]
+    except (AttributeError, OSError):
+        load_avg = -1.0
+    return {
+        "host": socket.gethostname(),
+        "version": PROTOCOL_VERSION,
+        "running": runtime.running_count(),
+        "cpus": os.cpu_count() or 1,
+        "load_avg": load_avg,
+    }
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "AgentHostServer"
+
+    def handle(self) -> None:
+        # One request per connection: runs stream on their own connection, so a dropped link only affects that run.
+        try:
+            request = read_message(self.rfile)
+        except (OSError, ValueError) as exc:
+            self._reply({"event": "error", "message": f"请求无法解析: {exc}"})
+            return
+        if request is None:
+            return
+        if not self.server.authorized(str(request.get("token", ""))):
+            self._reply({"event": "error", "message": "token 不匹配"})
+            return
+        op = request.get("op")
+        runtime = self.server.runtime
+        try:
+            if op == "hello":
+                self._reply({"event": "reply", **host_load(runtime)})
+            elif op == "runtime_info":
+                self._reply({"event": "reply", "pids": runtime.runtime_info(), "sessions": runtime.sessions()})
+            elif op == "stop":
+                self._reply({"event": "reply", "stopped": runtime.stop_agent(str(request.get("agent_id", "")))})
+            elif op == "run":
+                self._run(request)
+            else:
+                self._reply({"event": "error", "message": f"未知操作: {op}"})
+        except (KeyError, TypeError, ValueError) as exc:
+            self._reply({"event": "error", "message": f"请求参数无效: {exc}"})
+        except OSError:
+            # The client went away; a running CLI keeps going until it finishes or is stopped.
+            pass
+
+    def _reply(self, message: Dict[str, object]) -> None:
+        try:
+            send_message(self.wfile, message)
+        except OSError:
+            pass
+
+    def _run(self, request: Dict[str, object]) -> None:
+        agent = AgentConfig(**request["agent"])
+        # The host always runs locally, whatever placement the client chose.
+        agent.host = ""
+        self.server.runtime.adopt_session(agent.agent_id, str(request.get("session_id", "")))
+        write_lock = Lock()
+
+        def on_stream(event: AgentLogEvent) -> None:
+            message = {"event": "log", "agent_id": event.agent_id, "status": event.status.value, "message": event.message}
+            with write_lock:
+                send_message(self.wfile, message)
+
+        def on_stream_safe(event: AgentLogEvent) -> None:
+            try:
+                on_stream(event)
+            except OSError:
+                pass
+
+        done = Event()
+
+        def heartbeat() -> None:
+            while not done.wait(HEARTBEAT_SEC):
+                try:
+                    with write_lock:
+                        send_message(self.wfile, {"event": "ping"})
+                except OSError:
+                    return
+
+        Thread(target=heartbeat, name=f"host-ping-{agent.agent_id}", daemon=True).start()
+        try:
+            results = self.server.runtime.dispatch(
+                [agent],
+                str(request.get("text", "")),
+                str(request.get("work_path", "")),
+                int(request.get("timeout_sec", 60)),
+                on_stream_safe,
+                bool(request.get("isolated", False)),
+            )
+        finally:
+            done.set()
+        result: AgentResult = results[0]
+        payload = asdict(result)
+        payload["status"] = result.status.value
+        runtime = self.server.runtime
+        with write_lock:
+            send_message(
+                self.wfile,
+                {
+                    "event": "result",
+                    "result": payload,
+                    "session_id": runtime.sessions().get(agent.agent_id, ""),
+                    "pid": runtime.runtime_info().get(agent.agent_id, -1),
+                },
+            )
+
+
+class AgentHostServer(socketserver.ThreadingTCPServer):
+    """agent 主机守护进程：在本机运行 Codex CLI，通过 TCP 上的逐行 JSON 协议对外提供 run / stop / runtime_info / hello。"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple, runtime: AgentRuntimeManager, token: str = "") -> None:
+        super().__init__(address, _Handler)
+        self.runtime = runtime
+        self.token = token
+
+    def authorized(self, token: str) -> bool:
+        return not self.token or hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="agent 主机守护进程：接受 GUI 的远程派发，在本机运行 Codex CLI")
+    parser.add_argument("--bind", default="127.0.0.1", help="监听地址；对外提供服务时设为 0.0.0.0 并配置 --token")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--root", type=Path, default=Path.cwd(), help="会话、日志与捕获文件的根目录，也是默认工作路径")
+    parser.add_argument("--token", default=os.environ.get("CODEX_AGENT_HOST_TOKEN", ""), help="共享口令，默认取环境变量")
+    parser.add_argument("--codex-js", default=DEFAULT_CODEX_JS, help="本机 codex.js 路径")
+    parser.add_argument("--max-runs", type=int, default=4, help="本机同时运行的 CLI 上限")
+    args = parser.parse_args()
+    if not args.token and not is_loopback(args.bind):
+        # An open port without a token would let anyone on the network run prompts in any work_path.
+        parser.error(f"监听 {args.bind} 时必须设置 --token（或环境变量 CODEX_AGENT_HOST_TOKEN）")
+
+    settings = RuntimeSettings(codex_js=args.codex_js, max_parallel_runs=args.max_runs)
+    runtime = AgentRuntimeManager([], args.root.resolve(), settings)
+    runtime.start()
+    server = AgentHostServer((args.bind, args.port), runtime, args.token)
+    print(f"agent host 监听 {args.bind}:{server.server_address[1]}，根目录 {args.root.resolve()}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        runtime.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,66 +3,238 @@ import subprocess
 import time
 from queue import Empty, Queue
 from threading import Lock, Thread
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
 from typing import Callable, Dict, List, Optional, Tuple
 
+from .adaptive_timeout import Deadlines, LatencyHistory, RunTiming, classify_task
+from .config import HostSettings, RuntimeSettings
+from .context_pack import ContextPackBuilder
+from .diagnostics import profiled
+from .fast_path import CacheKey, FastPathContext, FastPathResolver, ResponseCache
+from .file_index import FileIndex
+from .hedging import DEFAULT_HEDGE_DELAY_SEC, HEDGE_PERCENTILE, HedgeBudget, HedgeStats, RunHandle
+from .line_reader import LineReader
 from .models import AgentConfig, AgentLogEvent, AgentResult, AgentStatus
+from .process_group import kill_group, new_group_kwargs, terminate_group
+from .process_monitor import ProcessMonitor, ResourceStats
+from .remote_runtime import HostPool, HostUnavailable, run_remote
+from .stream_capture import CaptureStore, CaptureWriter
+from .transcript_store import TranscriptStore, TranscriptTurn
+from .usage import TokenUsage, UsageLedger
 
 
 class AgentRuntimeManager:
-    def __init__(self, agents: List[AgentConfig], project_root: Path) -> None:
+    def __init__(
+        self,
+        agents: List[AgentConfig],
+        project_root: Path,
+        settings: Optional[RuntimeSettings] = None,
+        hosts: Optional[List[HostSettings]] = None,
+    ) -> None:
         self.agents = agents
         self.project_root = project_root
+        self.settings = settings or RuntimeSettings()
+        self.fast_path = FastPathResolver()
+        self.response_cache: Optional[ResponseCache] = None
+        if self.settings.response_cache:
+            self.response_cache = ResponseCache(self.settings.response_cache_ttl_sec, self.settings.response_cache_size)
         self._sessions: Dict[str, str] = {a.agent_id: (a.session_id or "") for a in agents}
         self._last_pid: Dict[str, int] = {a.agent_id: -1 for a in agents}
-        self._active_procs: Dict[str, subprocess.Popen] = {}
+        self._active_procs: Dict[str, Dict[int, subprocess.Popen]] = {}
         self._proc_lock = Lock()
+        # Bumped by stop_agent; a queued run submitted under an older value is skipped instead of started.
+        self._stop_generation: Dict[str, int] = {}
+        # agent_id -> the last queued non-isolated turn; the next one starts when it completes.
+        self._session_tail: Dict[str, Future] = {}
+        self.monitor = ProcessMonitor(self.settings.monitor_interval_sec)
+        self._stop_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="agent-stop")
+        # Shared by every dispatch, so a broadcast to dozens of agents queues instead of spawning a thread each.
+        self.max_parallel_runs = max(1, self.settings.max_parallel_runs)
+        self._run_pool = ThreadPoolExecutor(max_workers=self.max_parallel_runs, thread_name_prefix="agent-run")
+        self._queued_runs = 0
+        self._queue_lock = Lock()
+        self._lines = LineReader()
+        self.context_packs: Optional[ContextPackBuilder] = None
+        if self.settings.context_pack:
+            self.context_packs = ContextPackBuilder(self.settings.context_pack_max_chars)
+        # agent_id -> hash of the context pack already sent into its current session.
+        self._pack_sent: Dict[str, int] = {}
+        self.latency: Optional[LatencyHistory] = None
+        if self.settings.adaptive_timeout:
+            self.latency = LatencyHistory(
+                project_root / ".agent_sessions" / "latency_history.json",
+                self.settings.timeout_margin,
+                self.settings.timeout_min_sec,
+                self.settings.timeout_max_sec,
+            )
+        self.hedge_budget: Optional[HedgeBudget] = None
+        self.hedge_stats = HedgeStats()
+        self._hedge_lock = Lock()
+        if self.settings.hedge:
+            self.hedge_budget = HedgeBudget(self.settings.hedge_budget_ratio)
+            self._hedge_pool = ThreadPoolExecutor(max_workers=2 * self.max_parallel_runs, thread_name_prefix="agent-hedge")
+        self.captures: Optional[CaptureStore] = None
+        if self.settings.stream_capture:
+            self.captures = CaptureStore(project_root / "logs" / "captures", self.settings.capture_keep_per_agent)
+        self.hosts: Optional[HostPool] = None
+        self._remote_active: Dict[str, int] = {}
+        if hosts:
+            self.hosts = HostPool(hosts, project_root / ".agent_sessions" / "placements.json")
+            self._remote_pool = ThreadPoolExecutor(max_workers=sum(h.max_runs for h in hosts), thread_name_prefix="agent-remote")
+        self.transcripts = TranscriptStore(project_root / ".agent_sessions")
+        self.usage = UsageLedger(
+            project_root / ".agent_sessions" / "usage.json", self.settings.token_budget_soft, self.settings.token_budget_hard
+        )
+        self.transcripts.import_legacy(project_root / ".agent_sessions")
 
-        self.codex_js = Path(r"C:\Users\jimik\AppData\Roaming\npm\node_modules\@openai\codex\bin\codex.js")
-        if not self.codex_js.exists():
-            raise FileNotFoundError(f"codex.js not found: {self.codex_js}")
+        # Checked per run: a GUI whose agents all run on remote hosts does not need a local Codex install.
+        self.codex_js = Path(self.settings.codex_js)
 
     def start(self) -> None:
-        return
+        self.transcripts.compact_all()
+        self.monitor.start()
 
     def stop(self) -> None:
+        """并行停止所有 agent 的进程组，最多等待 stop_grace_sec 加少量余量。"""
         with self._proc_lock:
-            running_ids = list(self._active_procs.keys())
-        for agent_id in running_ids:
-            self.stop_agent(agent_id)
+            procs = [proc for by_pid in self._active_procs.values() for proc in by_pid.values()]
+            self._active_procs.clear()
+        futs = [self._stop_pool.submit(terminate_group, proc, self.settings.stop_grace_sec) for proc in procs]
+        wait(futs, timeout=self.settings.stop_grace_sec + 2)
+        self._stop_pool.shutdown(wait=False, cancel_futures=True)
+        self._run_pool.shutdown(wait=False, cancel_futures=True)
+        if self.hedge_budget is not None:
+            self._hedge_pool.shutdown(wait=False, cancel_futures=True)
+        if self.hosts is not None:
+            self._remote_pool.shutdown(wait=False, cancel_futures=True)
+        self._lines.close()
+        self.monitor.stop()
+        if self.context_packs is not None:
+            self.context_packs.close()
+
+    def prime_context(self, work_path: str, index: Optional[FileIndex] = None) -> None:
+        """工作路径确定后提前建立仓库概览的索引（可共用调用方已有的 index）；未启用 context_pack 时不做任何事。"""
+        if self.context_packs is not None:
+            self.context_packs.prime(work_path, index)
 
     def stop_agent(self, agent_id: str) -> bool:
+        """同步停止一个 agent 的全部 CLI 进程组（SIGTERM → 宽限 → SIGKILL），返回是否有进程在运行。
+
+        已排队尚未开始的运行不会再启动，直接返回 STOPPED 结果。
+        """
         with self._proc_lock:
-            proc = self._active_procs.get(agent_id)
-        if proc is None or proc.poll() is not None:
-            return False
-        try:
-            proc.terminate()
-            proc.wait(timeout=3)
-        except Exception:  # noqa: BLE001
+            self._stop_generation[agent_id] = self._stop_generation.get(agent_id, 0) + 1
+            procs = list(self._active_procs.pop(agent_id, {}).values())
+        futs = [self._stop_pool.submit(terminate_group, proc, self.settings.stop_grace_sec) for proc in procs]
+        stopped = any(fut.result() for fut in futs)
+        client = self.hosts.clients.get(self.hosts.placement(agent_id)) if self.hosts is not None else None
+        if client is not None:
             try:
-                proc.kill()
-            except Exception:  # noqa: BLE001
+                stopped = bool(client.request("stop", {"agent_id": agent_id}).get("stopped")) or stopped
+            except (HostUnavailable, RuntimeError):
                 pass
-        finally:
-            with self._proc_lock:
-                self._active_procs.pop(agent_id, None)
-        return True
+        return stopped
+
+    def stop_agent_async(self, agent_id: str, on_done: Optional[Callable[[str, bool], None]] = None) -> None:
+        """在后台线程停止 agent，完成后回调 on_done(agent_id, 是否停止了运行中的进程)；供 UI 线程调用。"""
+
+        def worker() -> None:
+            stopped = self.stop_agent(agent_id)
+            if on_done is not None:
+                on_done(agent_id, stopped)
+
+        Thread(target=worker, name=f"stop-{agent_id}", daemon=True).start()
+
+    def _untrack_proc(self, agent_id: str, proc: subprocess.Popen) -> Dict[str, float]:
+        with self._proc_lock:
+            procs = self._active_procs.get(agent_id)
+            if procs is not None:
+                procs.pop(proc.pid, None)
+                if not procs:
+                    self._active_procs.pop(agent_id, None)
+        return self.monitor.unwatch(proc.pid)
 
     def runtime_info(self) -> Dict[str, int]:
         return dict(self._last_pid)
 
+    def resource_stats(self) -> Dict[str, ResourceStats]:
+        """各 agent 的 CLI 进程树当前与峰值资源占用；未运行过的 agent 不在结果中。"""
+        out: Dict[str, ResourceStats] = {}
+        for agent in self.agents:
+            stats = self.monitor.stats(agent.agent_id)
+            if stats is not None:
+                out[agent.agent_id] = stats
+        return out
+
+    def usage_snapshot(self) -> Dict[str, Tuple[TokenUsage, TokenUsage]]:
+        """各 agent 当天与累计的 token 用量。"""
+        return self.usage.snapshot()
+
+    def agent_status(self, agent_id: str) -> AgentStatus:
+        with self._proc_lock:
+            running = bool(self._active_procs.get(agent_id)) or self._remote_active.get(agent_id, 0) > 0
+        return AgentStatus.RUNNING if running else AgentStatus.IDLE
+
+    def running_count(self) -> int:
+        """本机正在运行的 CLI 进程数（不含远程主机上的）。"""
+        with self._proc_lock:
+            return sum(len(procs) for procs in self._active_procs.values())
+
+    def sessions(self) -> Dict[str, str]:
+        return {agent_id: sid for agent_id, sid in self._sessions.items() if sid}
+
+    def adopt_session(self, agent_id: str, session_id: str) -> None:
+        """agent 主机收到的请求里带着客户端记录的会话；以客户端为准，空串表示开启新会话。"""
+        self._sessions[agent_id] = session_id.strip()
+
     def session_for(self, agent_id: str) -> str:
         sid = self._sessions.get(agent_id, "")
         return sid or f"{agent_id}-pending"
 
-    def _build_prompt(self, agent: AgentConfig, text: str, work_path: str) -> str:
+    def recent_turns(self, agent_id: str, limit: int = 20, before: Optional[int] = None) -> List[Tuple[int, TranscriptTurn]]:
+        """当前会话最近的对话记录（序号, 记录）；还没有会话时为空。"""
+        session_id = self._sessions.get(agent_id, "").strip()
+        if not session_id:
+            return []
+        return self.transcripts.read_recent(agent_id, session_id, limit, before)
+
+    def _record_turn(self, agent: AgentConfig, text: str, result: AgentResult, isolated: bool) -> None:
+        # Transcripts follow resumable sessions only: isolated runs are never resumed, and a first run
+        # that failed before Codex opened a thread has no session to file the turn under.
+        session_id = "" if isolated else self._sessions.get(agent.agent_id, "").strip()
+        if not session_id:
+            return
+        try:
+            self.transcripts.append(agent.agent_id, session_id, "user", text)
+            self.transcripts.append(agent.agent_id, session_id, "assistant", result.content, result.status.value)
+        except OSError:
+            pass
+
+    def _context_for(self, agent: AgentConfig, work_path: str, session_id: str) -> str:
+        # A resumed session already holds the pack from an earlier turn; resend only when it changed.
+        if self.context_packs is None:
+            return ""
+        pack = self.context_packs.build(work_path)
+        if not pack:
+            return ""
+        digest = hash((work_path, pack))
+        if session_id and self._pack_sent.get(agent.agent_id) == digest:
+            return ""
+        if session_id or not self._sessions.get(agent.agent_id):
+            self._pack_sent[agent.agent_id] = digest
+        return pack
+
+    def _build_prompt(self, agent: AgentConfig, text: str, work_path: str, context: str = "") -> str:
         role_prompt = agent.role_prompt.strip() or agent.role
+        overview = ""
+        if context:
+            overview = "工作区概览（自动生成，可能不完整，以实际文件为准）：\\n" + context.replace("\n", "\\n") + "\\n"
         return (
             f"你是 {agent.agent_id.upper()}，角色：{agent.role}。\\n"
             f"角色要求：{role_prompt}\\n"
             f"当前工作路径固定为：{work_path}\\n"
+            f"{overview}"
             "回答规则：\\n"
             "1) 直接回答，不要寒暄。\\n"
             "2) 如果被问到工作路径，必须原样输出上面的完整路径。\\n"
@@ -73,10 +245,38 @@ class AgentRuntimeManager:
             f"用户消息：{text}"
         )
 
+    def _answer_locally(
+        self,
+        agent: AgentConfig,
+        text: str,
+        work_path: str,
+        isolated: bool,
+        on_stream: Optional[Callable[[AgentLogEvent], None]],
+    ) -> Optional[AgentResult]:
+        session_id = "" if isolated else self._sessions.get(agent.agent_id, "").strip()
+        ctx = FastPathContext(
+            agent=agent,
+            work_path=work_path,
+            session_id=session_id,
+            pid=self._last_pid.get(agent.agent_id, -1),
+            status=self.agent_status(agent.agent_id).value,
+        )
+        answer = self.fast_path.resolve(text, ctx)
+        source = "本地快速应答"
+        if answer is None and self.response_cache is not None and not isolated:
+            answer = self.response_cache.get(ResponseCache.key(agent.agent_id, session_id, work_path, text))
+            source = "命中回复缓存"
+        if answer is None:
+            return None
+        if on_stream:
+            on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"{source}，未启动 CLI"))
+        return AgentResult(agent.agent_id, agent.role, AgentStatus.DONE, answer)
+
     def _is_path_question(self, text: str) -> bool:
         lower = text.lower()
         return "工作路径" in text or "路径" in text or "path" in lower or "cwd" in lower
 
+    @profiled
     def _stream_line(
         self,
         agent: AgentConfig,
@@ -84,14 +284,19 @@ class AgentRuntimeManager:
         on_stream: Optional[Callable[[AgentLogEvent], None]],
         last_message_holder: Dict[str, str],
         thread_holder: Dict[str, str],
+        summarize: bool = False,
+        usage: Optional[TokenUsage] = None,
     ) -> None:
+        # With a capture file on disk the live log only gets summaries; raw JSON stays in the capture.
         line = line.strip()
         if not line:
             return
-        if on_stream:
-            on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"CLI> {line}"))
+        is_json = line.startswith("{")
+        if on_stream and (not summarize or not is_json):
+            shown = line if not summarize or len(line) <= 300 else line[:300] + " …"
+            on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"CLI> {shown}"))
 
-        if not line.startswith("{"):
+        if not is_json:
             return
 
         try:
@@ -102,6 +307,16 @@ class AgentRuntimeManager:
         evt_type = evt.get("type")
         if evt_type == "thread.started":
             thread_holder["id"] = evt.get("thread_id", "")
+            if summarize and on_stream:
+                on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"会话> {thread_holder['id']}"))
+            return
+
+        if evt_type == "turn.completed":
+            turn = TokenUsage.from_event(evt.get("usage") or {})
+            if usage is not None:
+                usage.add(turn)
+            if summarize and on_stream:
+                on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"用量> {turn.describe()}"))
             return
 
         if evt_type != "item.completed":
@@ -119,7 +334,26 @@ class AgentRuntimeManager:
             msg = (item.get("message") or "").strip()
             if msg and on_stream:
                 on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.FAILED, f"CLI错误> {msg}"))
-
+        elif summarize and on_stream:
+            summary = self._summarize_item(item)
+            if summary:
+                on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"事件> {summary}"))
+
+    @staticmethod
+    def _summarize_item(item: Dict) -> str:
+        item_type = item.get("type") or ""
+        if item_type == "command_execution":
+            command = " ".join(str(item.get("command") or "").split())
+            command = command if len(command) <= 120 else command[:120] + " …"
+            return f"执行命令 {command}（退出码 {item.get('exit_code')}）"
+        if item_type == "file_change":
+            paths = [c.get("path", "") for c in item.get("changes") or [] if isinstance(c, dict)]
+            return f"修改文件 {', '.join(paths[:5])}" + (f" 等 {len(paths)} 个" if len(paths) > 5 else "")
+        if item_type == "reasoning":
+            return ""
+        return item_type
+
+    @profiled
     def _run_one(
         self,
         agent: AgentConfig,
@@ -127,18 +361,38 @@ class AgentRuntimeManager:
         work_path: str,
         timeout_sec: int,
         on_stream: Optional[Callable[[AgentLogEvent], None]],
+        isolated: bool = False,
+        deadline_scale: float = 1.0,
+        handle: Optional[RunHandle] = None,
+        read_only: bool = False,
+        generation: Optional[int] = None,
     ) -> AgentResult:
-        session_id = self._sessions.get(agent.agent_id, "").strip()
-        prompt = self._build_prompt(agent, text, work_path)
+        # isolated runs start a fresh Codex thread and never touch the agent's persisted session.
+        session_id = "" if isolated else self._sessions.get(agent.agent_id, "").strip()
+        prompt = self._build_prompt(agent, text, work_path, self._context_for(agent, work_path, session_id))
 
         base = ["node", str(self.codex_js), "exec"]
+        if read_only:
+            base += ["--sandbox", "read-only"]
         if session_id:
             cmd = base + ["resume", "--skip-git-repo-check", "--json", session_id, prompt]
         else:
             cmd = base + ["--skip-git-repo-check", "--json", prompt]
 
+        if not self.codex_js.exists():
+            return AgentResult(
+                agent.agent_id, agent.role, AgentStatus.FAILED, f"codex.js 不存在: {self.codex_js}（可在 runtime.codex_js 中配置）"
+            )
+
+        task_class = classify_task(text)
+        if self.latency is not None:
+            limits = self.latency.deadlines(agent.agent_id, task_class, timeout_sec, deadline_scale)
+        else:
+            idle = max(20, timeout_sec)
+            limits = Deadlines(idle, idle, max(60, timeout_sec * 4), "固定公式")
         if on_stream:
             on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"启动CLI: {' '.join(cmd[:4])} ..."))
+            on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"超时策略：{limits.describe()}"))
 
         try:
             p = subprocess.Popen(
@@ -150,44 +404,77 @@ class AgentRuntimeManager:
                 encoding="utf-8",
                 errors="replace",
                 bufsize=1,
+                **new_group_kwargs(),
             )
             self._last_pid[agent.agent_id] = p.pid
             with self._proc_lock:
-                self._active_procs[agent.agent_id] = p
+                # stop_agent may have run while the prompt / context pack was being built and found nothing to kill.
+                stopped = generation is not None and self._stop_generation.get(agent.agent_id, 0) != generation
+                if not stopped:
+                    self._active_procs.setdefault(agent.agent_id, {})[p.pid] = p
+            if stopped:
+                kill_group(p)
+                p.wait()
+                return self._stopped_result(agent, "启动期间 agent 已被停止，已结束刚启动的 CLI", on_stream)
+            self.monitor.watch(agent.agent_id, p.pid)
+            if handle is not None:
+                handle.attach(p)
         except Exception as exc:  # noqa: BLE001
             return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"外部 Codex CLI 启动失败: {exc}")
 
+        capture: Optional[CaptureWriter] = None
+        if self.captures is not None:
+            try:
+                capture = self.captures.open(agent.agent_id, p.pid, text)
+            except OSError:
+                capture = None
+
         last_message_holder = {"text": ""}
         thread_holder = {"id": ""}
+        usage = TokenUsage()
+
+        def finish(result: AgentResult) -> AgentResult:
+            # Failed and timed-out runs still spent whatever the finished turns reported.
+            if usage.turns:
+                result.metrics.update(usage.as_metrics())
+                self._record_usage(agent, thread_holder["id"] or ("isolated" if isolated else self.session_for(agent.agent_id)), usage, on_stream)
+            if capture is not None:
+                info = capture.close(p.returncode, result.status.value)
+                if on_stream:
+                    on_stream(
+                        AgentLogEvent(
+                            agent.agent_id,
+                            agent.role,
+                            result.status,
+                            f"原始输出已保存 {info.path.name}（{info.lines} 行，{info.raw_bytes} → {info.stored_bytes} 字节）",
+                        )
+                    )
+            return result
 
-        idle_timeout = max(20, timeout_sec)
-        total_timeout = max(60, timeout_sec * 4)
-        idle_deadline = time.time() + idle_timeout
-        total_deadline = time.time() + total_timeout
+        started = time.monotonic()
+        first_line_at: Optional[float] = None
+        last_line_at = started
+        max_gap = 0.0
 
         line_queue: "Queue[Optional[str]]" = Queue()
-
-        def _stdout_reader() -> None:
-            if not p.stdout:
-                line_queue.put(None)
-                return
-            try:
-                for raw in p.stdout:
-                    line_queue.put(raw)
-            finally:
-                line_queue.put(None)
-
-        reader = Thread(target=_stdout_reader, daemon=True)
-        reader.start()
+        self._lines.register(p.stdout, line_queue)
 
         while True:
-            now = time.time()
-            if now > total_deadline:
-                p.kill()
-                return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, "外部 Codex CLI 总耗时超时")
-            if now > idle_deadline:
-                p.kill()
-                return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, "外部 Codex CLI 空闲超时")
+            now = time.monotonic()
+            fired = ""
+            if now > started + limits.total_sec:
+                fired = f"总耗时超时（超过 {limits.total_sec:.0f}s）"
+            elif first_line_at is None and now > started + limits.first_line_sec:
+                fired = f"首行输出超时（{limits.first_line_sec:.0f}s 内无输出）"
+            elif first_line_at is not None and now > last_line_at + limits.idle_sec:
+                fired = f"空闲超时（{limits.idle_sec:.0f}s 内无新输出）"
+            if fired:
+                kill_group(p)
+                metrics = self._untrack_proc(agent.agent_id, p)
+                content = f"外部 Codex CLI {fired}；超时策略：{limits.reason}"
+                if on_stream:
+                    on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.FAILED, content))
+                return finish(AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, content, metrics))
 
             try:
                 line = line_queue.get(timeout=0.1)
@@ -202,30 +489,376 @@ class AgentRuntimeManager:
                 continue
 
             if line:
-                self._stream_line(agent, line, on_stream, last_message_holder, thread_holder)
-                idle_deadline = time.time() + idle_timeout
+                if capture is not None:
+                    capture.write(line)
+                self._stream_line(agent, line, on_stream, last_message_holder, thread_holder, capture is not None, usage)
+                now = time.monotonic()
+                if first_line_at is None:
+                    first_line_at = now
+                    if handle is not None:
+                        handle.first_output.set()
+                else:
+                    max_gap = max(max_gap, now - last_line_at)
+                last_line_at = now
                 continue
 
             if p.poll() is not None:
                 break
 
         return_code = p.returncode
-        with self._proc_lock:
-            self._active_procs.pop(agent.agent_id, None)
-        if thread_holder["id"] and not self._sessions.get(agent.agent_id, "").strip():
+        metrics = self._untrack_proc(agent.agent_id, p)
+        if not isolated and thread_holder["id"] and not self._sessions.get(agent.agent_id, "").strip():
             self._sessions[agent.agent_id] = thread_holder["id"]
 
         if return_code != 0:
-            return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"外部 Codex CLI 返回非零退出码: {return_code}")
+            return finish(
+                AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"外部 Codex CLI 返回非零退出码: {return_code}", metrics)
+            )
 
         final_msg = last_message_holder["text"].strip()
         if not final_msg:
-            return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, "未获取到 Codex 回复")
+            return finish(AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, "未获取到 Codex 回复", metrics))
 
         if self._is_path_question(text) and work_path not in final_msg:
             final_msg = f"当前工作路径是：{work_path}"
 
-        return AgentResult(agent.agent_id, agent.role, AgentStatus.DONE, final_msg)
+        if self.latency is not None:
+            # Only successful runs are recorded: a timed-out run says nothing about how long it needed.
+            first = (first_line_at or last_line_at) - started
+            self.latency.record(agent.agent_id, task_class, RunTiming(first, max_gap, time.monotonic() - started))
+        return finish(AgentResult(agent.agent_id, agent.role, AgentStatus.DONE, final_msg, metrics))
+
+    def _record_usage(
+        self, agent: AgentConfig, session_id: str, usage: TokenUsage, on_stream: Optional[Callable[[AgentLogEvent], None]]
+    ) -> None:
+        budget = self.usage.record(agent.agent_id, session_id, usage)
+        if not on_stream:
+            return
+        message = f"本次用量 {usage.describe()}；今日累计 {budget.used} tokens"
+        if budget.over_hard:
+            message += f"，已达硬预算 {budget.hard}，之后的请求将被拒绝"
+        elif budget.over_soft:
+            message += f"，已超过软预算 {budget.soft}"
+        on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, message))
+
+    def _over_budget(self, agent: AgentConfig, on_stream: Optional[Callable[[AgentLogEvent], None]]) -> Optional[AgentResult]:
+        """硬预算用尽时返回拒绝结果；超过软预算只提示，仍然运行。本地快速应答与缓存不消耗 token，不受限制。"""
+        budget = self.usage.check(agent.agent_id)
+        if budget.over_hard:
+            content = f"今日 token 用量 {budget.used} 已达硬预算 {budget.hard}（runtime.token_budget_hard），拒绝启动 CLI"
+            if on_stream:
+                on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.FAILED, content))
+            return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, content)
+        if budget.over_soft and on_stream:
+            on_stream(
+                AgentLogEvent(
+                    agent.agent_id, agent.role, AgentStatus.RUNNING, f"提醒：今日 token 用量 {budget.used} 已超过软预算 {budget.soft}"
+                )
+            )
+        return None
+
+    def _hedge_delay(self, agent: AgentConfig, text: str) -> float:
+        observed = None
+        if self.latency is not None:
+            observed = self.latency.first_line_percentile(agent.agent_id, classify_task(text), HEDGE_PERCENTILE)
+        return max(self.settings.hedge_min_delay_sec, DEFAULT_HEDGE_DELAY_SEC if observed is None else observed)
+
+    def _run_hedged(
+        self,
+        agent: AgentConfig,
+        text: str,
+        work_path: str,
+        timeout_sec: int,
+        on_stream: Optional[Callable[[AgentLogEvent], None]],
+        isolated: bool = False,
+        deadline_scale: float = 1.0,
+        hedge: bool = False,
+        generation: Optional[int] = None,
+    ) -> AgentResult:
+        """对冲运行：主运行在 p95 首行耗时内无输出时，另起一个独立会话的备份运行，先成功者胜出，另一个整组结束。
+
+        只有派发时显式要求（hedge=True）才对冲，且主运行与备份都以 Codex 只读沙箱启动：两者共用同一工作路径，
+        落败者会被强杀，不能让它留下写了一半的文件。
+        """
+        if self.hedge_budget is None or not hedge:
+            return self._run_one(agent, text, work_path, timeout_sec, on_stream, isolated, deadline_scale, generation=generation)
+
+        def log(message: str) -> None:
+            if on_stream:
+                on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, message))
+
+        self.hedge_budget.on_primary()
+        with self._hedge_lock:
+            self.hedge_stats.primary_runs += 1
+        started = time.monotonic()
+        primary = RunHandle()
+        fut_primary = self._hedge_pool.submit(
+            self._run_one, agent, text, work_path, timeout_sec, on_stream, isolated, deadline_scale, primary, True, generation
+        )
+        delay = self._hedge_delay(agent, text)
+        while not primary.first_output.is_set() and not fut_primary.done():
+            remaining = started + delay - time.monotonic()
+            if remaining <= 0:
+                break
+            primary.first_output.wait(min(remaining, 0.1))
+        if primary.first_output.is_set() or fut_primary.done():
+            return fut_primary.result()
+        if not self.hedge_budget.try_acquire():
+            with self._hedge_lock:
+                self.hedge_stats.hedges_denied += 1
+            log(f"主运行 {delay:.1f}s 内无输出，但对冲预算已用完，继续等待主运行")
+            return fut_primary.result()
+
+        with self._hedge_lock:
+            self.hedge_stats.hedges_launched += 1
+        log(f"主运行 {delay:.1f}s 内无输出，启动备份运行（独立会话，不写入主会话）")
+        backup = RunHandle()
+        # The backup is isolated so a resumed primary session is never written by two processes at once.
+        fut_backup = self._hedge_pool.submit(
+            self._run_one, agent, text, work_path, timeout_sec, on_stream, True, deadline_scale, backup, True, generation
+        )
+        pending: Dict[Future, RunHandle] = {fut_primary: primary, fut_backup: backup}
+        results: Dict[Future, AgentResult] = {}
+        winner: Optional[Future] = None
+        while pending and winner is None:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            for fut in done:
+                pending.pop(fut)
+                try:
+                    results[fut] = fut.result()
+                except Exception as exc:  # noqa: BLE001
+                    results[fut] = AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"调度异常: {exc}")
+                if winner is None and results[fut].status == AgentStatus.DONE:
+                    winner = fut
+        for handle in pending.values():
+            handle.cancel()
+        if winner is None:
+            return results[fut_primary]
+        with self._hedge_lock:
+            if winner is fut_backup:
+                self.hedge_stats.backup_wins += 1
+                self.hedge_stats.backup_win_sec += time.monotonic() - started
+            else:
+                self.hedge_stats.primary_wins += 1
+            summary = self.hedge_stats.summary()
+        log(f"{'备份' if winner is fut_backup else '主'}运行先完成，已结束另一运行。{summary}")
+        return results[winner]
+
+    def _submit_run(
+        self,
+        agent: AgentConfig,
+        text: str,
+        work_path: str,
+        timeout_sec: int,
+        on_stream: Optional[Callable[[AgentLogEvent], None]],
+        isolated: bool,
+        generation: int,
+        hedge: bool = False,
+    ) -> Future:
+        if self.hosts is not None and (agent.host or self.hosts.placement(agent.agent_id)):
+            return self._remote_pool.submit(self._run_placed, agent, text, work_path, timeout_sec, on_stream, isolated, generation, hedge)
+        return self._submit_local(agent, text, work_path, timeout_sec, on_stream, isolated, generation, hedge)
+
+    def _submit_in_session_order(
+        self,
+        agent: AgentConfig,
+        text: str,
+        work_path: str,
+        timeout_sec: int,
+        on_stream: Optional[Callable[[AgentLogEvent], None]],
+        isolated: bool,
+        hedge: bool = False,
+    ) -> Future:
+        """同一 agent 的非隔离运行按提交顺序逐个执行：GUI、Telegram 与控制 API 可能同时向一个 agent 发消息，
+        而同一个 Codex 会话不能被两个 resume 进程同时写入。等待期间不占用运行池的线程。"""
+        with self._proc_lock:
+            generation = self._stop_generation.get(agent.agent_id, 0)
+            if isolated:
+                previous = None
+            else:
+                previous = self._session_tail.get(agent.agent_id)
+                outer: Future = Future()
+                self._session_tail[agent.agent_id] = outer
+        if isolated:
+            return self._submit_run(agent, text, work_path, timeout_sec, on_stream, isolated, generation, hedge)
+
+        def relay(inner: Future) -> None:
+            if inner.cancelled():
+                outer.set_result(AgentResult(agent.agent_id, agent.role, AgentStatus.STOPPED, "运行已取消"))
+            elif inner.exception() is not None:
+                outer.set_exception(inner.exception())
+            else:
+                outer.set_result(inner.result())
+
+        def start(_previous: Optional[Future] = None) -> None:
+            try:
+                inner = self._submit_run(agent, text, work_path, timeout_sec, on_stream, isolated, generation, hedge)
+            except RuntimeError as exc:
+                # The pools were shut down while this turn was waiting.
+                outer.set_result(AgentResult(agent.agent_id, agent.role, AgentStatus.STOPPED, f"运行时已停止: {exc}"))
+                return
+            inner.add_done_callback(relay)
+
+        def release(_outer: Future) -> None:
+            with self._proc_lock:
+                if self._session_tail.get(agent.agent_id) is outer:
+                    del self._session_tail[agent.agent_id]
+
+        outer.add_done_callback(release)
+        if previous is None or previous.done():
+            start()
+        else:
+            if on_stream:
+                on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, "等待该 agent 上一轮对话结束（同一会话不并发续聊）"))
+            previous.add_done_callback(start)
+        return outer
+
+    def _submit_local(
+        self,
+        agent: AgentConfig,
+        text: str,
+        work_path: str,
+        timeout_sec: int,
+        on_stream: Optional[Callable[[AgentLogEvent], None]],
+        isolated: bool,
+        generation: int,
+        hedge: bool = False,
+    ) -> Future:
+        with self._queue_lock:
+            self._queued_runs += 1
+            waiting = self._queued_runs - self.max_parallel_runs
+        if waiting > 0 and on_stream:
+            on_stream(
+                AgentLogEvent(
+                    agent.agent_id, agent.role, AgentStatus.RUNNING, f"排队等待执行（并发上限 {self.max_parallel_runs}，前面还有 {waiting} 个）"
+                )
+            )
+        return self._run_pool.submit(self._run_with_retry, agent, text, work_path, timeout_sec, on_stream, isolated, generation, hedge)
+
+    def _skip_if_stopped(
+        self,
+        agent: AgentConfig,
+        generation: int,
+        on_stream: Optional[Callable[[AgentLogEvent], None]],
+        content: str = "排队期间 agent 已被停止，未启动 CLI",
+    ) -> Optional[AgentResult]:
+        with self._proc_lock:
+            if self._stop_generation.get(agent.agent_id, 0) == generation:
+                return None
+        return self._stopped_result(agent, content, on_stream)
+
+    @staticmethod
+    def _stopped_result(agent: AgentConfig, content: str, on_stream: Optional[Callable[[AgentLogEvent], None]]) -> AgentResult:
+        if on_stream:
+            on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.STOPPED, content))
+        return AgentResult(agent.agent_id, agent.role, AgentStatus.STOPPED, content)
+
+    def _move_session(self, agent: AgentConfig, target: str, on_stream: Optional[Callable[[AgentLogEvent], None]]) -> None:
+        # Codex sessions live on the machine that created them; a moved agent starts a new one.
+        previous = self.hosts.placement(agent.agent_id)
+        if previous == target:
+            return
+        if self._sessions.get(agent.agent_id):
+            self._sessions[agent.agent_id] = ""
+            self._pack_sent.pop(agent.agent_id, None)
+            if on_stream:
+                where = f"主机 {target}" if target else "本机"
+                on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"运行位置改为{where}，原会话留在原处，开启新会话"))
+        self.hosts.set_placement(agent.agent_id, target)
+
+    def _run_placed(
+        self,
+        agent: AgentConfig,
+        text: str,
+        work_path: str,
+        timeout_sec: int,
+        on_stream: Optional[Callable[[AgentLogEvent], None]],
+        isolated: bool,
+        generation: int,
+        hedge: bool = False,
+    ) -> AgentResult:
+        """远程放置：固定主机或负载最低的主机；连接失败（请求未送达）时换下一台，auto 全部不可用时回落到本机。"""
+        skipped = self._skip_if_stopped(agent, generation, on_stream)
+        if skipped is not None:
+            return skipped
+        tried: set = set()
+        while True:
+            name = self.hosts.acquire(agent, tried) if agent.host else None
+            if name is None:
+                if agent.host not in ("", "auto"):
+                    error = self.hosts.states[agent.host].last_error or "主机不可用"
+                    return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"主机 {agent.host} 不可用: {error}")
+                if agent.host and on_stream:
+                    on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, "没有可用的远程主机，改在本机运行"))
+                if not isolated:
+                    self._move_session(agent, "", on_stream)
+                # Local runs still go through the bounded local pool.
+                return self._submit_local(agent, text, work_path, timeout_sec, on_stream, isolated, generation, hedge).result()
+            if not isolated:
+                self._move_session(agent, name, on_stream)
+            session_id = "" if isolated else self._sessions.get(agent.agent_id, "").strip()
+            with self._proc_lock:
+                self._remote_active[agent.agent_id] = self._remote_active.get(agent.agent_id, 0) + 1
+            try:
+                reply = run_remote(self.hosts.clients[name], agent, session_id, text, work_path, timeout_sec, on_stream, isolated)
+            except HostUnavailable as exc:
+                self.hosts.mark_down(name, str(exc))
+                if exc.request_sent:
+                    return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, str(exc))
+                tried.add(name)
+                continue
+            except RuntimeError as exc:
+                return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, str(exc))
+            finally:
+                self.hosts.release(name)
+                with self._proc_lock:
+                    self._remote_active[agent.agent_id] -= 1
+            if not isolated and reply["session_id"]:
+                self._sessions[agent.agent_id] = reply["session_id"]
+            self._last_pid[agent.agent_id] = reply["pid"]
+            remote_usage = TokenUsage.from_metrics(reply["result"].metrics)
+            if remote_usage is not None:
+                self._record_usage(agent, reply["session_id"] or f"{name}-isolated", remote_usage, on_stream)
+            return reply["result"]
+
+    def _run_with_retry(
+        self,
+        agent: AgentConfig,
+        text: str,
+        work_path: str,
+        timeout_sec: int,
+        on_stream: Optional[Callable[[AgentLogEvent], None]],
+        isolated: bool,
+        generation: int,
+        hedge: bool = False,
+    ) -> AgentResult:
+        # The timeout retry runs in the same worker so one slow agent never holds up the others' results.
+        try:
+            skipped = self._skip_if_stopped(agent, generation, on_stream)
+            if skipped is not None:
+                return skipped
+            result = self._run_hedged(agent, text, work_path, timeout_sec, on_stream, isolated, hedge=hedge, generation=generation)
+            if result.status == AgentStatus.FAILED and "超时" in result.content:
+                skipped = self._skip_if_stopped(agent, generation, on_stream, "agent 已被停止，不再重试")
+                if skipped is not None:
+                    return skipped
+                retry_timeout = max(timeout_sec * 2, 120)
+                if on_stream:
+                    on_stream(
+                        AgentLogEvent(
+                            agent_id=agent.agent_id,
+                            role=agent.role,
+                            status=AgentStatus.RUNNING,
+                            message=f"检测到超时，自动重试一次（timeout={retry_timeout}s）",
+                        )
+                    )
+                result = self._run_hedged(
+                    agent, text, work_path, retry_timeout, on_stream, isolated, deadline_scale=2.0, hedge=hedge, generation=generation
+                )
+            return result
+        finally:
+            with self._queue_lock:
+                self._queued_runs -= 1
 
     def dispatch(
         self,
@@ -234,40 +867,47 @@ class AgentRuntimeManager:
         work_path: str,
         timeout_sec: int = 60,
         on_stream: Optional[Callable[[AgentLogEvent], None]] = None,
+        isolated: bool = False,
+        hedge: bool = False,
     ) -> List[AgentResult]:
+        """hedge=True 表示调用方确认这是只读提问：允许对冲，且以只读沙箱运行（需同时开启 runtime.hedge）。"""
         work = Path(work_path)
         if not work.exists():
             work = self.project_root
         work_path_str = str(work)
 
         results: List[Tuple[int, AgentResult]] = []
-        with ThreadPoolExecutor(max_workers=max(1, len(targets))) as pool:
-            futs = {
-                pool.submit(self._run_one, agent, text, work_path_str, timeout_sec, on_stream): idx
-                for idx, agent in enumerate(targets)
-            }
-            for fut in as_completed(futs):
-                idx = futs[fut]
-                try:
-                    result = fut.result()
-                except Exception as exc:  # noqa: BLE001
-                    agent = targets[idx]
-                    result = AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"调度异常: {exc}")
-
-                if result.status == AgentStatus.FAILED and "超时" in result.content:
-                    agent = targets[idx]
-                    retry_timeout = max(timeout_sec * 2, 120)
-                    if on_stream:
-                        on_stream(
-                            AgentLogEvent(
-                                agent_id=agent.agent_id,
-                                role=agent.role,
-                                status=AgentStatus.RUNNING,
-                                message=f"检测到超时，自动重试一次（timeout={retry_timeout}s）",
-                            )
-                        )
-                    result = self._run_one(agent, text, work_path_str, retry_timeout, on_stream)
-                results.append((idx, result))
+        remote: List[Tuple[int, AgentConfig]] = []
+        cache_keys: Dict[int, CacheKey] = {}
+        for idx, agent in enumerate(targets):
+            local = self._answer_locally(agent, text, work_path_str, isolated, on_stream)
+            if local is not None:
+                results.append((idx, local))
+                continue
+            refused = self._over_budget(agent, on_stream)
+            if refused is not None:
+                results.append((idx, refused))
+                continue
+            if self.response_cache is not None and not isolated:
+                session_id = self._sessions.get(agent.agent_id, "").strip()
+                cache_keys[idx] = ResponseCache.key(agent.agent_id, session_id, work_path_str, text)
+            remote.append((idx, agent))
+
+        futs = {
+            self._submit_in_session_order(agent, text, work_path_str, timeout_sec, on_stream, isolated, hedge): idx for idx, agent in remote
+        }
+        for fut in as_completed(futs):
+            idx = futs[fut]
+            try:
+                result = fut.result()
+            except Exception as exc:  # noqa: BLE001
+                agent = targets[idx]
+                result = AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"调度异常: {exc}")
+            if self.response_cache is not None and idx in cache_keys and result.status == AgentStatus.DONE:
+                self.response_cache.put(cache_keys[idx], result.content)
+            results.append((idx, result))
 
         results.sort(key=lambda x: x[0])
+        for idx, result in results:
+            self._record_turn(targets[idx], text, result, isolated)
         return [r for _, r in results]
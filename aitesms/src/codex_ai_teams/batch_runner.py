@@ -0,0 +1,223 @@
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from threading import Event, Lock
+from typing import Callable, Dict, List, Optional, Set
+
+from .agent_runtime import AgentRuntimeManager
+from .models import AgentConfig, AgentLogEvent, AgentResult, AgentStatus
+
+
+@dataclass
+class BatchTask:
+    task_id: str
+    agent_id: str
+    prompt: str
+    work_path: str = ""
+
+
+@dataclass
+class BatchTaskResult:
+    task_id: str
+    agent_id: str
+    status: str
+    content: str
+    started_at: str
+    latency_sec: float
+    metrics: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class BatchReport:
+    total: int
+    skipped: int
+    done: int = 0
+    failed: int = 0
+    elapsed_sec: float = 0.0
+    latencies: List[float] = field(default_factory=list)
+
+    @property
+    def executed(self) -> int:
+        return self.done + self.failed
+
+    @property
+    def throughput_per_hour(self) -> float:
+        if self.elapsed_sec <= 0:
+            return 0.0
+        return self.executed * 3600.0 / self.elapsed_sec
+
+    def latency_percentile(self, pct: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+        return ordered[idx]
+
+    def summary_lines(self) -> List[str]:
+        return [
+            f"任务总数: {self.total}，跳过(已完成): {self.skipped}，本次执行: {self.executed}",
+            f"成功: {self.done}，失败: {self.failed}，耗时: {self.elapsed_sec:.1f}s",
+            f"吞吐量: {self.throughput_per_hour:.1f} tasks/hour",
+            (
+                "单任务耗时: "
+                f"p50={self.latency_percentile(50):.1f}s "
+                f"p95={self.latency_percentile(95):.1f}s "
+                f"max={max(self.latencies, default=0.0):.1f}s"
+            ),
+        ]
+
+
+def load_tasks(path: Path, default_agent: str = "") -> List[BatchTask]:
+    """读取 JSONL 或 CSV 任务文件；字段：id / agent / prompt / work_path。"""
+    if path.suffix.lower() == ".csv":
+        with path.open("r", newline="", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        rows = []
+        for line in path.read_text(encoding="utf-8-sig").splitlines():
+            line = line.strip()
+            if line:
+                rows.append(json.loads(line))
+
+    tasks: List[BatchTask] = []
+    seen: Set[str] = set()
+    for idx, row in enumerate(rows, start=1):
+        prompt = str(row.get("prompt") or row.get("text") or "").strip()
+        if not prompt:
+            continue
+        # Fall back to the row number so ids stay stable between resumed runs of the same file.
+        task_id = str(row.get("id") or row.get("task_id") or f"line-{idx}").strip()
+        if task_id in seen:
+            raise ValueError(f"重复的任务 id: {task_id}")
+        seen.add(task_id)
+        agent_id = str(row.get("agent") or row.get("agent_id") or default_agent).strip()
+        if not agent_id:
+            raise ValueError(f"任务 {task_id} 未指定 agent")
+        tasks.append(BatchTask(task_id, agent_id, prompt, str(row.get("work_path") or "").strip()))
+    return tasks
+
+
+def load_checkpoint(path: Path) -> Set[str]:
+    if not path.exists():
+        return set()
+    return {line.strip() for line in path.read_text(encoding="utf-8").splitlines() if line.strip()}
+
+
+class BatchRunner:
+    """批量任务执行器：基于 AgentRuntimeManager.dispatch 并发派发，完成一条记录一条。"""
+
+    def __init__(
+        self,
+        runtime: AgentRuntimeManager,
+        agents: List[AgentConfig],
+        concurrency: int = 4,
+        timeout_sec: int = 60,
+        isolated: bool = True,
+    ) -> None:
+        self.runtime = runtime
+        self.agents: Dict[str, AgentConfig] = {a.agent_id: a for a in agents}
+        self.concurrency = max(1, concurrency)
+        self.timeout_sec = timeout_sec
+        self.isolated = isolated
+        self._stop = Event()
+        self._write_lock = Lock()
+        # Tasks resuming an agent's shared session must not interleave on that session.
+        self._agent_locks: Dict[str, Lock] = {agent_id: Lock() for agent_id in self.agents}
+
+    def request_stop(self) -> None:
+        self._stop.set()
+
+    def run(
+        self,
+        tasks: List[BatchTask],
+        results_path: Path,
+        work_path: str,
+        checkpoint_path: Optional[Path] = None,
+        on_stream: Optional[Callable[[AgentLogEvent], None]] = None,
+        on_task_done: Optional[Callable[[BatchTaskResult], None]] = None,
+    ) -> BatchReport:
+        checkpoint_path = checkpoint_path or results_path.with_suffix(results_path.suffix + ".done")
+        completed = load_checkpoint(checkpoint_path)
+        pending = [t for t in tasks if t.task_id not in completed]
+        unknown = sorted({t.agent_id for t in pending if t.agent_id not in self.agents})
+        if unknown:
+            raise ValueError(f"未知的 agent: {', '.join(unknown)}")
+
+        report = BatchReport(total=len(tasks), skipped=len(tasks) - len(pending))
+        results_path.parent.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+        with results_path.open("a", encoding="utf-8") as results_file, checkpoint_path.open(
+            "a", encoding="utf-8"
+        ) as checkpoint_file, ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futs = {pool.submit(self._run_task, task, work_path, on_stream): task for task in pending}
+            for fut in as_completed(futs):
+                task_result = fut.result()
+                if task_result is None:
+                    continue
+                with self._write_lock:
+                    results_file.write(json.dumps(asdict(task_result), ensure_ascii=False) + "\n")
+                    results_file.flush()
+                    # Only successful tasks are checkpointed; failed ones are retried on the next resume.
+                    if task_result.status == AgentStatus.DONE.value:
+                        checkpoint_file.write(task_result.task_id + "\n")
+                        checkpoint_file.flush()
+                        report.done += 1
+                    else:
+                        report.failed += 1
+                    report.latencies.append(task_result.latency_sec)
+                if on_task_done:
+                    on_task_done(task_result)
+        report.elapsed_sec = time.perf_counter() - started
+        return report
+
+    def _run_task(
+        self,
+        task: BatchTask,
+        work_path: str,
+        on_stream: Optional[Callable[[AgentLogEvent], None]],
+    ) -> Optional[BatchTaskResult]:
+        if self._stop.is_set():
+            return None
+        agent = self.agents[task.agent_id]
+        started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        t0 = time.perf_counter()
+        if self.isolated:
+            result = self._dispatch(agent, task, work_path, on_stream)
+        else:
+            with self._agent_locks[agent.agent_id]:
+                if self._stop.is_set():
+                    return None
+                result = self._dispatch(agent, task, work_path, on_stream)
+        return BatchTaskResult(
+            task_id=task.task_id,
+            agent_id=agent.agent_id,
+            status=result.status.value,
+            content=result.content,
+            started_at=started_at,
+            latency_sec=round(time.perf_counter() - t0, 3),
+            metrics=dict(result.metrics),
+        )
+
+    def _dispatch(
+        self,
+        agent: AgentConfig,
+        task: BatchTask,
+        work_path: str,
+        on_stream: Optional[Callable[[AgentLogEvent], None]],
+    ) -> AgentResult:
+        try:
+            results = self.runtime.dispatch(
+                targets=[agent],
+                text=task.prompt,
+                work_path=task.work_path or work_path,
+                timeout_sec=self.timeout_sec,
+                on_stream=on_stream,
+                isolated=self.isolated,
+            )
+        except Exception as exc:  # noqa: BLE001
+            return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"调度异常: {exc}")
+        return results[0]
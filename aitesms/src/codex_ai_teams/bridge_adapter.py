@@ -1,35 +1,242 @@
-﻿import time
-from pathlib import Path
+﻿import http.client
+import json
+import socket
+import time
+from queue import Empty, LifoQueue
+from threading import Lock
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import quote, urlsplit
 
 from .models import AgentConfig, AgentResult, AgentStatus
 
+# execute is not idempotent: only statuses saying the run was not started are retried.
+RETRYABLE_STATUS = {429, 503}
+
+
+class BridgeError(RuntimeError):
+    def __init__(self, message: str, retryable: bool = True) -> None:
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class _StaleConnection(Exception):
+    pass
+
+
+class _ConnectionPool:
+    """按 host 复用的 keep-alive 连接池；连接用完放回，异常连接直接丢弃。"""
+
+    def __init__(self, scheme: str, host: str, port: Optional[int], timeout_sec: float, max_size: int) -> None:
+        self._conn_cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        self._host = host
+        self._port = port
+        self._timeout_sec = timeout_sec
+        self._idle: "LifoQueue[http.client.HTTPConnection]" = LifoQueue(maxsize=max(1, max_size))
+        self._lock = Lock()
+        self._closed = False
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        try:
+            return self._idle.get_nowait(), True
+        except Empty:
+            return self.new_connection(), False
+
+    def new_connection(self) -> http.client.HTTPConnection:
+        return self._conn_cls(self._host, self._port, timeout=self._timeout_sec)
+
+    def release(self, conn: http.client.HTTPConnection, reusable: bool) -> None:
+        with self._lock:
+            closed = self._closed
+        if not reusable or closed:
+            conn.close()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except Exception:  # noqa: BLE001
+            conn.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                return
+
 
 class BridgeAdapter:
-    """Bridge 适配器占位实现：后续替换为真实 telegram bridge 请求。"""
+    """Bridge HTTP 客户端：keep-alive 连接池、超时与退避重试、NDJSON 流式响应。
+
+    只在请求确定未送达（连接失败、复用的空闲连接已被服务端关闭）或服务端返回 429/503 时重试；
+    请求发出后的读超时、断连以及已开始输出的流式响应都不重试，避免同一任务在 bridge 上执行两次。
+
+    请求：POST {bridge_url}/v1/agents/{agent_id}/execute，JSON 请求体见 _payload。
+    响应：application/json -> {"status", "content"}；
+          application/x-ndjson -> 逐行 {"type": "delta", "text"}，最后一行 {"type": "result", "status", "content"}。
+    """
 
-    def __init__(self, bridge_url: str, timeout_sec: int, retry: int) -> None:
-        self.bridge_url = bridge_url
+    def __init__(
+        self,
+        bridge_url: str,
+        timeout_sec: int,
+        retry: int,
+        pool_size: int = 4,
+        backoff_sec: float = 0.5,
+    ) -> None:
+        self.bridge_url = bridge_url.rstrip("/")
         self.timeout_sec = timeout_sec
-        self.retry = retry
-        self._role_cn_map = {
-            "pm": "项目经理",
-            "fe": "前端工程师",
-            "be": "后端工程师",
-            "qa": "测试工程师",
+        self.retry = max(0, retry)
+        self.backoff_sec = backoff_sec
+        parts = urlsplit(self.bridge_url)
+        if parts.scheme not in {"http", "https"} or not parts.hostname:
+            raise ValueError(f"无效的 bridge_url: {bridge_url}")
+        self._base_path = parts.path.rstrip("/")
+        # One warm connection per agent lets the whole team hit the bridge concurrently.
+        self._pool = _ConnectionPool(parts.scheme, parts.hostname, parts.port, float(timeout_sec), pool_size)
+
+    def close(self) -> None:
+        self._pool.close()
+
+    def execute(
+        self,
+        agent: AgentConfig,
+        task_text: str,
+        on_chunk: Optional[Callable[[str], None]] = None,
+    ) -> AgentResult:
+        path = f"{self._base_path}/v1/agents/{quote(agent.agent_id, safe='')}/execute"
+        body = json.dumps(self._payload(agent, task_text, stream=on_chunk is not None), ensure_ascii=False).encode("utf-8")
+        last_error = ""
+        for attempt in range(self.retry + 1):
+            if attempt:
+                time.sleep(self.backoff_sec * (2 ** (attempt - 1)))
+            try:
+                return self._request(agent, path, body, on_chunk)
+            except BridgeError as exc:
+                last_error = str(exc)
+                if not exc.retryable:
+                    break
+        return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"Bridge 请求失败: {last_error}")
+
+    def _payload(self, agent: AgentConfig, task_text: str, stream: bool) -> Dict[str, object]:
+        return {
+            "agent_id": agent.agent_id,
+            "role": agent.role,
+            "role_prompt": agent.role_prompt,
+            "temperature": agent.temperature,
+            "session_id": agent.session_id,
+            "codex_params": agent.codex_params,
+            "extra_params": agent.extra_params,
+            "text": task_text,
+            "stream": stream,
         }
 
-    def execute(self, agent: AgentConfig, task_text: str) -> AgentResult:
-        time.sleep(0.6)
-        role_cn = self._role_cn_map.get(agent.agent_id, agent.role)
-        lower_text = task_text.lower()
-        if "工作路径" in task_text or "work path" in lower_text or "cwd" in lower_text:
-            content = (
-                f"我是 {agent.agent_id.upper()} {role_cn}，当前工作路径是：{Path.cwd()}\n"
-                "如果你希望我切换路径，请在‘文件’页面选择新的工作路径。"
-            )
-        else:
-            content = (
-                f"我是 {agent.agent_id.upper()} {role_cn}，已收到你的消息：{task_text}\n"
-                f"我将按角色 Prompt 执行。temperature={agent.temperature}，session_id={agent.session_id or '-'}"
-            )
-        return AgentResult(agent_id=agent.agent_id, role=agent.role, status=AgentStatus.DONE, content=content)
+    def _request(
+        self,
+        agent: AgentConfig,
+        path: str,
+        body: bytes,
+        on_chunk: Optional[Callable[[str], None]],
+    ) -> AgentResult:
+        conn, reused = self._pool.acquire()
+        try:
+            return self._send(conn, agent, path, body, on_chunk, reused)
+        except _StaleConnection:
+            pass
+        # The server dropped an idle keep-alive connection without answering; replay once on a fresh one.
+        return self._send(self._pool.new_connection(), agent, path, body, on_chunk, False)
+
+    def _send(
+        self,
+        conn: http.client.HTTPConnection,
+        agent: AgentConfig,
+        path: str,
+        body: bytes,
+        on_chunk: Optional[Callable[[str], None]],
+        reused: bool,
+    ) -> AgentResult:
+        reusable = False
+        try:
+            if conn.sock is None:
+                try:
+                    conn.connect()
+                except OSError as exc:
+                    # Nothing has been sent yet, so this attempt can be retried safely.
+                    raise BridgeError(f"连接失败: {type(exc).__name__}: {exc}") from exc
+            try:
+                conn.request(
+                    "POST",
+                    path,
+                    body=body,
+                    headers={
+                        "Content-Type": "application/json; charset=utf-8",
+                        "Accept": "application/x-ndjson" if on_chunk else "application/json",
+                        "Connection": "keep-alive",
+                    },
+                )
+                resp = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as exc:
+                if reused:
+                    raise _StaleConnection() from exc
+                raise
+            if resp.status >= 400:
+                detail = resp.read().decode("utf-8", errors="replace")[:200]
+                reusable = not resp.will_close
+                raise BridgeError(f"HTTP {resp.status}: {detail}", retryable=resp.status in RETRYABLE_STATUS)
+
+            content_type = resp.getheader("Content-Type", "")
+            if "ndjson" in content_type:
+                result = self._read_stream(agent, resp, on_chunk)
+            else:
+                result = self._to_result(agent, self._decode(resp.read()))
+            reusable = not resp.will_close
+            return result
+        except socket.timeout as exc:
+            raise BridgeError(f"请求超时（{self.timeout_sec}s），请求可能已在执行，不重试", retryable=False) from exc
+        except (OSError, http.client.HTTPException) as exc:
+            raise BridgeError(f"{type(exc).__name__}: {exc}（请求可能已送达，不重试）", retryable=False) from exc
+        finally:
+            self._pool.release(conn, reusable)
+
+    def _read_stream(
+        self,
+        agent: AgentConfig,
+        resp: http.client.HTTPResponse,
+        on_chunk: Optional[Callable[[str], None]],
+    ) -> AgentResult:
+        deltas = []
+        final: Optional[Dict[str, object]] = None
+        while True:
+            raw = resp.readline()
+            if not raw:
+                break
+            line = raw.strip()
+            if not line:
+                continue
+            evt = self._decode(line)
+            if evt.get("type") == "delta":
+                text = str(evt.get("text", ""))
+                deltas.append(text)
+                if on_chunk and text:
+                    on_chunk(text)
+            elif evt.get("type") == "result":
+                final = evt
+        if final is None:
+            raise BridgeError("流式响应未返回 result 事件", retryable=False)
+        if not final.get("content") and deltas:
+            final["content"] = "".join(deltas)
+        return self._to_result(agent, final)
+
+    def _decode(self, raw: bytes) -> Dict[str, object]:
+        try:
+            data = json.loads(raw.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise BridgeError(f"响应不是合法 JSON: {exc}", retryable=False) from exc
+        if not isinstance(data, dict):
+            raise BridgeError("响应 JSON 不是对象", retryable=False)
+        return data
+
+    def _to_result(self, agent: AgentConfig, data: Dict[str, object]) -> AgentResult:
+        status_raw = str(data.get("status", AgentStatus.DONE.value)).upper()
+        status = AgentStatus.DONE if status_raw == AgentStatus.DONE.value else AgentStatus.FAILED
+        return AgentResult(agent.agent_id, agent.role, status, str(data.get("content", "")).strip())
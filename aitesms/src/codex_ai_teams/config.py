@@ -1,6 +1,7 @@
-﻿from dataclasses import dataclass
+﻿import re
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Set
 
 import yaml
 
@@ -15,6 +16,9 @@ class BridgeSettings:
     retry: int
     telegram_token: str = ""
     telegram_chat_id: str = ""
+    telegram_api_url: str = "https://api.telegram.org"
+    # Besides results, which log lines are mirrored to the chat: "none", "error" or "all".
+    telegram_log_level: str = "error"
 
 
 @dataclass
@@ -23,14 +27,77 @@ class AppSettings:
     max_agents: int
 
 
+@dataclass
+class HostSettings:
+    name: str
+    address: str
+    token: str = ""
+    max_runs: int = 4
+
+
+@dataclass
+class ApiSettings:
+    enabled: bool = False
+    # Loopback only by default; listening elsewhere should come with a token.
+    bind: str = "127.0.0.1"
+    port: int = 8766
+    token: str = ""
+    client_buffer: int = 1000
+
+
+DEFAULT_CODEX_JS = r"C:\Users\jimik\AppData\Roaming\npm\node_modules\@openai\codex\bin\codex.js"
+
+
+@dataclass
+class RuntimeSettings:
+    response_cache: bool = False
+    response_cache_ttl_sec: int = 600
+    response_cache_size: int = 256
+    monitor_interval_sec: float = 1.0
+    stop_grace_sec: float = 3.0
+    context_pack: bool = False
+    context_pack_max_chars: int = 4000
+    adaptive_timeout: bool = True
+    timeout_margin: float = 2.0
+    timeout_min_sec: float = 15.0
+    timeout_max_sec: float = 1800.0
+    # Enables the budget only: a dispatch must still ask for hedge=True, and hedged runs use Codex's
+    # read-only sandbox because the backup shares the primary's work_path and the loser is killed.
+    hedge: bool = False
+    hedge_budget_ratio: float = 0.1
+    hedge_min_delay_sec: float = 2.0
+    stream_capture: bool = True
+    capture_keep_per_agent: int = 200
+    max_parallel_runs: int = 8
+    codex_js: str = DEFAULT_CODEX_JS
+    # Host the runtime in a child process so CLI output parsing never competes with the GUI thread.
+    worker_process: bool = False
+    # Daily tokens per agent (input + output); 0 disables the check.
+    token_budget_soft: int = 0
+    token_budget_hard: int = 0
+
+
+@dataclass
+class WorkflowStage:
+    stage_id: str
+    agent_id: str
+    depends_on: List[str] = field(default_factory=list)
+    prompt: str = ""
+
+
 @dataclass
 class Settings:
     app: AppSettings
     bridge: BridgeSettings
     agents: List[AgentConfig]
+    workflow: List[WorkflowStage] = field(default_factory=list)
+    runtime: RuntimeSettings = field(default_factory=RuntimeSettings)
+    hosts: List[HostSettings] = field(default_factory=list)
+    api: ApiSettings = field(default_factory=ApiSettings)
 
 
 DEFAULT_AGENT_ORDER = ["pm", "fe", "be", "qa"]
+_AGENT_ID = re.compile(r"^[A-Za-z0-9_-]+$")
 DEFAULT_AGENT_SPECS = {
     "pm": {
         "role": "PM Agent",
@@ -50,6 +117,66 @@ DEFAULT_AGENT_SPECS = {
     },
 }
 
+# {task} is the user's message, {inputs} the outputs of the stages a stage depends on.
+DEFAULT_WORKFLOW = [
+    {"id": "plan", "agent": "pm", "depends_on": [], "prompt": "{task}\n\n请拆解任务，分别给出前端、后端、测试的执行要点。"},
+    {"id": "frontend", "agent": "fe", "depends_on": ["plan"], "prompt": "{task}\n\n项目经理的计划：\n{inputs}\n\n请完成前端部分。"},
+    {"id": "backend", "agent": "be", "depends_on": ["plan"], "prompt": "{task}\n\n项目经理的计划：\n{inputs}\n\n请完成后端部分。"},
+    {"id": "verify", "agent": "qa", "depends_on": ["frontend", "backend"], "prompt": "{task}\n\n前后端的实现结果：\n{inputs}\n\n请给出测试验证结论。"},
+]
+
+
+def load_workflow(items: List[Dict[str, object]], agent_ids: Set[str]) -> List[WorkflowStage]:
+    stages: List[WorkflowStage] = []
+    for item in items:
+        depends = item.get("depends_on") or []
+        if isinstance(depends, str):
+            depends = [depends]
+        stages.append(
+            WorkflowStage(
+                stage_id=str(item.get("id", "")).strip(),
+                agent_id=str(item.get("agent", "")).strip(),
+                depends_on=[str(dep).strip() for dep in depends if str(dep).strip()],
+                prompt=str(item.get("prompt", "")),
+            )
+        )
+
+    stage_ids = [stage.stage_id for stage in stages]
+    if "" in stage_ids or len(set(stage_ids)) != len(stage_ids):
+        raise ValueError("workflow 阶段 id 不能为空且不能重复")
+    for stage in stages:
+        if stage.agent_id not in agent_ids:
+            raise ValueError(f"workflow 阶段 {stage.stage_id} 引用了未知 agent: {stage.agent_id}")
+        missing = [dep for dep in stage.depends_on if dep not in stage_ids]
+        if missing:
+            raise ValueError(f"workflow 阶段 {stage.stage_id} 依赖不存在的阶段: {', '.join(missing)}")
+
+    # Kahn's algorithm; anything left unvisited sits on a cycle.
+    pending = {stage.stage_id: set(stage.depends_on) for stage in stages}
+    while pending:
+        ready = [sid for sid, deps in pending.items() if not deps]
+        if not ready:
+            raise ValueError(f"workflow 存在循环依赖: {', '.join(sorted(pending))}")
+        for sid in ready:
+            pending.pop(sid)
+        for deps in pending.values():
+            deps.difference_update(ready)
+    return stages
+
+
+def validate_agents(agents: List[AgentConfig], max_agents: int) -> None:
+    """agent id 会用于会话、日志与捕获文件的路径，只允许字母数字、下划线和连字符；max_agents 为 0 表示不限。"""
+    seen: Set[str] = set()
+    for agent in agents:
+        if not _AGENT_ID.match(agent.agent_id):
+            raise ValueError(f"agent id 非法: {agent.agent_id!r}（只允许字母、数字、_ 和 -）")
+        if agent.agent_id in seen:
+            raise ValueError(f"agent id 重复: {agent.agent_id}")
+        seen.add(agent.agent_id)
+    limit = max(max_agents, len(DEFAULT_AGENT_ORDER)) if max_agents > 0 else 0
+    if limit and len(agents) > limit:
+        raise ValueError(f"agent 数量 {len(agents)} 超过 app.max_agents={max_agents}，请调大 max_agents（0 表示不限）")
+
 
 def load_settings(config_path: Path) -> Settings:
     data = yaml.safe_load(config_path.read_text(encoding="utf-8"))
@@ -62,9 +189,35 @@ def load_settings(config_path: Path) -> Settings:
         retry=int(bridge_data.get("retry", 2)),
         telegram_token=str(bridge_data.get("telegram_token", "")),
         telegram_chat_id=str(bridge_data.get("telegram_chat_id", "")),
+        telegram_api_url=str(bridge_data.get("telegram_api_url") or "https://api.telegram.org"),
+        telegram_log_level=str(bridge_data.get("telegram_log_level", "error")),
     )
-    loaded_agents = {
-        str(item.get("id", "")).strip(): AgentConfig(
+    runtime_data = data.get("runtime") or {}
+    runtime = RuntimeSettings(
+        response_cache=bool(runtime_data.get("response_cache", False)),
+        response_cache_ttl_sec=int(runtime_data.get("response_cache_ttl_sec", 600)),
+        response_cache_size=int(runtime_data.get("response_cache_size", 256)),
+        monitor_interval_sec=float(runtime_data.get("monitor_interval_sec", 1.0)),
+        stop_grace_sec=float(runtime_data.get("stop_grace_sec", 3.0)),
+        context_pack=bool(runtime_data.get("context_pack", False)),
+        context_pack_max_chars=int(runtime_data.get("context_pack_max_chars", 4000)),
+        adaptive_timeout=bool(runtime_data.get("adaptive_timeout", True)),
+        timeout_margin=float(runtime_data.get("timeout_margin", 2.0)),
+        timeout_min_sec=float(runtime_data.get("timeout_min_sec", 15.0)),
+        timeout_max_sec=float(runtime_data.get("timeout_max_sec", 1800.0)),
+        hedge=bool(runtime_data.get("hedge", False)),
+        hedge_budget_ratio=float(runtime_data.get("hedge_budget_ratio", 0.1)),
+        hedge_min_delay_sec=float(runtime_data.get("hedge_min_delay_sec", 2.0)),
+        stream_capture=bool(runtime_data.get("stream_capture", True)),
+        capture_keep_per_agent=int(runtime_data.get("capture_keep_per_agent", 200)),
+        max_parallel_runs=int(runtime_data.get("max_parallel_runs", 8)),
+        codex_js=str(runtime_data.get("codex_js") or DEFAULT_CODEX_JS),
+        worker_process=bool(runtime_data.get("worker_process", False)),
+        token_budget_soft=int(runtime_data.get("token_budget_soft", 0)),
+        token_budget_hard=int(runtime_data.get("token_budget_hard", 0)),
+    )
+    loaded_list = [
+        AgentConfig(
             agent_id=str(item.get("id", "")).strip(),
             role=str(item.get("role", "")),
             temperature=float(item.get("temperature", 0.7)),
@@ -73,10 +226,13 @@ def load_settings(config_path: Path) -> Settings:
             session_id=str(item.get("session_id", "")),
             extra_params=str(item.get("extra_params", "")),
             enabled=bool(item.get("enabled", True)),
+            host=str(item.get("host", "") or "").strip(),
         )
-        for item in data.get("agents", [])
+        for item in data.get("agents") or []
         if str(item.get("id", "")).strip()
-    }
+    ]
+    validate_agents(loaded_list, 0)
+    loaded_agents = {agent.agent_id: agent for agent in loaded_list}
     agents: List[AgentConfig] = []
     for agent_id in DEFAULT_AGENT_ORDER:
         existing = loaded_agents.get(agent_id)
@@ -89,14 +245,61 @@ def load_settings(config_path: Path) -> Settings:
             continue
         spec = DEFAULT_AGENT_SPECS[agent_id]
         agents.append(AgentConfig(agent_id=agent_id, role=spec["role"], role_prompt=spec["role_prompt"]))
+    # Custom agents follow the built-in four, in file order.
+    for agent in loaded_list:
+        if agent.agent_id in DEFAULT_AGENT_SPECS:
+            continue
+        if not agent.role:
+            agent.role = f"{agent.agent_id.upper()} Agent"
+        agents.append(agent)
+
+    validate_agents(agents, app.max_agents)
+    hosts = load_hosts(data.get("hosts") or [])
+    host_names = {h.name for h in hosts} | {"", "auto"}
+    for agent in agents:
+        if agent.host not in host_names:
+            raise ValueError(f"agent {agent.agent_id} 引用了未配置的主机: {agent.host}")
+    workflow = load_workflow(data.get("workflow") or DEFAULT_WORKFLOW, {a.agent_id for a in agents})
+    api_data = data.get("api") or {}
+    api = ApiSettings(
+        enabled=bool(api_data.get("enabled", False)),
+        bind=str(api_data.get("bind") or "127.0.0.1"),
+        port=int(api_data.get("port", 8766)),
+        token=str(api_data.get("token", "") or ""),
+        client_buffer=max(1, int(api_data.get("client_buffer", 1000))),
+    )
+    return Settings(app=app, bridge=bridge, agents=agents, workflow=workflow, runtime=runtime, hosts=hosts, api=api)
 
-    if app.max_agents > 0:
-        agents = agents[: max(app.max_agents, len(DEFAULT_AGENT_ORDER))]
-    return Settings(app=app, bridge=bridge, agents=agents)
+
+def load_hosts(items: List[Dict[str, object]]) -> List[HostSettings]:
+    hosts: List[HostSettings] = []
+    for item in items:
+        address = str(item.get("address", "")).strip()
+        host, _, port = address.rpartition(":")
+        if not host or not port.isdigit():
+            raise ValueError(f"主机地址必须是 host:port 形式: {address!r}")
+        name = str(item.get("name", "") or address).strip()
+        if name in {"", "auto"} or any(h.name == name for h in hosts):
+            raise ValueError(f"主机名称无效或重复: {name!r}")
+        hosts.append(
+            HostSettings(
+                name=name,
+                address=address,
+                token=str(item.get("token", "") or ""),
+                max_runs=max(1, int(item.get("max_runs", 4))),
+            )
+        )
+    return hosts
 
 
 def save_settings(config_path: Path, settings: Settings) -> None:
-    payload = {
+    payload = settings_to_dict(settings)
+    config_path.write_text(yaml.safe_dump(payload, sort_keys=False, allow_unicode=True), encoding="utf-8")
+
+
+def settings_to_dict(settings: Settings) -> Dict[str, object]:
+    """teams.yaml 的结构；save_settings 与控制 API 的配置读取共用。"""
+    return {
         "app": {
             "name": settings.app.name,
             "max_agents": settings.app.max_agents,
@@ -108,6 +311,31 @@ def save_settings(config_path: Path, settings: Settings) -> None:
             "retry": settings.bridge.retry,
             "telegram_token": settings.bridge.telegram_token,
             "telegram_chat_id": settings.bridge.telegram_chat_id,
+            "telegram_api_url": settings.bridge.telegram_api_url,
+            "telegram_log_level": settings.bridge.telegram_log_level,
+        },
+        "runtime": {
+            "response_cache": settings.runtime.response_cache,
+            "response_cache_ttl_sec": settings.runtime.response_cache_ttl_sec,
+            "response_cache_size": settings.runtime.response_cache_size,
+            "monitor_interval_sec": settings.runtime.monitor_interval_sec,
+            "stop_grace_sec": settings.runtime.stop_grace_sec,
+            "context_pack": settings.runtime.context_pack,
+            "context_pack_max_chars": settings.runtime.context_pack_max_chars,
+            "adaptive_timeout": settings.runtime.adaptive_timeout,
+            "timeout_margin": settings.runtime.timeout_margin,
+            "timeout_min_sec": settings.runtime.timeout_min_sec,
+            "timeout_max_sec": settings.runtime.timeout_max_sec,
+            "hedge": settings.runtime.hedge,
+            "hedge_budget_ratio": settings.runtime.hedge_budget_ratio,
+            "hedge_min_delay_sec": settings.runtime.hedge_min_delay_sec,
+            "stream_capture": settings.runtime.stream_capture,
+            "capture_keep_per_agent": settings.runtime.capture_keep_per_agent,
+            "max_parallel_runs": settings.runtime.max_parallel_runs,
+            "codex_js": settings.runtime.codex_js,
+            "worker_process": settings.runtime.worker_process,
+            "token_budget_soft": settings.runtime.token_budget_soft,
+            "token_budget_hard": settings.runtime.token_budget_hard,
         },
         "agents": [
             {
@@ -119,8 +347,28 @@ def save_settings(config_path: Path, settings: Settings) -> None:
                 "session_id": agent.session_id,
                 "extra_params": agent.extra_params,
                 "enabled": agent.enabled,
+                "host": agent.host,
             }
             for agent in settings.agents
         ],
+        "hosts": [
+            {"name": host.name, "address": host.address, "token": host.token, "max_runs": host.max_runs}
+            for host in settings.hosts
+        ],
+        "workflow": [
+            {
+                "id": stage.stage_id,
+                "agent": stage.agent_id,
+                "depends_on": list(stage.depends_on),
+                "prompt": stage.prompt,
+            }
+            for stage in settings.workflow
+        ],
+        "api": {
+            "enabled": settings.api.enabled,
+            "bind": settings.api.bind,
+            "port": settings.api.port,
+            "token": settings.api.token,
+            "client_buffer": settings.api.client_buffer,
+        },
     }
-    config_path.write_text(yaml.safe_dump(payload, sort_keys=False, allow_unicode=True), encoding="utf-8")
@@ -0,0 +1,296 @@
+import subprocess
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from .file_index import FileIndex
+
+KEY_FILE_NAMES = {
+    "readme.md",
+    "readme.rst",
+    "readme.txt",
+    "readme",
+    "pyproject.toml",
+    "setup.py",
+    "setup.cfg",
+    "requirements.txt",
+    "package.json",
+    "tsconfig.json",
+    "cargo.toml",
+    "go.mod",
+    "pom.xml",
+    "build.gradle",
+    "makefile",
+    "dockerfile",
+    "docker-compose.yml",
+    "main.py",
+    "app.py",
+    "manage.py",
+}
+README_HEAD_LINES = 12
+TREE_DIR_LIMIT = 40
+GIT_TIMEOUT_SEC = 5
+GIT_REFRESH_SEC = 60
+
+
+@dataclass
+class _Section:
+    key: object = None
+    text: str = ""
+
+
+@dataclass
+class _PackState:
+    index: FileIndex
+    owns_index: bool = True
+    tree: _Section = field(default_factory=_Section)
+    key_files: _Section = field(default_factory=_Section)
+    git: _Section = field(default_factory=_Section)
+    key_file_paths: List[str] = field(default_factory=list)
+    key_file_paths_gen: int = -1
+    git_refresh: Optional[threading.Thread] = None
+
+
+def _git(work_path: Path, *args: str) -> str:
+    try:
+        proc = subprocess.run(
+            ["git", *args],
+            cwd=str(work_path),
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            timeout=GIT_TIMEOUT_SEC,
+            check=False,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return ""
+    return proc.stdout if proc.returncode == 0 else ""
+
+
+def _find_git_dir(work_path: Path) -> Optional[Path]:
+    # The work path may be a subdirectory of the repository, or a worktree whose .git is a file.
+    for parent in (work_path, *work_path.parents):
+        dot_git = parent / ".git"
+        if dot_git.is_dir():
+            return dot_git
+        if dot_git.is_file():
+            try:
+                text = dot_git.read_text(encoding="utf-8").strip()
+            except OSError:
+                return None
+            return (parent / text[len("gitdir:"):].strip()) if text.startswith("gitdir:") else None
+    return None
+
+
+def _git_state_key(work_path: Path) -> Optional[Tuple[str, float]]:
+    """HEAD 指向的提交与 index 的修改时间；读文件而非启动 git，开销可忽略。非 git 仓库返回 None。"""
+    git_dir = _find_git_dir(work_path)
+    if git_dir is None:
+        return None
+    try:
+        head = (git_dir / "HEAD").read_text(encoding="utf-8").strip()
+        if head.startswith("ref: "):
+            ref_file = git_dir / head[5:]
+            head = ref_file.read_text(encoding="utf-8").strip() if ref_file.exists() else head
+        index_mtime = (git_dir / "index").stat().st_mtime if (git_dir / "index").exists() else 0.0
+    except OSError:
+        return None
+    return head, index_mtime
+
+
+def summarize_tree(paths: List[str]) -> str:
+    """按一、二级目录统计文件数，附主要扩展名分布。"""
+    top: Counter = Counter()
+    second: Counter = Counter()
+    root_files: List[str] = []
+    exts: Counter = Counter()
+    for path in paths:
+        parts = path.split("/")
+        if len(parts) == 1:
+            root_files.append(path)
+        else:
+            top[parts[0]] += 1
+            if len(parts) > 2:
+                second[f"{parts[0]}/{parts[1]}"] += 1
+        name = parts[-1]
+        if "." in name[1:]:
+            exts[name.rsplit(".", 1)[1].lower()] += 1
+    lines = [f"目录结构（共 {len(paths)} 个文件）："]
+    shown = 0
+    for top_dir, count in sorted(top.items()):
+        if shown >= TREE_DIR_LIMIT:
+            lines.append(f"- …其余 {len(top) - shown} 个目录")
+            break
+        lines.append(f"- {top_dir}/ ({count})")
+        shown += 1
+        children = sorted((d, c) for d, c in second.items() if d.startswith(top_dir + "/"))
+        for child, child_count in children[:8]:
+            lines.append(f"  - {child}/ ({child_count})")
+        if len(children) > 8:
+            lines.append(f"  - …其余 {len(children) - 8} 个子目录")
+    if root_files:
+        lines.append("- 根目录文件：" + ", ".join(sorted(root_files)[:20]))
+    if exts:
+        lines.append("主要文件类型：" + ", ".join(f".{ext} {n}" for ext, n in exts.most_common(8)))
+    return "\n".join(lines)
+
+
+class ContextPackBuilder:
+    """为工作路径预先生成紧凑的仓库概览（目录结构、关键文件、最近 git 变更），拼入 agent 提示词。
+
+    目录结构依赖后台 FileIndex，按其 generation 失效；关键文件按各自 mtime 失效；
+    git 段按 HEAD、.git/index 失效（另每 GIT_REFRESH_SEC 秒刷新一次未提交变更）。各段独立缓存，只有变化的段会重建。
+    git 命令在后台线程执行，期间沿用上一次的结果，慢仓库不会拖住发送。
+    """
+
+    def __init__(self, max_chars: int = 4000) -> None:
+        self.max_chars = max_chars
+        self._states: Dict[str, _PackState] = {}
+        self._lock = Lock()
+
+    def prime(self, work_path: str, index: Optional[FileIndex] = None) -> None:
+        """提前开始索引工作路径，首条消息到来时概览通常已就绪；传入 index（如文件页已在索引同一目录）时直接共用。"""
+        if index is None or index.root != Path(work_path):
+            self._state(work_path)
+            return
+        with self._lock:
+            state = self._states.get(work_path)
+            if state is None:
+                self._states[work_path] = _PackState(index=index, owns_index=False)
+            elif state.index is not index:
+                if state.owns_index:
+                    state.index.stop()
+                state.index, state.owns_index = index, False
+                state.tree, state.key_file_paths_gen = _Section(), -1
+
+    def _state(self, work_path: str) -> _PackState:
+        with self._lock:
+            state = self._states.get(work_path)
+            # A shared index stops when its owner moves on to another directory; fall back to our own.
+            if state is None or not state.index.running:
+                index = FileIndex(Path(work_path), poll_interval_sec=5.0)
+                index.start()
+                state = self._states[work_path] = _PackState(index=index)
+            return state
+
+    def build(self, work_path: str, wait_sec: float = 2.0) -> str:
+        """返回不超过 max_chars 的概览；索引在 wait_sec 内未就绪时返回空串，不阻塞本次请求。"""
+        root = Path(work_path)
+        if not root.is_dir():
+            return ""
+        deadline = time.monotonic() + wait_sec
+        state = self._state(work_path)
+        if not state.index.wait_ready(wait_sec):
+            return ""
+        with self._lock:
+            self._refresh_tree(state)
+            self._refresh_key_files(state, root)
+            pending = self._refresh_git(state, root)
+        if pending is not None and state.git.key is None:
+            # Nothing cached yet: give the first git run whatever is left of the wait budget.
+            pending.join(max(0.0, deadline - time.monotonic()))
+        with self._lock:
+            sections = [s.text for s in (state.tree, state.key_files, state.git) if s.text]
+        return self._fit(sections)
+
+    def _refresh_tree(self, state: _PackState) -> None:
+        generation = state.index.generation
+        if state.tree.key != generation:
+            state.tree = _Section(generation, summarize_tree(state.index.paths()))
+
+    def _refresh_key_files(self, state: _PackState, root: Path) -> None:
+        if state.key_file_paths_gen != state.tree.key:
+            # Depth <= 2 keeps this cheap and skips vendored copies deep in the tree.
+            state.key_file_paths = [
+                p for p in state.index.paths() if p.count("/") <= 1 and p.rsplit("/", 1)[-1].lower() in KEY_FILE_NAMES
+            ]
+            state.key_file_paths_gen = state.tree.key
+        mtimes = []
+        for rel in state.key_file_paths:
+            try:
+                mtimes.append((rel, (root / rel).stat().st_mtime))
+            except OSError:
+                continue
+        key = tuple(mtimes)
+        if state.key_files.key == key:
+            return
+        lines = ["关键文件：" + ", ".join(rel for rel, _ in mtimes)] if mtimes else []
+        readme = next((rel for rel, _ in mtimes if rel.lower().startswith("readme")), None)
+        if readme:
+            head = self._head_lines(root / readme, README_HEAD_LINES)
+            if head:
+                lines.append(f"{readme} 摘要：")
+                lines.extend(f"  {line}" for line in head)
+        state.key_files = _Section(key, "\n".join(lines))
+
+    @staticmethod
+    def _head_lines(path: Path, limit: int) -> List[str]:
+        out: List[str] = []
+        try:
+            with path.open("r", encoding="utf-8-sig", errors="replace") as fh:
+                for line in fh:
+                    line = line.rstrip()
+                    if line:
+                        out.append(line[:200])
+                    if len(out) >= limit:
+                        break
+        except OSError:
+            return []
+        return out
+
+    def _refresh_git(self, state: _PackState, root: Path) -> Optional[threading.Thread]:
+        """git 段过期时在后台重建（已在重建则不重复启动），返回正在运行的重建线程；调用方须持有 self._lock。"""
+        head = _git_state_key(root)
+        if head is None:
+            state.git = _Section(None, "")
+            return None
+        # Edits to tracked files touch neither HEAD nor the index, so also expire the section periodically.
+        key = (head, int(time.monotonic() // GIT_REFRESH_SEC))
+        if state.git.key == key:
+            return None
+        if state.git_refresh is None or not state.git_refresh.is_alive():
+            state.git_refresh = threading.Thread(target=self._rebuild_git, args=(state, root, key), name="context-pack-git", daemon=True)
+            state.git_refresh.start()
+        return state.git_refresh
+
+    def _rebuild_git(self, state: _PackState, root: Path, key: object) -> None:
+        lines: List[str] = []
+        log = _git(root, "log", "-n", "8", "--pretty=format:%h %ad %s", "--date=short")
+        if log.strip():
+            lines.append("最近提交：")
+            lines.extend(f"  {line}" for line in log.strip().splitlines())
+        status = _git(root, "status", "--porcelain", "--untracked-files=normal", "--", ".").strip().splitlines()
+        if status:
+            lines.append(f"未提交变更（{len(status)} 项）：")
+            lines.extend(f"  {line}" for line in status[:20])
+            if len(status) > 20:
+                lines.append(f"  …其余 {len(status) - 20} 项")
+        with self._lock:
+            state.git = _Section(key, "\n".join(lines))
+
+    def _fit(self, sections: List[str]) -> str:
+        """按段落优先级截断到 max_chars：靠前的段落（目录结构）完整保留的机会更大。"""
+        out: List[str] = []
+        budget = self.max_chars
+        for text in sections:
+            if budget <= 0:
+                break
+            if len(text) > budget:
+                cut = text[:budget].rsplit("\n", 1)[0]
+                out.append(cut + "\n…（已截断）")
+                break
+            out.append(text)
+            budget -= len(text) + 1
+        return "\n".join(out)
+
+    def close(self) -> None:
+        with self._lock:
+            for state in self._states.values():
+                if state.owns_index:
+                    state.index.stop()
+            self._states.clear()
@@ -0,0 +1,432 @@
+import argparse
+import hmac
+import json
+import secrets
+import threading
+from collections import deque
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .agent_host import is_loopback
+from .config import ApiSettings, Settings, load_settings, settings_to_dict
+from .models import AgentConfig, AgentLogEvent, AgentResult, AgentStatus
+
+HEARTBEAT_SEC = 15.0
+MAX_BODY_BYTES = 1 << 20
+REDACTED = "***"
+LOOPBACK_HOSTS = {"127.0.0.1", "localhost", "[::1]"}
+
+
+def result_payload(result: AgentResult) -> Dict[str, object]:
+    return {
+        "agent_id": result.agent_id,
+        "role": result.role,
+        "status": result.status.value,
+        "content": result.content,
+        "metrics": dict(result.metrics),
+    }
+
+
+def redacted_config(settings: Settings) -> Dict[str, object]:
+    data = settings_to_dict(settings)
+    bridge = dict(data["bridge"])
+    if bridge.get("telegram_token"):
+        bridge["telegram_token"] = REDACTED
+    data["bridge"] = bridge
+    data["hosts"] = [{**host, "token": REDACTED if host.get("token") else ""} for host in data["hosts"]]
+    data["api"] = {**dict(data["api"]), "token": REDACTED if settings.api.token else ""}
+    return data
+
+
+class _Subscriber:
+    """一个 SSE 客户端的有界缓冲：写满后丢弃最旧的事件并计数，发布方永远不会被慢客户端阻塞。"""
+
+    def __init__(self, limit: int, agents: Optional[Set[str]]) -> None:
+        self.limit = max(1, limit)
+        self.agents = agents
+        self.dropped = 0
+        self.closed = False
+        self._frames: Deque[bytes] = deque()
+        self._cond = threading.Condition()
+
+    def offer(self, agent_id: str, frame: bytes) -> None:
+        if self.agents is not None and agent_id not in self.agents:
+            return
+        with self._cond:
+            if len(self._frames) >= self.limit:
+                self._frames.popleft()
+                self.dropped += 1
+            self._frames.append(frame)
+            self._cond.notify()
+
+    def take(self, timeout_sec: float) -> Tuple[List[bytes], int]:
+        """取走当前积压的全部事件与期间丢弃的条数；没有事件时最多等待 timeout_sec。"""
+        with self._cond:
+            if not self._frames and not self.closed:
+                self._cond.wait(timeout_sec)
+            frames = list(self._frames)
+            self._frames.clear()
+            dropped, self.dropped = self.dropped, 0
+        return frames, dropped
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class EventHub:
+    """把日志与结果编码为 SSE 帧一次，分发给所有订阅者；保留最近 history_size 帧供断线重连按 Last-Event-ID 补发。"""
+
+    def __init__(self, client_buffer: int) -> None:
+        self.client_buffer = max(1, client_buffer)
+        self._subscribers: List[_Subscriber] = []
+        self._history: Deque[Tuple[int, str, bytes]] = deque(maxlen=self.client_buffer)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    def publish(self, kind: str, agent_id: str, data: Dict[str, object]) -> None:
+        body = json.dumps(data, ensure_ascii=False)
+        with self._lock:
+            self._seq += 1
+            frame = f"id: {self._seq}\nevent: {kind}\ndata: {body}\n\n".encode("utf-8")
+            self._history.append((self._seq, agent_id, frame))
+            for subscriber in self._subscribers:
+                subscriber.offer(agent_id, frame)
+
+    def subscribe(self, agents: Optional[Set[str]], last_id: Optional[int] = None) -> _Subscriber:
+        subscriber = _Subscriber(self.client_buffer, agents)
+        with self._lock:
+            if last_id is not None:
+                for seq, agent_id, frame in self._history:
+                    if seq > last_id:
+                        subscriber.offer(agent_id, frame)
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: _Subscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def client_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def close(self) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscriber in subscribers:
+            subscriber.close()
+
+
+class _ApiError(Exception):
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "ControlApiServer"
+
+    def log_message(self, fmt: str, *args) -> None:  # noqa: A002
+        pass
+
+    def do_GET(self) -> None:  # noqa: N802
+        self._handle("GET")
+
+    def do_POST(self) -> None:  # noqa: N802
+        self._handle("POST")
+
+    def _handle(self, method: str) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        try:
+            # A web page can reach a loopback port too: refuse anything a browser sends cross-site or after DNS rebinding.
+            if self.headers.get("Origin") is not None:
+                raise _ApiError(403, "不接受带 Origin 的浏览器请求")
+            if not self.server.host_allowed(self.headers.get("Host", "")):
+                raise _ApiError(403, f"Host 不被接受: {self.headers.get('Host', '')}")
+            if method == "POST" and self.headers.get_content_type() != "application/json":
+                raise _ApiError(415, "POST 请求的 Content-Type 必须是 application/json")
+            if not self.server.authorized(self.headers.get("Authorization", ""), (query.get("token") or [""])[0]):
+                raise _ApiError(401, "token 不匹配")
+            parts = [unquote(p) for p in url.path.strip("/").split("/")]
+            if parts[:1] != ["api"]:
+                raise _ApiError(404, f"未知路径: {url.path}")
+            route = parts[1:]
+            if method == "GET" and route == ["events"]:
+                self._stream_events(query)
+                return
+            if method == "GET" and route in (["health"], ["agents"], ["runtime"], ["config"]):
+                self._reply(200, getattr(self.server, f"get_{route[0]}")())
+            elif method == "POST" and route == ["dispatch"]:
+                status, data = self.server.dispatch(self._read_json())
+                self._reply(status, data)
+            elif method == "POST" and len(route) == 3 and route[0] == "agents" and route[2] == "stop":
+                self._reply(200, self.server.stop_agent(route[1]))
+            else:
+                raise _ApiError(404 if method == "GET" else 405, f"不支持 {method} {url.path}")
+        except _ApiError as exc:
+            self._reply(exc.status, {"error": str(exc)})
+        except Exception as exc:  # noqa: BLE001
+            self._reply(500, {"error": f"{type(exc).__name__}: {exc}"})
+
+    def _read_json(self) -> Dict[str, object]:
+        length = int(self.headers.get("Content-Length", 0) or 0)
+        if length > MAX_BODY_BYTES:
+            raise _ApiError(413, "请求体过大")
+        try:
+            data = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+        except (UnicodeDecodeError, ValueError) as exc:
+            raise _ApiError(400, f"请求体不是合法 JSON: {exc}") from exc
+        if not isinstance(data, dict):
+            raise _ApiError(400, "请求体必须是 JSON 对象")
+        return data
+
+    def _reply(self, status: int, data: object) -> None:
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except OSError:
+            self.close_connection = True
+
+    def _stream_events(self, query: Dict[str, List[str]]) -> None:
+        agents = {a for raw in query.get("agent", []) for a in raw.split(",") if a} or None
+        last_raw = self.headers.get("Last-Event-ID") or (query.get("since") or [""])[0]
+        last_id = int(last_raw) if last_raw.isdigit() else None
+        # No Content-Length: the stream ends when either side closes the connection.
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        subscriber = self.server.hub.subscribe(agents, last_id)
+        try:
+            self.wfile.write(b"retry: 3000\n\n")
+            self.wfile.flush()
+            while not subscriber.closed:
+                frames, dropped = subscriber.take(HEARTBEAT_SEC)
+                if dropped:
+                    frames.insert(0, f'event: dropped\ndata: {{"count": {dropped}}}\n\n'.encode("utf-8"))
+                # The heartbeat also notices clients that went away without closing the socket.
+                self.wfile.write(b"".join(frames) if frames else b": ping\n\n")
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            self.server.hub.unsubscribe(subscriber)
+
+
+class ControlApiServer(ThreadingHTTPServer):
+    """本机控制 API：HTTP 读取配置与运行状态、派发任务、停止 agent，SSE（GET /api/events）推送日志与结果。
+
+    GUI 与无界面运行共用：runtime / config 以取值函数传入，GUI 重建运行时后 API 自动跟随；
+    on_log / on_result 缺省时直接发布到事件流，GUI 则传入事件总线，由界面处理后再发布，保证界面发起的对话同样可被订阅。
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        settings: ApiSettings,
+        runtime: Callable[[], object],
+        config: Callable[[], Settings],
+        work_path: Callable[[], str],
+        on_log: Optional[Callable[[AgentLogEvent], None]] = None,
+        on_result: Optional[Callable[[AgentResult], None]] = None,
+        can_dispatch: Optional[Callable[[str], bool]] = None,
+        on_started: Optional[Callable[[List[str]], None]] = None,
+        on_finished: Optional[Callable[[], None]] = None,
+    ) -> None:
+        if not settings.token and not is_loopback(settings.bind):
+            raise ValueError(f"监听 {settings.bind} 时必须设置 api.token")
+        super().__init__((settings.bind, settings.port), _Handler)
+        # Without a configured token every start gets a fresh one, so the API is never open to whoever can reach the port.
+        self.token_generated = not settings.token
+        self.token = settings.token or secrets.token_urlsafe(24)
+        self.loopback_only = is_loopback(settings.bind)
+        self.hub = EventHub(settings.client_buffer)
+        self.runtime = runtime
+        self.config = config
+        self.work_path = work_path
+        self.on_log = on_log or self.publish_log
+        self.on_result = on_result or self.publish_result
+        self.can_dispatch = can_dispatch or (lambda agent_id: True)
+        self.on_started = on_started
+        self.on_finished = on_finished
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever, name="control-api", daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self.hub.close()
+        if self._thread is not None:
+            self.shutdown()
+        self.server_close()
+
+    def host_allowed(self, host: str) -> bool:
+        if not self.loopback_only:
+            return True
+        name, _, port = host.strip().lower().rpartition(":")
+        return name in LOOPBACK_HOSTS and port == str(self.server_address[1])
+
+    def authorized(self, header: str, query_token: str) -> bool:
+        # SSE clients that cannot set headers may pass the token as ?token= instead.
+        token = header[len("Bearer "):] if header.startswith("Bearer ") else query_token
+        return hmac.compare_digest(token.encode("utf-8"), self.token.encode("utf-8"))
+
+    def publish_log(self, event: AgentLogEvent) -> None:
+        self.hub.publish("log", event.agent_id, {"agent_id": event.agent_id, "role": event.role, "status": event.status.value, "message": event.message})
+
+    def publish_result(self, result: AgentResult) -> None:
+        self.hub.publish("result", result.agent_id, result_payload(result))
+
+    def get_health(self) -> Dict[str, object]:
+        return {"ok": True, "clients": self.hub.client_count()}
+
+    def get_agents(self) -> List[Dict[str, object]]:
+        runtime = self.runtime()
+        return [
+            {
+                "agent_id": agent.agent_id,
+                "role": agent.role,
+                "enabled": agent.enabled,
+                "available": self.can_dispatch(agent.agent_id),
+                "host": agent.host,
+                "session_id": runtime.session_for(agent.agent_id),
+            }
+            for agent in self.config().agents
+        ]
+
+    def get_runtime(self) -> Dict[str, object]:
+        runtime = self.runtime()
+        return {
+            "pids": runtime.runtime_info(),
+            "sessions": {agent.agent_id: runtime.session_for(agent.agent_id) for agent in self.config().agents},
+            "resources": {agent_id: asdict(stats) for agent_id, stats in runtime.resource_stats().items()},
+            "usage": {agent_id: {"today": asdict(today), "total": asdict(total)} for agent_id, (today, total) in runtime.usage_snapshot().items()},
+        }
+
+    def get_config(self) -> Dict[str, object]:
+        return redacted_config(self.config())
+
+    def stop_agent(self, agent_id: str) -> Dict[str, object]:
+        if agent_id not in {a.agent_id for a in self.config().agents}:
+            raise _ApiError(404, f"没有名为 {agent_id} 的 agent")
+        return {"agent_id": agent_id, "stopped": bool(self.runtime().stop_agent(agent_id))}
+
+    def dispatch(self, request: Dict[str, object]) -> Tuple[int, Dict[str, object]]:
+        """请求：{"targets": "all" 或 [agent_id...], "text", "work_path"?, "timeout_sec"?, "isolated"?, "hedge"?, "wait"?}。
+
+        wait 为 true（默认）时等全部结果返回；为 false 时立即返回 202，结果经事件流推送。
+        """
+        settings = self.config()
+        text = str(request.get("text") or "").strip()
+        if not text:
+            raise _ApiError(400, "text 不能为空")
+        by_id = {a.agent_id: a for a in settings.agents}
+        raw = request.get("targets", "all")
+        if raw == "all":
+            targets = [a for a in settings.agents if self.can_dispatch(a.agent_id)]
+        else:
+            ids = [raw] if isinstance(raw, str) else list(raw or [])
+            unknown = [str(i) for i in ids if i not in by_id]
+            if unknown:
+                raise _ApiError(400, f"未知的 agent: {', '.join(unknown)}")
+            targets = [by_id[i] for i in ids if self.can_dispatch(i)]
+        if not targets:
+            raise _ApiError(409, "没有可参与的 agent")
+        work_path = str(request.get("work_path") or self.work_path())
+        timeout_sec = int(request.get("timeout_sec") or max(30, settings.bridge.timeout_sec))
+        isolated = bool(request.get("isolated", False))
+        hedge = bool(request.get("hedge", False))
+        runtime = self.runtime()
+        if self.on_started is not None:
+            self.on_started([a.agent_id for a in targets])
+        for agent in targets:
+            self.on_log(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"收到对话（API）：{text}"))
+
+        def run() -> List[AgentResult]:
+            # Turns for an agent that is already busy are queued by the runtime, so a waiting request just takes longer.
+            try:
+                results = runtime.dispatch(targets, text, work_path, timeout_sec, self.on_log, isolated, hedge)
+            except Exception as exc:  # noqa: BLE001
+                results = [AgentResult(a.agent_id, a.role, AgentStatus.FAILED, f"调度异常: {exc}") for a in targets]
+            finally:
+                if self.on_finished is not None:
+                    self.on_finished()
+            for result in results:
+                self.on_result(result)
+            return results
+
+        if request.get("wait", True):
+            return 200, {"results": [result_payload(r) for r in run()]}
+        threading.Thread(target=run, name="api-dispatch", daemon=True).start()
+        return 202, {"accepted": [a.agent_id for a in targets]}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="无界面运行 agent 团队，只通过本机控制 API（HTTP + SSE）派发与观察")
+    parser.add_argument("--root", type=Path, default=Path.cwd(), help="项目根目录：读取 config/teams.yaml，会话与日志也写在这里")
+    parser.add_argument("--bind", default=None, help="默认取 teams.yaml 的 api.bind")
+    parser.add_argument("--port", type=int, default=None, help="默认取 teams.yaml 的 api.port")
+    parser.add_argument("--work-path", default=None, help="请求未指定 work_path 时使用，默认为根目录")
+    args = parser.parse_args()
+
+    from .agent_runtime import AgentRuntimeManager
+
+    root = args.root.resolve()
+    settings = load_settings(root / "config" / "teams.yaml")
+    if args.bind:
+        settings.api.bind = args.bind
+    if args.port is not None:
+        settings.api.port = args.port
+    # No GUI thread to protect here, so the runtime always runs in this process.
+    runtime = AgentRuntimeManager(settings.agents, root, settings.runtime, settings.hosts)
+    runtime.start()
+    work_path = args.work_path or str(root)
+    try:
+        server = ControlApiServer(
+            settings.api, lambda: runtime, lambda: settings, lambda: work_path, can_dispatch=lambda agent_id: agent_id in _enabled(settings.agents)
+        )
+    except (OSError, ValueError) as exc:
+        runtime.stop()
+        parser.error(str(exc))
+    print(f"控制 API 监听 {server.address}，根目录 {root}")
+    if server.token_generated:
+        print(f"未配置 api.token，本次口令：{server.token}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.hub.close()
+        server.server_close()
+        runtime.stop()
+
+
+def _enabled(agents: List[AgentConfig]) -> Set[str]:
+    return {a.agent_id for a in agents if a.enabled}
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+import cProfile
+import functools
+import io
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+SAMPLE_INTERVAL_SEC = 0.005
+INFLIGHT_WAIT_SEC = 2.0
+TRACEMALLOC_FRAMES = 25
+TOP_STATS = 60
+
+F = TypeVar("F", bound=Callable)
+
+
+def _stamp() -> str:
+    return datetime.now().strftime("%Y%m%d-%H%M%S")
+
+
+class SamplingProfiler:
+    """按固定间隔抓取所有线程的 Python 栈，输出 collapsed stack 格式（flamegraph.pl / speedscope 可直接读取）。"""
+
+    def __init__(self, interval_sec: float = SAMPLE_INTERVAL_SEC) -> None:
+        self.interval_sec = interval_sec
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.started_at = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stacks.clear()
+        self.samples = 0
+        self.started_at = time.monotonic()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="diag-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def _loop(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_sec):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                parts: List[str] = []
+                while frame is not None:
+                    parts.append(f"{Path(frame.f_code.co_filename).stem}.{frame.f_code.co_name}")
+                    frame = frame.f_back
+                parts.append(f"thread:{names.get(ident, ident)}")
+                parts.reverse()
+                self._stacks[";".join(parts)] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path: Path) -> Path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class _ThreadProfile:
+    def __init__(self, generation: int) -> None:
+        self.profile = cProfile.Profile()
+        self.generation = generation
+        # True while this thread's profile is collecting; only the owning thread may flip it off.
+        self.enabled = False
+        self.depth = 0
+
+
+class HotPathProfiler:
+    """只在 @profiled 标注的热点函数内启用 cProfile；每个线程各用一个 Profile，停止时合并。
+
+    未启用时被标注函数只多一次布尔判断。cProfile 只能看到调用它的线程，所以在每个热点入口按线程开启，
+    从而覆盖 GUI 线程与运行时的工作线程。停止后，仍在长调用（整次 CLI 运行）里的线程在下一次进入
+    嵌套热点时自行关闭 Profile，停止方短暂等待这些线程交还结果。
+    """
+
+    def __init__(self) -> None:
+        self.active = False
+        # Set while stop() waits for threads to release their profiles, so nested hot paths still reach call().
+        self.draining = False
+        self._local = threading.local()
+        self._profiles: List[_ThreadProfile] = []
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def start(self) -> None:
+        with self._lock:
+            self._profiles = []
+            self._generation += 1
+            self.active = True
+
+    def _release(self, state: _ThreadProfile) -> None:
+        state.profile.disable()
+        with self._lock:
+            state.enabled = False
+
+    def call(self, func: Callable, args: tuple, kwargs: Dict[str, object]) -> object:
+        state: Optional[_ThreadProfile] = getattr(self._local, "state", None)
+        if state is not None and state.depth:
+            if state.enabled and state.generation != self._generation:
+                self._release(state)
+            # Already inside a profiled entry on this thread; the outer profile sees this call.
+            return func(*args, **kwargs)
+        if not self.active:
+            return func(*args, **kwargs)
+        if state is None or state.generation != self._generation:
+            state = _ThreadProfile(self._generation)
+            self._local.state = state
+            with self._lock:
+                self._profiles.append(state)
+        try:
+            state.profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, or cProfile run on the whole app) owns this thread.
+            return func(*args, **kwargs)
+        with self._lock:
+            state.enabled = True
+        state.depth += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            state.depth -= 1
+            if state.enabled:
+                self._release(state)
+
+    def stop(self) -> Tuple[Optional[pstats.Stats], int]:
+        """停止并合并各线程的结果；返回 (统计, 仍在运行而未计入的线程数)。"""
+        with self._lock:
+            self.active = False
+            # Threads entering a hot path from now on start a new profile instead of reviving these.
+            self._generation += 1
+            self.draining = True
+        deadline = time.monotonic() + INFLIGHT_WAIT_SEC
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not any(state.enabled for state in self._profiles):
+                    break
+            time.sleep(0.05)
+        self.draining = False
+        with self._lock:
+            profiles = list(self._profiles)
+            self._profiles = []
+        stats: Optional[pstats.Stats] = None
+        skipped = 0
+        for state in profiles:
+            if state.enabled:
+                # The thread has not come back to a hot path since the stop; its profile is still live.
+                skipped += 1
+                continue
+            state.profile.create_stats()
+            if not state.profile.stats:  # type: ignore[attr-defined]
+                continue
+            if stats is None:
+                stats = pstats.Stats(state.profile)
+            else:
+                stats.add(state.profile)
+        return stats, skipped
+
+
+class MemorySnapshots:
+    """tracemalloc 快照：按时间点记录，比较任意两次之间按代码行统计的分配增长。"""
+
+    def __init__(self) -> None:
+        self.snapshots: List[Tuple[str, tracemalloc.Snapshot]] = []
+        self._started_here = False
+
+    def take(self, label: str = "") -> str:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_here = True
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"))
+        )
+        label = label or datetime.now().strftime("%H:%M:%S")
+        self.snapshots.append((label, snapshot))
+        return label
+
+    def diff_lines(self, older: int = -2, newer: int = -1, top: int = TOP_STATS) -> List[str]:
+        (old_label, old), (new_label, new) = self.snapshots[older], self.snapshots[newer]
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [
+            f"快照 {old_label} → {new_label}；当前追踪 {current / 1048576:.1f} MB，峰值 {peak / 1048576:.1f} MB",
+            "",
+            f"按代码行的分配增长（前 {top} 项）：",
+        ]
+        diffs = new.compare_to(old, "lineno")
+        lines += [f"  {stat}" for stat in diffs[:top]]
+        lines += ["", "增长最多的分配的完整调用栈："]
+        for stat in new.compare_to(old, "traceback")[:3]:
+            lines.append(f"  {stat.size_diff / 1024:+.1f} KiB，{stat.count_diff:+d} 个块")
+            lines += [f"    {line}" for line in stat.traceback.format()]
+        return lines
+
+    def stop(self) -> None:
+        self.snapshots.clear()
+        if self._started_here:
+            tracemalloc.stop()
+            self._started_here = False
+
+
+ACTIONS = ("start_sampling", "stop_sampling", "start_hot_paths", "stop_hot_paths", "snapshot", "memory_diff")
+
+
+class Diagnostics:
+    """诊断工具的统一入口：采样剖析、热点 cProfile 与内存快照，结果写入 out_dir；均可在运行中随时开关。"""
+
+    def __init__(self, out_dir: Path, prefix: str = "") -> None:
+        self.out_dir = out_dir
+        # Distinguishes files from the runtime worker process when both write to the same directory.
+        self.prefix = prefix
+        self.sampler = SamplingProfiler()
+        self.hot_paths = HotPathProfiler()
+        self.memory = MemorySnapshots()
+
+    def _path(self, name: str) -> Path:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        return self.out_dir / f"{self.prefix}{name}"
+
+    def stop_sampling(self) -> Path:
+        self.sampler.stop()
+        return self.sampler.write_collapsed(self._path(f"sampling-{_stamp()}.collapsed.txt"))
+
+    def stop_hot_paths(self) -> Optional[Path]:
+        """写出 .prof（snakeviz / pstats 可读）与按累计耗时排序的文本摘要，返回摘要路径；没有数据时返回 None。"""
+        stats, skipped = self.hot_paths.stop()
+        if stats is None:
+            return None
+        stamp = _stamp()
+        stats.dump_stats(str(self._path(f"hotpaths-{stamp}.prof")))
+        buf = io.StringIO()
+        if skipped:
+            buf.write(f"{skipped} 个线程的调用仍在进行中，未计入本次结果。\n\n")
+        stats.stream = buf  # type: ignore[attr-defined]
+        stats.sort_stats("cumulative").print_stats(TOP_STATS)
+        path = self._path(f"hotpaths-{stamp}.txt")
+        path.write_text(buf.getvalue(), encoding="utf-8")
+        return path
+
+    def write_memory_diff(self) -> Optional[Path]:
+        """比较最近两次内存快照；不足两次时返回 None。"""
+        if len(self.memory.snapshots) < 2:
+            return None
+        path = self._path(f"memory-diff-{_stamp()}.txt")
+        path.write_text("\n".join(self.memory.diff_lines()) + "\n", encoding="utf-8")
+        return path
+
+    def run(self, action: str) -> str:
+        """按名称执行一个诊断动作（见 ACTIONS），返回写出的文件路径或快照标签，没有产物时返回空串。"""
+        if action == "start_sampling":
+            self.sampler.start()
+        elif action == "stop_sampling":
+            return str(self.stop_sampling())
+        elif action == "start_hot_paths":
+            self.hot_paths.start()
+        elif action == "stop_hot_paths":
+            return str(self.stop_hot_paths() or "")
+        elif action == "snapshot":
+            return self.memory.take()
+        elif action == "memory_diff":
+            return str(self.write_memory_diff() or "")
+        else:
+            raise ValueError(f"未知诊断动作: {action}")
+        return ""
+
+    def close(self) -> None:
+        self.sampler.stop()
+        self.hot_paths.active = False
+        self.memory.stop()
+
+
+# One per process, so runtime code can be annotated without threading a handle through every call.
+diagnostics = Diagnostics(Path("logs") / "diagnostics")
+
+
+def profiled(func: F) -> F:
+    """把函数标注为热点：仅在 diagnostics.hot_paths 启用期间用 cProfile 记录它及其调用的一切。"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        hot_paths = diagnostics.hot_paths
+        if not (hot_paths.active or hot_paths.draining):
+            return func(*args, **kwargs)
+        return diagnostics.hot_paths.call(func, args, kwargs)
+
+    return wrapper  # type: ignore[return-value]
@@ -0,0 +1,148 @@
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, List, Optional, Pattern, Sequence, Tuple
+
+from .models import AgentConfig
+
+
+@dataclass
+class FastPathContext:
+    agent: AgentConfig
+    work_path: str
+    session_id: str
+    pid: int
+    status: str
+
+
+FastPathRule = Callable[[str, FastPathContext], Optional[str]]
+CacheKey = Tuple[str, str, str, str]
+
+_TRAILING_PUNCT = "?？!！。.~～ "
+
+
+def normalize_prompt(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower().rstrip(_TRAILING_PUNCT)
+
+
+def _pattern_rule(patterns: Sequence[str], answer: Callable[[FastPathContext], str]) -> FastPathRule:
+    # Patterns are anchored on the whole normalized prompt, so "修改这个路径下的文件" never matches.
+    compiled: List[Pattern[str]] = [re.compile(rf"^(?:{p})$") for p in patterns]
+
+    def rule(normalized: str, ctx: FastPathContext) -> Optional[str]:
+        if any(p.match(normalized) for p in compiled):
+            return answer(ctx)
+        return None
+
+    return rule
+
+
+_WHO = r"(?:你们|你|当前|现在)?(?:的)?"
+_ASK = r"(?:在哪里|在哪儿|在哪|是什么|是啥|是多少|是哪个|呢)?"
+
+work_path_rule = _pattern_rule(
+    [
+        rf"{_WHO}(?:工作路径|工作目录|当前路径|当前目录){_ASK}",
+        r"(?:what(?:'s| is) )?(?:your |the )?(?:current )?(?:work(?:ing)? ?(?:path|dir|directory)|cwd|pwd)",
+    ],
+    lambda ctx: f"当前工作路径是：{ctx.work_path}",
+)
+
+session_rule = _pattern_rule(
+    [
+        rf"{_WHO}(?:会话|session)(?: ?id)?{_ASK}",
+        r"(?:what(?:'s| is) )?(?:your |the )?(?:current )?session(?: ?id)?",
+    ],
+    lambda ctx: f"当前 session_id：{ctx.session_id or '尚未建立（首次对话后生成）'}",
+)
+
+pid_rule = _pattern_rule(
+    [
+        rf"{_WHO}(?:进程号|进程 ?id|pid){_ASK}",
+        r"(?:what(?:'s| is) )?(?:your |the )?(?:process id|pid)",
+    ],
+    lambda ctx: f"最近一次 CLI 进程 PID：{ctx.pid}" if ctx.pid > 0 else "尚未启动过 CLI 进程",
+)
+
+role_rule = _pattern_rule(
+    [
+        rf"你是谁|你是做什么的|{_WHO}角色{_ASK}|{_WHO}职责{_ASK}",
+        r"who are you|what(?:'s| is) your role",
+    ],
+    lambda ctx: f"{ctx.agent.agent_id.upper()}，角色：{ctx.agent.role}。{ctx.agent.role_prompt}".strip(),
+)
+
+status_rule = _pattern_rule(
+    [
+        rf"{_WHO}状态{_ASK}|{_WHO}(?:运行)?状态(?:如何|怎么样)",
+        r"(?:what(?:'s| is) )?(?:your |the )?(?:current )?status",
+    ],
+    lambda ctx: f"当前状态：{ctx.status}",
+)
+
+DEFAULT_RULES: List[FastPathRule] = [work_path_rule, session_rule, pid_rule, role_rule, status_rule]
+
+
+class FastPathResolver:
+    """派发前的本地应答层：命中规则直接返回答案，不启动 Codex 进程。"""
+
+    def __init__(self, rules: Optional[Sequence[FastPathRule]] = None) -> None:
+        self._rules: List[FastPathRule] = list(DEFAULT_RULES if rules is None else rules)
+
+    def register(self, rule: FastPathRule, first: bool = False) -> None:
+        if first:
+            self._rules.insert(0, rule)
+        else:
+            self._rules.append(rule)
+
+    def resolve(self, text: str, ctx: FastPathContext) -> Optional[str]:
+        normalized = normalize_prompt(text)
+        if not normalized or len(normalized) > 64:
+            return None
+        for rule in self._rules:
+            answer = rule(normalized, ctx)
+            if answer is not None:
+                return answer
+        return None
+
+
+class ResponseCache:
+    """精确匹配的回复缓存（TTL + LRU），按 agent / session / 工作路径 / 归一化 prompt 建键。"""
+
+    def __init__(self, ttl_sec: float, max_entries: int) -> None:
+        self.ttl_sec = ttl_sec
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[CacheKey, Tuple[float, str]]" = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(agent_id: str, session_id: str, work_path: str, text: str) -> CacheKey:
+        return agent_id, session_id, work_path, normalize_prompt(text)
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: CacheKey, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_sec, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,427 @@
+import os
+import re
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Iterator, List, Optional, Pattern, Tuple, Union
+
+ALWAYS_IGNORED = {".git", ".hg", ".svn"}
+MAX_CONTENT_BYTES = 2 * 1024 * 1024
+
+
+@dataclass
+class _IgnoreRule:
+    regex: Pattern[str]
+    negated: bool
+    dir_only: bool
+
+
+def _glob_to_regex(pattern: str) -> str:
+    out, i = [], 0
+    while i < len(pattern):
+        ch = pattern[i]
+        if ch == "*":
+            if pattern[i : i + 2] == "**":
+                # "**/" matches zero or more directories, a trailing "**" everything below.
+                if pattern[i + 2 : i + 3] == "/":
+                    out.append("(?:.*/)?")
+                    i += 3
+                    continue
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif ch == "?":
+            out.append("[^/]")
+        elif ch == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(ch))
+            else:
+                body = pattern[i + 1 : end].replace("\\", "\\\\")
+                out.append("[" + ("^" + body[1:] if body.startswith("!") else body) + "]")
+                i = end
+        else:
+            out.append(re.escape(ch))
+        i += 1
+    return "".join(out)
+
+
+def parse_gitignore(text: str) -> List[_IgnoreRule]:
+    rules: List[_IgnoreRule] = []
+    for raw in text.splitlines():
+        line = raw.rstrip()
+        if not line or line.startswith("#"):
+            continue
+        negated = line.startswith("!")
+        if negated:
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.strip("/") if dir_only else line
+        if not line:
+            continue
+        # A slash anywhere but the end anchors the pattern to the .gitignore's directory.
+        anchored = "/" in line
+        body = _glob_to_regex(line.lstrip("/"))
+        regex = re.compile(("^" if anchored else "^(?:.*/)?") + body + "$")
+        rules.append(_IgnoreRule(regex, negated, dir_only))
+    return rules
+
+
+class IgnoreMatcher:
+    """按目录叠加的 .gitignore 规则；路径均为相对索引根目录的 posix 路径。"""
+
+    def __init__(self) -> None:
+        self._rules: Dict[str, List[_IgnoreRule]] = {}
+
+    def load_dir(self, root: Path, rel_dir: str) -> None:
+        path = root / rel_dir / ".gitignore" if rel_dir else root / ".gitignore"
+        try:
+            rules = parse_gitignore(path.read_text(encoding="utf-8", errors="replace"))
+        except OSError:
+            rules = []
+        if rules:
+            self._rules[rel_dir] = rules
+        else:
+            self._rules.pop(rel_dir, None)
+
+    def forget(self, rel_dir: str) -> None:
+        """丢弃 rel_dir 及其下所有目录的规则（rel_dir 为空时丢弃全部）。"""
+        prefix = rel_dir + "/" if rel_dir else ""
+        for key in [k for k in self._rules if k == rel_dir or k.startswith(prefix)]:
+            del self._rules[key]
+
+    def ignored(self, rel_path: str, is_dir: bool) -> bool:
+        name = rel_path.rsplit("/", 1)[-1]
+        if name in ALWAYS_IGNORED:
+            return True
+        result = False
+        parts = rel_path.split("/")
+        # Deeper .gitignore files are applied last so they can override their ancestors.
+        for depth in range(len(parts)):
+            base = "/".join(parts[:depth])
+            rules = self._rules.get(base)
+            if not rules:
+                continue
+            sub = "/".join(parts[depth:])
+            for rule in rules:
+                if rule.dir_only and not is_dir:
+                    continue
+                if rule.regex.match(sub):
+                    result = not rule.negated
+        return result
+
+
+@dataclass
+class _Snapshot:
+    """不可变的索引快照：小写全路径（前缀 "/"）与小写文件名各拼成一个字符串，配合行首偏移表由命中位置反查路径。"""
+
+    paths: List[str]
+    lower: str
+    line_starts: "array[int]"
+    names: str
+    name_starts: "array[int]"
+
+    @classmethod
+    def build(cls, paths: List[str]) -> "_Snapshot":
+        # Full paths get a leading "/" so "segment start" is the literal "/x" for the regex engine.
+        lower_paths = ["/" + p.lower() for p in paths]
+        names = [p[p.rfind("/") + 1 :] for p in lower_paths]
+        return cls(paths, "\n".join(lower_paths), _line_starts(lower_paths), "\n".join(names), _line_starts(names))
+
+
+def _line_starts(lines: List[str]) -> "array[int]":
+    starts, offset = array("q"), 0
+    for line in lines:
+        starts.append(offset)
+        offset += len(line) + 1
+    return starts
+
+
+@dataclass
+class ContentMatch:
+    path: str
+    line_no: int
+    line: str
+
+
+class FileIndex:
+    """工作路径的后台文件索引。
+
+    首次全量遍历后，后台线程定期对已索引目录做 stat，目录 mtime 变化时只重扫该目录（增删文件、发现新子目录）；
+    .gitignore 的 mtime 单独跟踪，规则变化时重扫其所在目录的整棵子树。
+    不依赖系统级文件监听，20 万文件的仓库也不会耗尽 inotify 句柄。
+    所有路径拼成一个以换行分隔的字符串，文件名模糊搜索在这个字符串上用正则一次扫描完成。
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        poll_interval_sec: float = 2.0,
+        on_changed: Optional[Callable[[], None]] = None,
+    ) -> None:
+        self.root = root
+        self.poll_interval_sec = poll_interval_sec
+        self.on_changed = on_changed
+        self.ignore = IgnoreMatcher()
+        self._files: Dict[str, List[str]] = {}
+        self._dir_mtimes: Dict[str, float] = {}
+        # Editing a .gitignore in place does not touch its directory's mtime, so it is polled on its own.
+        self._ignore_mtimes: Dict[str, float] = {}
+        self._snapshot = _Snapshot.build([])
+        self._generation = 0
+        self._lock = Lock()
+        self._stop = Event()
+        self._ready = Event()
+        self._thread: Optional[Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    @property
+    def generation(self) -> int:
+        """文件列表每次变化后加一，可作为派生缓存的失效键。"""
+        return self._generation
+
+    @property
+    def file_count(self) -> int:
+        return len(self._snapshot.paths)
+
+    @property
+    def running(self) -> bool:
+        return not self._stop.is_set()
+
+    def start(self) -> None:
+        self._thread = Thread(target=self._run, name="file-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def wait_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def paths(self) -> List[str]:
+        with self._lock:
+            return list(self._snapshot.paths)
+
+    def search(self, query: str, limit: int = 200) -> List[str]:
+        """文件名模糊搜索：依次取文件名包含查询串、路径包含查询串、按字符顺序模糊匹配（查询含 "/" 时匹配整条路径）的结果。"""
+        query = query.strip().lower().replace("\\", "/")
+        if not query:
+            return []
+        with self._lock:
+            snapshot = self._snapshot
+        paths, tiers = snapshot.paths, []
+        chars = [re.escape(c) for c in query.replace(" ", "")]
+        # "a[^\nb]*b[^\nc]*c": each gap excludes the next character, so matching never backtracks.
+        # Across full paths the first character must start a path segment, which keeps the scan cheap.
+        fuzzy = path_fuzzy = None
+        if len(chars) > 1:
+            gaps = "".join(f"[^\n{c}]*{c}" for c in chars[1:])
+            fuzzy = re.compile(chars[0] + gaps)
+            path_fuzzy = re.compile(f"/{chars[0]}{gaps}")
+        if "/" not in query:
+            tiers.append((snapshot.names, snapshot.name_starts, query))
+        tiers.append((snapshot.lower, snapshot.line_starts, query))
+        if fuzzy is not None:
+            # Fuzzy matching across directories is only worth its cost when the query names a directory.
+            if "/" in query:
+                tiers.append((snapshot.lower, snapshot.line_starts, path_fuzzy))
+            else:
+                tiers.append((snapshot.names, snapshot.name_starts, fuzzy))
+
+        seen: Dict[int, Tuple[int, int, int]] = {}
+        for tier, (text, starts, pattern) in enumerate(tiers):
+            # Stop once the earlier, better tiers already filled the page.
+            if len(seen) >= limit:
+                break
+            for idx, span in self._scan(text, starts, pattern, limit * 4 - len(seen)):
+                if idx not in seen:
+                    seen[idx] = (tier, span, len(paths[idx]))
+        ranked = sorted(seen.items(), key=lambda kv: kv[1])[:limit]
+        return [paths[idx] for idx, _ in ranked]
+
+    @staticmethod
+    def _scan(text: str, starts: "array[int]", pattern: Union[str, Pattern[str]], budget: int) -> Iterator[Tuple[int, int]]:
+        """在换行拼接的文本上查找，每行最多命中一次，返回 (行号, 匹配跨度)；字面量用 str.find，比正则快一个量级。"""
+        pos, found = 0, 0
+        while found < budget:
+            if isinstance(pattern, str):
+                begin = text.find(pattern, pos)
+                if begin == -1:
+                    return
+                span = len(pattern)
+            else:
+                match = pattern.search(text, pos)
+                if match is None:
+                    return
+                begin, span = match.start(), match.end() - match.start()
+            idx = bisect_right(starts, begin) - 1
+            yield idx, span
+            found += 1
+            pos = starts[idx + 1] if idx + 1 < len(starts) else len(text)
+
+    def search_content(
+        self,
+        query: str,
+        cancel: Event,
+        limit: int = 500,
+        case_sensitive: bool = False,
+    ) -> Iterator[ContentMatch]:
+        """逐文件流式返回包含 query 的行；跳过二进制文件与超过 2MB 的文件，cancel 置位后立即停止。"""
+        if not query:
+            return
+        needle = query.encode("utf-8")
+        if not case_sensitive:
+            needle = needle.lower()
+        found = 0
+        with self._lock:
+            paths = self._snapshot.paths
+        for rel in paths:
+            if cancel.is_set():
+                return
+            path = self.root / rel
+            try:
+                if path.stat().st_size > MAX_CONTENT_BYTES:
+                    continue
+                data = path.read_bytes()
+            except OSError:
+                continue
+            if b"\0" in data[:8192]:
+                continue
+            haystack = data if case_sensitive else data.lower()
+            pos = haystack.find(needle)
+            while pos != -1:
+                line_start = data.rfind(b"\n", 0, pos) + 1
+                line_end = data.find(b"\n", pos)
+                line_end = len(data) if line_end == -1 else line_end
+                line_no = data.count(b"\n", 0, pos) + 1
+                yield ContentMatch(rel, line_no, data[line_start:line_end][:300].decode("utf-8", errors="replace").strip())
+                found += 1
+                if found >= limit:
+                    return
+                pos = haystack.find(needle, line_end)
+
+    def _run(self) -> None:
+        self._full_scan()
+        self._ready.set()
+        if self.on_changed:
+            self.on_changed()
+        while not self._stop.wait(self.poll_interval_sec):
+            try:
+                if self._poll():
+                    self._rebuild_snapshot()
+                    if self.on_changed:
+                        self.on_changed()
+            except Exception:  # noqa: BLE001
+                continue
+
+    def _full_scan(self) -> None:
+        stack = [""]
+        while stack and not self._stop.is_set():
+            rel_dir = stack.pop()
+            stack.extend(self._scan_dir(rel_dir))
+        self._rebuild_snapshot()
+
+    def _scan_dir(self, rel_dir: str) -> List[str]:
+        """扫描单个目录，更新其文件列表与 mtime，返回需要继续遍历的子目录。"""
+        abs_dir = self.root / rel_dir if rel_dir else self.root
+        try:
+            mtime = abs_dir.stat().st_mtime
+            entries = list(os.scandir(abs_dir))
+        except OSError:
+            self._forget_dir(rel_dir)
+            return []
+        ignore_mtime = self._gitignore_mtime(rel_dir) if any(e.name == ".gitignore" for e in entries) else None
+        if ignore_mtime is not None or rel_dir in self._ignore_mtimes:
+            self.ignore.load_dir(self.root, rel_dir)
+        if ignore_mtime is None:
+            self._ignore_mtimes.pop(rel_dir, None)
+        else:
+            self._ignore_mtimes[rel_dir] = ignore_mtime
+        files: List[str] = []
+        subdirs: List[str] = []
+        for entry in entries:
+            rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if self.ignore.ignored(rel, is_dir):
+                continue
+            if is_dir:
+                subdirs.append(rel)
+            else:
+                files.append(entry.name)
+        files.sort()
+        self._files[rel_dir] = files
+        self._dir_mtimes[rel_dir] = mtime
+        return subdirs
+
+    def _gitignore_mtime(self, rel_dir: str) -> Optional[float]:
+        path = self.root / rel_dir / ".gitignore" if rel_dir else self.root / ".gitignore"
+        try:
+            return path.stat().st_mtime
+        except OSError:
+            return None
+
+    def _forget_dir(self, rel_dir: str) -> None:
+        prefix = rel_dir + "/" if rel_dir else ""
+        for key in [k for k in self._dir_mtimes if k == rel_dir or k.startswith(prefix)]:
+            self._dir_mtimes.pop(key, None)
+            self._files.pop(key, None)
+            self._ignore_mtimes.pop(key, None)
+        self.ignore.forget(rel_dir)
+
+    def _poll(self) -> bool:
+        changed = False
+        for rel_dir, old_mtime in list(self._dir_mtimes.items()):
+            if self._stop.is_set():
+                break
+            if rel_dir not in self._dir_mtimes:
+                # Dropped by an ancestor's rescan earlier in this pass.
+                continue
+            abs_dir = self.root / rel_dir if rel_dir else self.root
+            try:
+                mtime = abs_dir.stat().st_mtime
+            except OSError:
+                self._forget_dir(rel_dir)
+                changed = True
+                continue
+            old_ignore = self._ignore_mtimes.get(rel_dir)
+            # Adding or deleting a .gitignore changes the directory mtime; only known ones need a stat of their own.
+            ignore_mtime = self._gitignore_mtime(rel_dir) if old_ignore is not None or mtime != old_mtime else None
+            if mtime == old_mtime and ignore_mtime == old_ignore:
+                continue
+            changed = True
+            if ignore_mtime != old_ignore:
+                # A rule change can hide or reveal paths anywhere below this directory, not just its children.
+                self._forget_dir(rel_dir)
+                stack = [rel_dir]
+                while stack:
+                    stack.extend(self._scan_dir(stack.pop()))
+                continue
+            known = {d for d in self._dir_mtimes if d.rsplit("/", 1)[0] == rel_dir and d != rel_dir} if rel_dir else {
+                d for d in self._dir_mtimes if d and "/" not in d
+            }
+            subdirs = set(self._scan_dir(rel_dir))
+            for gone in known - subdirs:
+                self._forget_dir(gone)
+            stack = list(subdirs - known)
+            while stack:
+                stack.extend(self._scan_dir(stack.pop()))
+        return changed
+
+    def _rebuild_snapshot(self) -> None:
+        paths: List[str] = []
+        for rel_dir in sorted(self._files):
+            prefix = rel_dir + "/" if rel_dir else ""
+            paths.extend(prefix + name for name in self._files[rel_dir])
+        snapshot = _Snapshot.build(paths)
+        with self._lock:
+            self._snapshot = snapshot
+            self._generation += 1
@@ -0,0 +1,254 @@
+import codecs
+import mmap
+import os
+from array import array
+from itertools import accumulate
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Callable, List, Optional, Tuple
+
+SNIFF_BYTES = 8192
+# One offset is kept per MARK_STRIDE lines; lines in between are found by scanning forward.
+MARK_STRIDE = 64
+INDEX_CHUNK = 4 * 1024 * 1024
+MAX_LINE_BYTES = 64 * 1024
+MAX_LINE_CHARS = 4096
+HEX_WIDTH = 16
+
+_BOMS: List[Tuple[bytes, str]] = [
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+]
+
+
+def _decodes(data: bytes, encoding: str) -> bool:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        # Not final: the sniffed prefix may end in the middle of a multi-byte character.
+        decoder.decode(data, final=False)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def sniff_encoding(prefix: bytes) -> Tuple[Optional[str], int]:
+    """根据文件开头判断编码，返回 (编码, BOM 长度)；二进制文件编码为 None。"""
+    for bom, encoding in _BOMS:
+        if prefix.startswith(bom):
+            return encoding, len(bom)
+    if b"\0" in prefix:
+        return None, 0
+    control = sum(1 for b in prefix if b < 32 and b not in (9, 10, 12, 13, 27))
+    if prefix and control / len(prefix) > 0.1:
+        return None, 0
+    for encoding in ("utf-8", "gb18030"):
+        if _decodes(prefix, encoding):
+            return encoding, 0
+    return "latin-1", 0
+
+
+class MappedFile:
+    """以 mmap 打开的只读预览文件：按需解码可见行，行偏移索引在后台线程增量建立。
+
+    文本文件只保存每 MARK_STRIDE 行一个偏移量，内存占用与文件大小基本无关；
+    二进制文件按 HEX_WIDTH 字节一行显示十六进制，无需索引。
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        self._mm: Optional[mmap.mmap] = None
+        self.size = 0
+        self._lock = Lock()
+        self._stop = Event()
+        self._indexer: Optional[Thread] = None
+        self._on_progress: Optional[Callable[[], None]] = None
+        self._generation = 0
+        self._map()
+        prefix = self._mm[:SNIFF_BYTES] if self._mm is not None else b""
+        self.encoding, self._bom = sniff_encoding(prefix)
+        self._newline = "\n".encode(self.encoding) if self.encoding else b"\n"
+        self._reset_index()
+
+    @property
+    def is_binary(self) -> bool:
+        return self.encoding is None
+
+    def _map(self) -> None:
+        self.size = os.fstat(self._file.fileno()).st_size
+        # A zero-length file cannot be mapped; an old map is left to the GC because
+        # the indexer thread may still hold a reference to it.
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def _reset_index(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._marks = array("q", [self._bom])
+            self._newlines = 0
+            self._last_start = self._bom
+            self._indexed_to = self._bom
+
+    # ---- index -------------------------------------------------------------------------
+
+    def start_indexing(self, on_progress: Optional[Callable[[], None]] = None) -> None:
+        self._on_progress = on_progress
+        self._ensure_indexer()
+
+    def _ensure_indexer(self) -> None:
+        if self.is_binary or self._stop.is_set():
+            return
+        if self._indexer is not None and self._indexer.is_alive():
+            return
+        self._indexer = Thread(target=self._index_loop, name=f"preview-index-{self.path.name}", daemon=True)
+        self._indexer.start()
+
+    def _index_loop(self) -> None:
+        width = len(self._newline)
+        while not self._stop.is_set():
+            with self._lock:
+                mm, pos, size = self._mm, self._indexed_to, self.size
+                generation, newlines = self._generation, self._newlines
+            if mm is None or pos >= size:
+                break
+            end = min(size, pos + INDEX_CHUNK)
+            count, marks, last_start = self._scan_chunk(mm, pos, end, newlines)
+            with self._lock:
+                if generation != self._generation:
+                    # Truncated while scanning: the index was reset, start over.
+                    continue
+                self._marks.extend(marks)
+                self._newlines += count
+                if count:
+                    self._last_start = last_start
+                # Back off by width-1 bytes so a newline split across chunks is not lost.
+                self._indexed_to = max(end - width + 1, last_start if count else pos) if end < size else end
+            if self._on_progress is not None:
+                self._on_progress()
+
+    def _scan_chunk(self, mm: mmap.mmap, pos: int, end: int, newlines: int) -> Tuple[int, List[int], int]:
+        """统计 [pos, end) 内的换行数，返回 (换行数, 新增的行偏移标记, 最后一行的起点)。"""
+        first = MARK_STRIDE - newlines % MARK_STRIDE
+        if len(self._newline) == 1:
+            # split + accumulate keep the per-line work in C; a find() loop is ~20x slower.
+            parts = mm[pos:end].split(self._newline)
+            count = len(parts) - 1
+            if not count:
+                return 0, [], pos
+            ends = list(accumulate(len(part) + 1 for part in parts[:count]))
+            marks = [pos + ends[k - 1] for k in range(first, count + 1, MARK_STRIDE)]
+            return count, marks, pos + ends[-1]
+        # UTF-16: a newline only counts when it starts on a code unit boundary.
+        count, marks, last_start = 0, [], pos
+        width = len(self._newline)
+        while True:
+            hit = mm.find(self._newline, pos, end)
+            if hit < 0:
+                break
+            if (hit - self._bom) % width:
+                pos = hit + 1
+                continue
+            pos = last_start = hit + width
+            count += 1
+            if count == first or count > first and (count - first) % MARK_STRIDE == 0:
+                marks.append(pos)
+        return count, marks, last_start
+
+    @property
+    def index_complete(self) -> bool:
+        return self.is_binary or self._indexed_to >= self.size
+
+    @property
+    def indexed_bytes(self) -> int:
+        return self.size if self.is_binary else self._indexed_to
+
+    @property
+    def line_count(self) -> int:
+        """目前已知的行数；索引未完成时随后台进度增长。"""
+        if self.is_binary:
+            return (self.size + HEX_WIDTH - 1) // HEX_WIDTH
+        with self._lock:
+            tail = 1 if self._last_start < self._indexed_to or self._newlines == 0 else 0
+            return self._newlines + tail
+
+    def refresh(self) -> bool:
+        """文件增长时重新映射并继续索引（tail-follow）；被截断时重建索引。返回大小是否变化。"""
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size == self.size:
+                return False
+            with self._lock:
+                truncated = size < self.size
+                self._map()
+        except (OSError, ValueError):
+            return False
+        if truncated:
+            self._reset_index()
+        self._ensure_indexer()
+        return True
+
+    # ---- reading -----------------------------------------------------------------------
+
+    def _line_start(self, mm: mmap.mmap, line_no: int) -> int:
+        with self._lock:
+            slot = min(line_no // MARK_STRIDE, len(self._marks) - 1)
+            mark = self._marks[slot]
+        skip = line_no - slot * MARK_STRIDE
+        pos, width = mark, len(self._newline)
+        while skip > 0:
+            hit = mm.find(self._newline, pos)
+            if hit < 0:
+                return self.size
+            pos = hit + width
+            if width > 1 and (hit - self._bom) % width:
+                pos = hit + 1
+                continue
+            skip -= 1
+        return pos
+
+    def lines(self, start: int, count: int) -> List[str]:
+        """解码第 start 行（0 起）开始的至多 count 行；超长行截断显示。"""
+        mm = self._mm
+        if mm is None or count <= 0:
+            return []
+        if self.is_binary:
+            return [self._hex_line(mm, i) for i in range(start, min(start + count, self.line_count))]
+        out: List[str] = []
+        # The map may be older than self.size while a refresh is in flight.
+        size = len(mm)
+        pos = self._line_start(mm, start)
+        width = len(self._newline)
+        while len(out) < count and pos < size:
+            end = mm.find(self._newline, pos, min(size, pos + MAX_LINE_BYTES))
+            while end >= 0 and width > 1 and (end - self._bom) % width:
+                end = mm.find(self._newline, end + 1, min(size, pos + MAX_LINE_BYTES))
+            if end < 0:
+                raw = mm[pos:min(size, pos + MAX_LINE_BYTES)]
+                full_end = mm.find(self._newline, pos + len(raw))
+                next_pos = size if full_end < 0 else full_end + width
+            else:
+                raw = mm[pos:end]
+                next_pos = end + width
+            text = raw.decode(self.encoding, errors="replace").rstrip("\r")
+            if len(text) > MAX_LINE_CHARS or end < 0 and next_pos < size:
+                text = text[:MAX_LINE_CHARS] + " …"
+            out.append(text)
+            pos = next_pos
+        return out
+
+    def _hex_line(self, mm: mmap.mmap, line_no: int) -> str:
+        offset = line_no * HEX_WIDTH
+        chunk = mm[offset:offset + HEX_WIDTH]
+        hex_part = " ".join(f"{b:02x}" for b in chunk)
+        text_part = "".join(chr(b) if 32 <= b < 127 else "." for b in chunk)
+        return f"{offset:08x}  {hex_part:<{HEX_WIDTH * 3 - 1}}  {text_part}"
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._indexer is not None:
+            self._indexer.join(timeout=1)
+        self._mm = None
+        try:
+            self._file.close()
+        except OSError:
+            pass
@@ -0,0 +1,81 @@
+import subprocess
+from dataclasses import asdict, dataclass
+from threading import Event, Lock
+from typing import Dict, Optional
+
+from .process_group import kill_group
+
+DEFAULT_HEDGE_DELAY_SEC = 10.0
+HEDGE_PERCENTILE = 95
+
+
+class RunHandle:
+    """一次 CLI 运行的句柄：记录进程、首行输出事件，并允许另一线程取消（整组结束）该运行。"""
+
+    def __init__(self) -> None:
+        self.proc: Optional[subprocess.Popen] = None
+        self.first_output = Event()
+        self.cancelled = Event()
+        self._lock = Lock()
+
+    def attach(self, proc: subprocess.Popen) -> None:
+        with self._lock:
+            self.proc = proc
+            cancelled = self.cancelled.is_set()
+        if cancelled:
+            kill_group(proc)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled.set()
+            proc = self.proc
+        if proc is not None and proc.poll() is None:
+            kill_group(proc)
+
+
+class HedgeBudget:
+    """对冲预算（类似 gRPC 的重试预算）：每次主运行积累 ratio 个令牌，每次备份运行消耗 1 个，上限 burst。
+
+    保证长期看备份运行数不超过主运行数的 ratio 倍，突发的慢启动也不会让 CLI 进程数翻倍。
+    """
+
+    def __init__(self, ratio: float, burst: float = 3.0) -> None:
+        self.ratio = max(0.0, ratio)
+        self.burst = max(1.0, burst)
+        self._tokens = self.burst
+        self._lock = Lock()
+
+    def on_primary(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._tokens < 1.0:
+                return False
+            self._tokens -= 1.0
+            return True
+
+
+@dataclass
+class HedgeStats:
+    primary_runs: int = 0
+    hedges_launched: int = 0
+    hedges_denied: int = 0
+    backup_wins: int = 0
+    primary_wins: int = 0
+    # Elapsed time of calls the backup won; every abandoned primary was still unfinished at that point.
+    backup_win_sec: float = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        data = asdict(self)
+        data["extra_run_ratio"] = self.hedges_launched / self.primary_runs if self.primary_runs else 0.0
+        return data
+
+    def summary(self) -> str:
+        ratio = self.as_dict()["extra_run_ratio"]
+        return (
+            f"对冲统计：主运行 {self.primary_runs}，备份 {self.hedges_launched}（额外开销 {ratio:.1%}），"
+            f"备份胜出 {self.backup_wins}，主运行胜出 {self.primary_wins}，预算拒绝 {self.hedges_denied}，"
+            f"备份胜出的调用累计耗时 {self.backup_win_sec:.1f}s（此时主运行均未完成）"
+        )
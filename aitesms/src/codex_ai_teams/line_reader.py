@@ -0,0 +1,124 @@
+import codecs
+import os
+import selectors
+from queue import Queue
+from threading import Lock, Thread
+from typing import IO, Dict, Optional
+
+READ_CHUNK = 65536
+
+
+class _Stream:
+    def __init__(self, out: "Queue[Optional[str]]") -> None:
+        self.out = out
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.pending = ""
+
+    def feed(self, data: bytes) -> None:
+        text = self.pending + self.decoder.decode(data, final=not data)
+        if not data:
+            if text:
+                self.out.put(text)
+            self.out.put(None)
+            return
+        *lines, self.pending = text.split("\n")
+        for line in lines:
+            self.out.put(line + "\n")
+
+
+class LineReader:
+    """所有 CLI 子进程的 stdout 共用一个读线程：POSIX 上用 selectors 多路复用，逐行放入各自的队列，EOF 时放入 None。
+
+    Windows 的匿名管道不支持 select，退化为每个管道一个读线程，行为一致。
+    """
+
+    def __init__(self) -> None:
+        self._multiplexed = os.name != "nt"
+        self._streams: Dict[int, _Stream] = {}
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._closed = False
+        if self._multiplexed:
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ)
+
+    def register(self, pipe: Optional[IO], out: "Queue[Optional[str]]") -> None:
+        if pipe is None or self._closed:
+            out.put(None)
+            return
+        if not self._multiplexed:
+            Thread(target=self._read_blocking, args=(pipe, out), name="cli-reader", daemon=True).start()
+            return
+        fd = pipe.fileno()
+        os.set_blocking(fd, False)
+        with self._lock:
+            self._streams[fd] = _Stream(out)
+            self._selector.register(fd, selectors.EVENT_READ)
+            if self._thread is None:
+                self._thread = Thread(target=self._loop, name="cli-line-reader", daemon=True)
+                self._thread.start()
+        os.write(self._wake_w, b"\0")
+
+    @staticmethod
+    def _read_blocking(pipe: IO, out: "Queue[Optional[str]]") -> None:
+        try:
+            for raw in pipe:
+                out.put(raw)
+        except (OSError, ValueError):
+            pass
+        finally:
+            out.put(None)
+
+    def _loop(self) -> None:
+        try:
+            while not self._closed:
+                self._poll_once()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._release()
+
+    def _poll_once(self) -> None:
+        for key, _ in self._selector.select():
+            fd = key.fd
+            if fd == self._wake_r:
+                try:
+                    os.read(fd, 4096)
+                except OSError:
+                    pass
+                continue
+            try:
+                data = os.read(fd, READ_CHUNK)
+            except BlockingIOError:
+                continue
+            except OSError:
+                data = b""
+            with self._lock:
+                stream = self._streams.get(fd)
+                if stream is not None and not data:
+                    self._streams.pop(fd)
+                    self._selector.unregister(fd)
+            if stream is not None:
+                stream.feed(data)
+
+    def _release(self) -> None:
+        self._selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def close(self) -> None:
+        if not self._multiplexed or self._closed:
+            return
+        self._closed = True
+        if self._thread is None:
+            self._release()
+        else:
+            os.write(self._wake_w, b"\0")
+        with self._lock:
+            streams = list(self._streams.values())
+            self._streams.clear()
+        # Readers waiting on these queues see EOF instead of hanging.
+        for stream in streams:
+            stream.out.put(None)
@@ -0,0 +1,170 @@
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from queue import Empty, Queue
+from threading import Condition, Lock, Thread
+from typing import Iterator, List, Optional, Union
+
+from .models import LogEntry
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    agent_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    level TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_logs_agent_ts ON logs (agent_id, ts);
+CREATE INDEX IF NOT EXISTS idx_logs_level ON logs (level, id);
+CREATE TABLE IF NOT EXISTS chat (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    agent_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_agent_ts ON chat (agent_id, ts);
+"""
+
+
+@dataclass
+class ChatRecord:
+    ts: str
+    agent_id: str
+    role: str
+    content: str
+
+
+_Pending = Union[LogEntry, ChatRecord]
+
+
+class LogStore:
+    """日志与对话记录的 SQLite 持久化：WAL 模式，后台写线程批量提交，读取按 id 倒序分页。"""
+
+    def __init__(
+        self,
+        db_path: Path,
+        mirror_path: Optional[Path] = None,
+        batch_size: int = 200,
+        flush_interval_sec: float = 0.05,
+    ) -> None:
+        self.db_path = db_path
+        self.mirror_path = mirror_path
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_sec
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._reader = self._connect()
+        self._reader.executescript(_SCHEMA)
+        self._reader_lock = Lock()
+        self._queue: "Queue[Optional[_Pending]]" = Queue()
+        self._pending = 0
+        self._pending_cond = Condition()
+        self._writer = Thread(target=self._write_loop, name="log-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def add_log(self, entry: LogEntry) -> None:
+        self._enqueue(entry)
+
+    def add_chat(self, record: ChatRecord) -> None:
+        self._enqueue(record)
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """等待已入队的记录全部落盘。"""
+        with self._pending_cond:
+            return self._pending_cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def _enqueue(self, item: _Pending) -> None:
+        with self._pending_cond:
+            self._pending += 1
+        self._queue.put(item)
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+        with self._reader_lock:
+            self._reader.close()
+
+    def recent_logs(self, limit: int, skip: int = 0) -> List[LogEntry]:
+        """跳过最新的 skip 条后，按时间正序返回最近 limit 条日志。"""
+        rows = self._query_page("SELECT ts, agent_id, status, level, message FROM logs", limit, skip)
+        return [LogEntry(ts=row[0], agent_id=row[1], status=row[2], level=row[3], message=row[4]) for row in rows]
+
+    def recent_chat(self, limit: int, skip: int = 0) -> List[ChatRecord]:
+        rows = self._query_page("SELECT ts, agent_id, role, content FROM chat", limit, skip)
+        return [ChatRecord(ts=row[0], agent_id=row[1], role=row[2], content=row[3]) for row in rows]
+
+    def iter_logs(self) -> Iterator[LogEntry]:
+        with self._reader_lock:
+            rows = self._reader.execute("SELECT ts, agent_id, status, level, message FROM logs ORDER BY id").fetchall()
+        for row in rows:
+            yield LogEntry(ts=row[0], agent_id=row[1], status=row[2], level=row[3], message=row[4])
+
+    def _query_page(self, sql: str, limit: int, skip: int) -> List[tuple]:
+        # The UI always holds the newest rows, so pages are addressed by how many newest rows to skip.
+        with self._reader_lock:
+            rows = self._reader.execute(sql + " ORDER BY id DESC LIMIT ? OFFSET ?", (limit, skip)).fetchall()
+        rows.reverse()
+        return rows
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            batch: List[_Pending] = []
+            if first is None:
+                stopping = True
+            else:
+                batch.append(first)
+            # Linger briefly so bursts of log lines share one transaction.
+            deadline = time.monotonic() + self.flush_interval_sec
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                self._write_batch(conn, batch)
+                with self._pending_cond:
+                    self._pending -= len(batch)
+                    self._pending_cond.notify_all()
+        conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[_Pending]) -> None:
+        logs = [x for x in batch if isinstance(x, LogEntry)]
+        chats = [x for x in batch if isinstance(x, ChatRecord)]
+        try:
+            with conn:
+                if logs:
+                    conn.executemany(
+                        "INSERT INTO logs (ts, agent_id, status, level, message) VALUES (?, ?, ?, ?, ?)",
+                        [(x.ts, x.agent_id, x.status, x.level, x.message) for x in logs],
+                    )
+                if chats:
+                    conn.executemany(
+                        "INSERT INTO chat (ts, agent_id, role, content) VALUES (?, ?, ?, ?)",
+                        [(x.ts, x.agent_id, x.role, x.content) for x in chats],
+                    )
+        except sqlite3.Error:
+            pass
+        if logs and self.mirror_path is not None:
+            # Keep the plain-text runtime.log for tailing outside the app.
+            try:
+                with self.mirror_path.open("a", encoding="utf-8") as f:
+                    f.writelines(f"{x.ts}\t{x.agent_id}\t{x.status}\t{x.level}\t{x.message}\n" for x in logs)
+            except OSError:
+                pass
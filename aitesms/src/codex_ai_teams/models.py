@@ -1,5 +1,6 @@
-﻿from dataclasses import dataclass
+﻿from dataclasses import dataclass, field
 from enum import Enum
+from typing import Dict
 
 
 class AgentStatus(str, Enum):
@@ -20,6 +21,8 @@ class AgentConfig:
     session_id: str = ""
     extra_params: str = ""
     enabled: bool = True
+    # "" runs on this machine, "auto" on the least-loaded configured host, anything else names a host.
+    host: str = ""
 
 
 @dataclass
@@ -28,6 +31,7 @@ class AgentResult:
     role: str
     status: AgentStatus
     content: str
+    metrics: Dict[str, float] = field(default_factory=dict)
 
 
 @dataclass
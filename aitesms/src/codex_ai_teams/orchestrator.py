@@ -1,15 +1,62 @@
-﻿from concurrent.futures import ThreadPoolExecutor, as_completed
+﻿import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Callable, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 
 from .bridge_adapter import BridgeAdapter
+from .config import WorkflowStage
 from .models import AgentConfig, AgentLogEvent, AgentResult, AgentStatus
 
+StageRunner = Callable[[AgentConfig, str], AgentResult]
+# Work beyond this many agents queues in the pool; the runtime bounds CLI concurrency separately.
+MAX_POOL_WORKERS = 16
+
+
+@dataclass
+class StageRun:
+    stage_id: str
+    agent_id: str
+    status: AgentStatus
+    content: str = ""
+    started_sec: float = 0.0
+    finished_sec: float = 0.0
+
+    @property
+    def duration_sec(self) -> float:
+        return max(0.0, self.finished_sec - self.started_sec)
+
+
+@dataclass
+class WorkflowReport:
+    stages: List[StageRun] = field(default_factory=list)
+    elapsed_sec: float = 0.0
+    critical_path: List[str] = field(default_factory=list)
+    critical_path_sec: float = 0.0
+
+    def summary_lines(self) -> List[str]:
+        lines = [
+            f"流程总耗时 {self.elapsed_sec:.1f}s，关键路径 {' -> '.join(self.critical_path) or '-'}（{self.critical_path_sec:.1f}s）"
+        ]
+        for run in sorted(self.stages, key=lambda r: r.started_sec):
+            lines.append(
+                f"阶段 {run.stage_id}[{run.agent_id}] {run.status.value} "
+                f"开始 +{run.started_sec:.1f}s，耗时 {run.duration_sec:.1f}s"
+            )
+        return lines
+
 
 class Orchestrator:
-    def __init__(self, agents: List[AgentConfig], bridge: BridgeAdapter) -> None:
+    def __init__(self, agents: List[AgentConfig], bridge: Optional[BridgeAdapter] = None) -> None:
         self.agents = agents
         self.bridge = bridge
+        # Reused across runs; pairs with the bridge's keep-alive pool instead of a fresh pool per call.
+        self._pool = ThreadPoolExecutor(max_workers=max(1, min(len(agents), MAX_POOL_WORKERS)), thread_name_prefix="orchestrator")
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if self.bridge is not None:
+            self.bridge.close()
 
     def run_parallel(
         self,
@@ -18,6 +65,8 @@ class Orchestrator:
         on_finished: Callable[[List[AgentResult]], None],
         on_agent_log: Optional[Callable[[AgentLogEvent], None]] = None,
     ) -> None:
+        if self.bridge is None:
+            raise RuntimeError("run_parallel 需要配置 BridgeAdapter")
         results: List[AgentResult] = []
 
         def emit_log(agent: AgentConfig, status: AgentStatus, msg: str) -> None:
@@ -27,8 +76,14 @@ class Orchestrator:
         def worker(agent: AgentConfig) -> AgentResult:
             emit_log(agent, AgentStatus.RUNNING, f"{datetime.now().strftime('%H:%M:%S')} 接收主任务")
             emit_log(agent, AgentStatus.RUNNING, f"{datetime.now().strftime('%H:%M:%S')} 开始执行，temperature={agent.temperature}")
+
+            def on_chunk(text: str) -> None:
+                lines = text.strip().splitlines()
+                if lines:
+                    emit_log(agent, AgentStatus.RUNNING, f"回复片段> {lines[0]}")
+
             try:
-                result = self.bridge.execute(agent, task_text)
+                result = self.bridge.execute(agent, task_text, on_chunk=on_chunk if on_agent_log else None)
             except Exception as exc:  # noqa: BLE001
                 result = AgentResult(
                     agent_id=agent.agent_id,
@@ -39,11 +94,117 @@ class Orchestrator:
             emit_log(agent, result.status, f"{datetime.now().strftime('%H:%M:%S')} 执行结束: {result.status.value}")
             return result
 
-        with ThreadPoolExecutor(max_workers=max(1, len(self.agents))) as pool:
-            futures = {pool.submit(worker, agent): agent for agent in self.agents}
-            for future in as_completed(futures):
-                result = future.result()
-                results.append(result)
-                on_agent_update(result)
+        futures = {self._pool.submit(worker, agent): agent for agent in self.agents}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            on_agent_update(result)
 
         on_finished(results)
+
+    def run_workflow(
+        self,
+        task_text: str,
+        stages: List[WorkflowStage],
+        on_stage_update: Callable[[StageRun, AgentResult], None],
+        on_agent_log: Optional[Callable[[AgentLogEvent], None]] = None,
+        runner: Optional[StageRunner] = None,
+    ) -> WorkflowReport:
+        """按依赖关系执行多阶段流程：阶段的输入全部就绪即派发，上游输出拼入下游 prompt。"""
+        if runner is None:
+            if self.bridge is None:
+                raise RuntimeError("run_workflow 需要 runner 或 BridgeAdapter")
+            runner = self.bridge.execute
+        agents_by_id = {a.agent_id: a for a in self.agents}
+        stage_map = {stage.stage_id: stage for stage in stages}
+        runs: Dict[str, StageRun] = {}
+        outputs: Dict[str, str] = {}
+        started = time.perf_counter()
+
+        def emit_log(agent: AgentConfig, status: AgentStatus, msg: str) -> None:
+            if on_agent_log:
+                on_agent_log(AgentLogEvent(agent_id=agent.agent_id, role=agent.role, status=status, message=msg))
+
+        def build_prompt(stage: WorkflowStage) -> str:
+            inputs = "\n\n".join(f"[{dep}] {outputs.get(dep, '')}" for dep in stage.depends_on)
+            template = stage.prompt or ("{task}\n\n上游阶段输出：\n{inputs}" if stage.depends_on else "{task}")
+            # Plain replace rather than str.format: user text and agent replies often contain braces.
+            return template.replace("{task}", task_text).replace("{inputs}", inputs)
+
+        def worker(stage: WorkflowStage, prompt: str) -> AgentResult:
+            agent = agents_by_id[stage.agent_id]
+            runs[stage.stage_id].started_sec = time.perf_counter() - started
+            emit_log(agent, AgentStatus.RUNNING, f"流程阶段 {stage.stage_id} 开始执行")
+            try:
+                return runner(agent, prompt)
+            except Exception as exc:  # noqa: BLE001
+                return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"执行失败: {exc}")
+
+        remaining = {stage.stage_id: set(stage.depends_on) for stage in stages}
+        in_flight: Dict[Future, WorkflowStage] = {}
+
+        def submit_ready() -> None:
+            for stage_id, deps in list(remaining.items()):
+                if deps:
+                    continue
+                stage = stage_map[stage_id]
+                remaining.pop(stage_id)
+                runs[stage_id] = StageRun(stage_id, stage.agent_id, AgentStatus.RUNNING)
+                in_flight[self._pool.submit(worker, stage, build_prompt(stage))] = stage
+
+        def settle(stage: WorkflowStage, result: AgentResult) -> None:
+            run = runs[stage.stage_id]
+            run.status = result.status
+            run.content = result.content
+            run.finished_sec = time.perf_counter() - started
+            outputs[stage.stage_id] = result.content
+            on_stage_update(run, result)
+            for stage_id, deps in list(remaining.items()):
+                if stage_id not in remaining or stage.stage_id not in deps:
+                    continue
+                if result.status == AgentStatus.DONE:
+                    deps.discard(stage.stage_id)
+                    continue
+                # A failed input poisons every downstream stage without running it.
+                blocked = stage_map[stage_id]
+                remaining.pop(stage_id)
+                runs[stage_id] = StageRun(stage_id, blocked.agent_id, AgentStatus.RUNNING, started_sec=run.finished_sec)
+                agent = agents_by_id[blocked.agent_id]
+                settle(blocked, AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, f"上游阶段 {stage.stage_id} 失败，跳过执行"))
+
+        submit_ready()
+        while in_flight:
+            done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+            for fut in done:
+                settle(in_flight.pop(fut), fut.result())
+            submit_ready()
+
+        report = WorkflowReport(stages=[runs[s.stage_id] for s in stages if s.stage_id in runs])
+        report.elapsed_sec = time.perf_counter() - started
+        report.critical_path, report.critical_path_sec = self._critical_path(stages, runs)
+        return report
+
+    def _critical_path(self, stages: List[WorkflowStage], runs: Dict[str, StageRun]) -> Tuple[List[str], float]:
+        # Stages are validated acyclic at load time, so a memoised DFS over depends_on terminates.
+        stage_map = {stage.stage_id: stage for stage in stages}
+        best: Dict[str, float] = {}
+        via: Dict[str, Optional[str]] = {}
+
+        def longest(stage_id: str) -> float:
+            if stage_id in best:
+                return best[stage_id]
+            prev = max(stage_map[stage_id].depends_on, key=longest, default=None)
+            run = runs.get(stage_id)
+            best[stage_id] = (longest(prev) if prev else 0.0) + (run.duration_sec if run else 0.0)
+            via[stage_id] = prev
+            return best[stage_id]
+
+        if not stages:
+            return [], 0.0
+        tail = max(stage_map, key=longest)
+        path: List[str] = []
+        node: Optional[str] = tail
+        while node:
+            path.append(node)
+            node = via[node]
+        return list(reversed(path)), best[tail]
@@ -0,0 +1,67 @@
+import os
+import signal
+import subprocess
+import sys
+from typing import Any, Dict
+
+_WINDOWS = sys.platform.startswith("win")
+
+
+def new_group_kwargs() -> Dict[str, Any]:
+    """Popen 参数：让子进程成为新进程组（POSIX 为新 session）的组长，便于整组结束。"""
+    if _WINDOWS:
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def _signal_group(proc: subprocess.Popen, sig: int) -> None:
+    # The leader's pid is the group id; it stays reserved while any member is alive,
+    # so signalling it after the leader exited still reaches only our own stragglers.
+    try:
+        os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def kill_group(proc: subprocess.Popen) -> None:
+    """立即强制结束进程及其整个进程组。"""
+    if _WINDOWS:
+        # Windows pids are recycled immediately, so only walk the tree while the leader is alive.
+        if proc.poll() is not None:
+            return
+        subprocess.run(
+            ["taskkill", "/PID", str(proc.pid), "/T", "/F"],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=False,
+        )
+    else:
+        _signal_group(proc, signal.SIGKILL)
+    try:
+        proc.kill()
+    except OSError:
+        pass
+
+
+def terminate_group(proc: subprocess.Popen, grace_sec: float) -> bool:
+    """先礼后兵：SIGTERM（Windows 为 CTRL_BREAK）整组，等待 grace_sec 后对残留进程 SIGKILL。
+
+    返回调用前进程是否仍在运行。
+    """
+    was_running = proc.poll() is None
+    try:
+        if _WINDOWS:
+            if was_running:
+                proc.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            _signal_group(proc, signal.SIGTERM)
+        proc.wait(timeout=grace_sec)
+    except (subprocess.TimeoutExpired, OSError):
+        pass
+    # Always sweep the group: tools spawned by the CLI may ignore SIGTERM or outlive the leader.
+    kill_group(proc)
+    try:
+        proc.wait(timeout=1)
+    except subprocess.TimeoutExpired:
+        pass
+    return was_running
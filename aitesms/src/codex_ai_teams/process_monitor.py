@@ -0,0 +1,245 @@
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Set, Tuple
+
+try:
+    import psutil  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    psutil = None
+
+_PROC = Path("/proc")
+
+
+@dataclass
+class ProcessSample:
+    cpu_percent: float = 0.0
+    rss_bytes: int = 0
+    open_fds: int = 0
+    process_count: int = 0
+
+    def merge(self, other: "ProcessSample") -> None:
+        self.cpu_percent += other.cpu_percent
+        self.rss_bytes += other.rss_bytes
+        self.open_fds += other.open_fds
+        self.process_count += other.process_count
+
+
+@dataclass
+class ResourceStats:
+    current: ProcessSample
+    peak_cpu_percent: float = 0.0
+    peak_rss_bytes: int = 0
+    peak_open_fds: int = 0
+
+    def observe(self, sample: ProcessSample) -> None:
+        self.current = sample
+        self.peak_cpu_percent = max(self.peak_cpu_percent, sample.cpu_percent)
+        self.peak_rss_bytes = max(self.peak_rss_bytes, sample.rss_bytes)
+        self.peak_open_fds = max(self.peak_open_fds, sample.open_fds)
+
+    def as_metrics(self) -> Dict[str, float]:
+        return {
+            "peak_cpu_percent": round(self.peak_cpu_percent, 1),
+            "peak_rss_mb": round(self.peak_rss_bytes / (1024 * 1024), 1),
+            "peak_open_fds": self.peak_open_fds,
+        }
+
+
+class _ProcfsReader:
+    """直接读取 /proc，避免为每次采样创建对象；CPU 按两次采样间 utime+stime 的差值计算。"""
+
+    def __init__(self) -> None:
+        self._hz = os.sysconf("SC_CLK_TCK")
+        self._page = os.sysconf("SC_PAGE_SIZE")
+        self._prev: Dict[int, Tuple[float, int]] = {}
+
+    def tree(self, root: int) -> List[int]:
+        pids, stack = [], [root]
+        while stack:
+            pid = stack.pop()
+            pids.append(pid)
+            stack.extend(self._children(pid))
+        return pids
+
+    def _children(self, pid: int) -> List[int]:
+        out: List[int] = []
+        try:
+            tasks = list((_PROC / str(pid) / "task").iterdir())
+        except OSError:
+            return out
+        for task in tasks:
+            try:
+                out.extend(int(x) for x in (task / "children").read_text().split())
+            except OSError:
+                continue
+        return out
+
+    def sample(self, pid: int, now: float) -> Optional[ProcessSample]:
+        base = _PROC / str(pid)
+        try:
+            stat = (base / "stat").read_text()
+            rss_pages = int((base / "statm").read_text().split()[1])
+        except (OSError, IndexError, ValueError):
+            self._prev.pop(pid, None)
+            return None
+        # comm may contain spaces and parens; fields after the last ')' start at field 3 (state).
+        fields = stat[stat.rfind(")") + 2 :].split()
+        ticks = int(fields[11]) + int(fields[12])
+        cpu = 0.0
+        prev = self._prev.get(pid)
+        if prev is not None and now > prev[0]:
+            cpu = (ticks - prev[1]) / self._hz / (now - prev[0]) * 100.0
+        self._prev[pid] = (now, ticks)
+        try:
+            fds = len(os.listdir(base / "fd"))
+        except OSError:
+            fds = 0
+        return ProcessSample(max(0.0, cpu), rss_pages * self._page, fds, 1)
+
+    def forget(self, alive: Set[int]) -> None:
+        for pid in [p for p in self._prev if p not in alive]:
+            del self._prev[pid]
+
+
+class _PsutilReader:
+    def __init__(self) -> None:
+        self._procs: Dict[int, "psutil.Process"] = {}
+
+    def tree(self, root: int) -> List[int]:
+        try:
+            proc = self._process(root)
+            return [root] + [child.pid for child in proc.children(recursive=True)]
+        except psutil.Error:
+            return [root]
+
+    def _process(self, pid: int) -> "psutil.Process":
+        proc = self._procs.get(pid)
+        if proc is None:
+            proc = self._procs[pid] = psutil.Process(pid)
+            # The first cpu_percent call only primes the counter.
+            proc.cpu_percent(None)
+        return proc
+
+    def sample(self, pid: int, now: float) -> Optional[ProcessSample]:
+        try:
+            proc = self._process(pid)
+            with proc.oneshot():
+                cpu = proc.cpu_percent(None)
+                rss = proc.memory_info().rss
+                fds = proc.num_fds() if hasattr(proc, "num_fds") else proc.num_handles()
+        except psutil.Error:
+            self._procs.pop(pid, None)
+            return None
+        return ProcessSample(cpu, rss, fds, 1)
+
+    def forget(self, alive: Set[int]) -> None:
+        for pid in [p for p in self._procs if p not in alive]:
+            del self._procs[pid]
+
+
+class ProcessMonitor:
+    """按固定间隔采样各 agent 的 CLI 进程树（含子进程），汇总 CPU%、RSS、打开的文件描述符数。
+
+    Linux 下直接读 /proc，其他平台在安装了 psutil 时使用 psutil，都不可用时 available 为 False。
+    """
+
+    def __init__(self, interval_sec: float = 1.0) -> None:
+        self.interval_sec = interval_sec
+        if _PROC.joinpath("self", "stat").exists():
+            self._reader = _ProcfsReader()
+        elif psutil is not None:
+            self._reader = _PsutilReader()
+        else:
+            self._reader = None
+        self._roots: Dict[int, str] = {}
+        self._agent_stats: Dict[str, ResourceStats] = {}
+        self._run_stats: Dict[int, ResourceStats] = {}
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    @property
+    def available(self) -> bool:
+        return self._reader is not None and self.interval_sec > 0
+
+    def start(self) -> None:
+        if not self.available or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._loop, name="process-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def watch(self, agent_id: str, pid: int) -> None:
+        with self._lock:
+            self._roots[pid] = agent_id
+            self._run_stats[pid] = ResourceStats(ProcessSample())
+            self._agent_stats.setdefault(agent_id, ResourceStats(ProcessSample()))
+
+    def unwatch(self, pid: int) -> Dict[str, float]:
+        """停止跟踪一个 CLI 进程，返回该次运行的峰值指标。"""
+        with self._lock:
+            agent_id = self._roots.pop(pid, None)
+            run = self._run_stats.pop(pid, None)
+            if agent_id is not None and agent_id not in self._roots.values():
+                stats = self._agent_stats.get(agent_id)
+                if stats is not None:
+                    stats.current = ProcessSample()
+        return run.as_metrics() if run is not None and self.available else {}
+
+    def stats(self, agent_id: str) -> Optional[ResourceStats]:
+        with self._lock:
+            stats = self._agent_stats.get(agent_id)
+            if stats is None:
+                return None
+            return ResourceStats(
+                ProcessSample(**vars(stats.current)),
+                stats.peak_cpu_percent,
+                stats.peak_rss_bytes,
+                stats.peak_open_fds,
+            )
+
+    def sample_once(self) -> None:
+        if self._reader is None:
+            return
+        with self._lock:
+            roots = dict(self._roots)
+        now = time.monotonic()
+        per_root: Dict[int, ProcessSample] = {}
+        alive: Set[int] = set()
+        for root in roots:
+            total = ProcessSample()
+            for pid in self._reader.tree(root):
+                sample = self._reader.sample(pid, now)
+                if sample is not None:
+                    alive.add(pid)
+                    total.merge(sample)
+            per_root[root] = total
+        self._reader.forget(alive)
+
+        with self._lock:
+            per_agent: Dict[str, ProcessSample] = {}
+            for root, sample in per_root.items():
+                # Skip roots unwatched while this sample was being taken.
+                run = self._run_stats.get(root)
+                if run is None:
+                    continue
+                run.observe(sample)
+                per_agent.setdefault(roots[root], ProcessSample()).merge(sample)
+            for agent_id, sample in per_agent.items():
+                self._agent_stats[agent_id].observe(sample)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            try:
+                self.sample_once()
+            except Exception:  # noqa: BLE001
+                continue
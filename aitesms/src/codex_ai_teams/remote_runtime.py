@@ -0,0 +1,256 @@
+import json
+import os
+import socket
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from threading import Lock
+from typing import IO, Callable, Dict, List, Optional
+
+from .config import HostSettings
+from .models import AgentConfig, AgentLogEvent, AgentResult, AgentStatus
+
+PROTOCOL_VERSION = 1
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+CONNECT_TIMEOUT_SEC = 5.0
+STATUS_TTL_SEC = 3.0
+# The host pings every HEARTBEAT_SEC while a run is in progress; silence beyond this means the link is gone.
+READ_TIMEOUT_SEC = 60.0
+HEARTBEAT_SEC = 15.0
+BACKOFF_MIN_SEC = 2.0
+BACKOFF_MAX_SEC = 60.0
+
+
+class HostUnavailable(Exception):
+    def __init__(self, message: str, request_sent: bool = False) -> None:
+        super().__init__(message)
+        # False: nothing reached the host, so the run can safely go elsewhere.
+        self.request_sent = request_sent
+
+
+def send_message(wfile: IO[bytes], message: Dict[str, object]) -> None:
+    wfile.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+    wfile.flush()
+
+
+def read_message(rfile: IO[bytes]) -> Optional[Dict[str, object]]:
+    """读一行 JSON；连接关闭返回 None。"""
+    line = rfile.readline(MAX_MESSAGE_BYTES + 1)
+    if not line:
+        return None
+    if len(line) > MAX_MESSAGE_BYTES:
+        raise ValueError("消息过大")
+    data = json.loads(line.decode("utf-8"))
+    if not isinstance(data, dict):
+        raise ValueError("消息必须是 JSON 对象")
+    return data
+
+
+@dataclass
+class HostState:
+    settings: HostSettings
+    running: int = 0
+    cpus: int = 1
+    load_avg: float = -1.0
+    checked_at: float = 0.0
+    inflight: int = 0
+    down_until: float = 0.0
+    backoff_sec: float = 0.0
+    last_error: str = ""
+
+    @property
+    def up(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    def score(self) -> tuple:
+        # Runs this GUI started count immediately; the host's own count catches other clients. Load only breaks ties.
+        busy = max(self.running, self.inflight)
+        load = self.load_avg / self.cpus if self.load_avg >= 0 else 0.0
+        return busy / max(1, self.settings.max_runs), load
+
+
+class HostClient:
+    """一次请求一条 TCP 连接；连接失败抛 HostUnavailable，由 HostPool 负责退避与重连。"""
+
+    def __init__(self, settings: HostSettings) -> None:
+        self.settings = settings
+        host, _, port = settings.address.rpartition(":")
+        self._addr = (host.strip("[]"), int(port))
+
+    def _connect(self) -> socket.socket:
+        try:
+            sock = socket.create_connection(self._addr, timeout=CONNECT_TIMEOUT_SEC)
+        except OSError as exc:
+            raise HostUnavailable(f"无法连接主机 {self.settings.name}（{self.settings.address}）: {exc}") from exc
+        sock.settimeout(READ_TIMEOUT_SEC)
+        return sock
+
+    def request(
+        self,
+        op: str,
+        payload: Optional[Dict[str, object]] = None,
+        on_event: Optional[Callable[[Dict[str, object]], None]] = None,
+    ) -> Dict[str, object]:
+        """发送请求并读到 reply/result/error 为止；中间的 log 事件交给 on_event。"""
+        sock = self._connect()
+        try:
+            with sock, sock.makefile("rb") as rfile, sock.makefile("wb") as wfile:
+                send_message(wfile, {"op": op, "token": self.settings.token, **(payload or {})})
+                while True:
+                    message = read_message(rfile)
+                    if message is None:
+                        raise HostUnavailable(f"主机 {self.settings.name} 在返回结果前断开了连接", True)
+                    event = message.get("event")
+                    if event == "error":
+                        raise RuntimeError(f"主机 {self.settings.name} 拒绝请求: {message.get('message')}")
+                    if event in ("reply", "result"):
+                        return message
+                    if event == "log" and on_event is not None:
+                        on_event(message)
+        except (OSError, ValueError) as exc:
+            raise HostUnavailable(f"与主机 {self.settings.name} 的连接中断: {exc}", True) from exc
+
+
+class HostPool:
+    """远程 agent 主机集合：健康检查与指数退避、按负载放置（粘性，会话只存在于创建它的主机上），放置结果持久化。"""
+
+    def __init__(self, hosts: List[HostSettings], placements_path: Optional[Path] = None) -> None:
+        self.clients: Dict[str, HostClient] = {h.name: HostClient(h) for h in hosts}
+        self.states: Dict[str, HostState] = {h.name: HostState(h) for h in hosts}
+        self.placements_path = placements_path
+        self._placements: Dict[str, str] = {}
+        self._lock = Lock()
+        self._load_placements()
+
+    def _load_placements(self) -> None:
+        if self.placements_path is None or not self.placements_path.exists():
+            return
+        try:
+            data = json.loads(self.placements_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if isinstance(data, dict):
+            self._placements = {str(k): str(v) for k, v in data.items()}
+
+    def _save_placements(self) -> None:
+        if self.placements_path is None:
+            return
+        with self._lock:
+            data = dict(self._placements)
+        tmp = self.placements_path.with_suffix(".tmp")
+        try:
+            self.placements_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.placements_path)
+        except OSError:
+            pass
+
+    def placement(self, agent_id: str) -> str:
+        """agent 上次运行所在位置："" 为本机。"""
+        with self._lock:
+            return self._placements.get(agent_id, "")
+
+    def set_placement(self, agent_id: str, host_name: str) -> None:
+        with self._lock:
+            if self._placements.get(agent_id, "") == host_name:
+                return
+            self._placements[agent_id] = host_name
+        self._save_placements()
+
+    def mark_down(self, name: str, error: str) -> None:
+        with self._lock:
+            state = self.states[name]
+            state.backoff_sec = min(BACKOFF_MAX_SEC, max(BACKOFF_MIN_SEC, state.backoff_sec * 2))
+            state.down_until = time.monotonic() + state.backoff_sec
+            state.last_error = error
+
+    def _mark_up(self, name: str, reply: Dict[str, object]) -> None:
+        with self._lock:
+            state = self.states[name]
+            state.running = int(reply.get("running", 0) or 0)
+            state.cpus = int(reply.get("cpus", 1) or 1)
+            state.load_avg = float(reply.get("load_avg", -1.0))
+            state.checked_at = time.monotonic()
+            state.down_until = 0.0
+            state.backoff_sec = 0.0
+            state.last_error = ""
+
+    def refresh(self, name: str, force: bool = False) -> bool:
+        state = self.states[name]
+        if not force and (not state.up or time.monotonic() - state.checked_at < STATUS_TTL_SEC):
+            return state.up
+        try:
+            reply = self.clients[name].request("hello")
+        except (HostUnavailable, RuntimeError) as exc:
+            self.mark_down(name, str(exc))
+            return False
+        self._mark_up(name, reply)
+        return True
+
+    def acquire(self, agent: AgentConfig, exclude: Optional[set] = None) -> Optional[str]:
+        """选定主机并占用一个运行名额（用完调用 release）；固定主机的 agent 只考虑该主机，auto 时优先沿用上次的主机，否则选负载最低的。"""
+        exclude = exclude or set()
+        if agent.host not in ("", "auto"):
+            candidates = [agent.host] if agent.host in self.states and agent.host not in exclude else []
+        else:
+            candidates = [name for name in self.states if name not in exclude]
+        live = [name for name in candidates if self.refresh(name)]
+        if not live:
+            return None
+        previous = self.placement(agent.agent_id)
+        with self._lock:
+            # Choosing and reserving under one lock keeps a burst of dispatches from piling onto the same host.
+            name = previous if previous in live else min(live, key=lambda n: self.states[n].score())
+            self.states[name].inflight += 1
+        return name
+
+    def release(self, name: str) -> None:
+        with self._lock:
+            self.states[name].inflight -= 1
+
+    def snapshot(self) -> List[Dict[str, object]]:
+        with self._lock:
+            return [
+                {**asdict(s.settings), "up": s.up, "running": s.running, "inflight": s.inflight, "last_error": s.last_error}
+                for s in self.states.values()
+            ]
+
+
+def run_remote(
+    client: HostClient,
+    agent: AgentConfig,
+    session_id: str,
+    text: str,
+    work_path: str,
+    timeout_sec: int,
+    on_stream: Optional[Callable[[AgentLogEvent], None]],
+    isolated: bool,
+) -> Dict[str, object]:
+    """在主机上执行一次 dispatch；返回 {"result": AgentResult, "session_id", "pid"}。连接失败抛 HostUnavailable。"""
+
+    def on_event(message: Dict[str, object]) -> None:
+        if on_stream:
+            status = AgentStatus(str(message.get("status", AgentStatus.RUNNING.value)))
+            on_stream(AgentLogEvent(agent.agent_id, agent.role, status, f"[{client.settings.name}] {message.get('message', '')}"))
+
+    reply = client.request(
+        "run",
+        {
+            "agent": asdict(agent),
+            "session_id": session_id,
+            "text": text,
+            "work_path": work_path,
+            "timeout_sec": timeout_sec,
+            "isolated": isolated,
+        },
+        on_event,
+    )
+    data = dict(reply.get("result") or {})
+    result = AgentResult(
+        agent_id=agent.agent_id,
+        role=agent.role,
+        status=AgentStatus(str(data.get("status", AgentStatus.FAILED.value))),
+        content=str(data.get("content", "")),
+        metrics=dict(data.get("metrics") or {}),
+    )
+    return {"result": result, "session_id": str(reply.get("session_id", "") or ""), "pid": int(reply.get("pid", -1) or -1)}
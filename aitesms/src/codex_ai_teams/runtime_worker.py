@@ -0,0 +1,494 @@
+import json
+import multiprocessing
+import struct
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import asdict
+from itertools import count
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .config import HostSettings, RuntimeSettings
+from .diagnostics import INFLIGHT_WAIT_SEC, diagnostics
+from .file_index import FileIndex
+from .models import AgentConfig, AgentLogEvent, AgentResult, AgentStatus
+from .process_monitor import ProcessSample, ResourceStats
+from .stream_capture import CaptureStore
+from .transcript_store import TranscriptStore, TranscriptTurn
+from .usage import TokenUsage
+
+# Frame = 1 kind byte + payload. Calls, replies and state are small JSON; log events are packed records.
+KIND_CALL = 1
+KIND_REPLY = 2
+KIND_EVENTS = 3
+KIND_STATE = 4
+KIND_LOST = 5
+# call_id, status index, agent_id bytes, role bytes, message bytes
+_EVENT = struct.Struct("<IBHHI")
+_STATUSES = list(AgentStatus)
+FLUSH_INTERVAL_SEC = 0.02
+MAX_BATCH_BYTES = 256 * 1024
+SHUTDOWN_MARGIN_SEC = 5.0
+
+
+def _frame(kind: int, message: Dict[str, object]) -> bytes:
+    return bytes((kind,)) + json.dumps(message, ensure_ascii=False).encode("utf-8")
+
+
+def pack_event(call_id: int, event: AgentLogEvent) -> bytes:
+    agent_id = event.agent_id.encode("utf-8")
+    role = event.role.encode("utf-8")
+    message = event.message.encode("utf-8", errors="replace")
+    status = _STATUSES.index(event.status)
+    return _EVENT.pack(call_id, status, len(agent_id), len(role), len(message)) + agent_id + role + message
+
+
+def unpack_event(payload: memoryview, offset: int) -> Tuple[int, AgentLogEvent, int]:
+    """从 offset 处解出一条事件，返回 (call_id, 事件, 下一条的 offset)。"""
+    call_id, status, agent_len, role_len, message_len = _EVENT.unpack_from(payload, offset)
+    offset += _EVENT.size
+    agent_id = str(payload[offset : offset + agent_len], "utf-8")
+    offset += agent_len
+    role = str(payload[offset : offset + role_len], "utf-8")
+    offset += role_len
+    message = str(payload[offset : offset + message_len], "utf-8")
+    offset += message_len
+    return call_id, AgentLogEvent(agent_id, role, _STATUSES[status], message), offset
+
+
+def _result_to_dict(result: AgentResult) -> Dict[str, object]:
+    data = asdict(result)
+    data["status"] = result.status.value
+    return data
+
+
+def _result_from_dict(data: Dict[str, object]) -> AgentResult:
+    return AgentResult(
+        agent_id=str(data["agent_id"]),
+        role=str(data["role"]),
+        status=AgentStatus(str(data["status"])),
+        content=str(data.get("content", "")),
+        metrics=dict(data.get("metrics") or {}),
+    )
+
+
+class _EventWriter:
+    """子进程侧：把 on_stream 事件攒成批，每 FLUSH_INTERVAL_SEC 或攒够 MAX_BATCH_BYTES 写一帧；回复写出前先冲刷，保证顺序。"""
+
+    def __init__(self, conn) -> None:
+        self._conn = conn
+        self._buf = bytearray()
+        self._lock = Lock()
+        self.closed = False
+
+    def event(self, call_id: int, event: AgentLogEvent) -> None:
+        with self._lock:
+            self._buf += pack_event(call_id, event)
+            if len(self._buf) >= MAX_BATCH_BYTES:
+                self._flush_locked()
+
+    def send(self, kind: int, message: Dict[str, object]) -> None:
+        with self._lock:
+            self._flush_locked()
+            self._write(_frame(kind, message))
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._buf:
+            self._write(bytes((KIND_EVENTS,)) + bytes(self._buf))
+            self._buf.clear()
+
+    def _write(self, data: bytes) -> None:
+        if self.closed:
+            return
+        try:
+            self._conn.send_bytes(data)
+        except (OSError, ValueError):
+            # The GUI is gone; the command loop sees EOF and shuts the runtime down.
+            self.closed = True
+
+
+def _worker_main(
+    commands,
+    events,
+    agents: List[AgentConfig],
+    project_root: Path,
+    settings: RuntimeSettings,
+    hosts: Optional[List[HostSettings]],
+) -> None:
+    from .agent_runtime import AgentRuntimeManager
+
+    diagnostics.out_dir = project_root / "logs" / "diagnostics"
+    diagnostics.prefix = "worker-"
+    runtime = AgentRuntimeManager(agents, project_root, settings, hosts)
+    runtime.start()
+    writer = _EventWriter(events)
+    running = True
+
+    def flusher() -> None:
+        interval = settings.monitor_interval_sec
+        next_state = time.monotonic()
+        while running and not writer.closed:
+            time.sleep(FLUSH_INTERVAL_SEC)
+            writer.flush()
+            if interval > 0 and time.monotonic() >= next_state:
+                next_state = time.monotonic() + max(0.25, interval)
+                writer.send(KIND_STATE, _state(runtime))
+
+    def run_dispatch(call_id: int, request: Dict[str, object]) -> None:
+        targets = [AgentConfig(**data) for data in request["targets"]]
+        try:
+            results = runtime.dispatch(
+                targets,
+                str(request["text"]),
+                str(request["work_path"]),
+                int(request["timeout_sec"]),
+                lambda event: writer.event(call_id, event),
+                bool(request.get("isolated", False)),
+                bool(request.get("hedge", False)),
+            )
+        except Exception as exc:  # noqa: BLE001
+            results = [AgentResult(a.agent_id, a.role, AgentStatus.FAILED, f"调度异常: {exc}") for a in targets]
+        writer.send(KIND_REPLY, {"id": call_id, "results": [_result_to_dict(r) for r in results], **_state(runtime, False)})
+
+    def run_stop(call_id: int, agent_id: str) -> None:
+        writer.send(KIND_REPLY, {"id": call_id, "value": runtime.stop_agent(agent_id)})
+
+    def run_diagnostics(call_id: int, action: str) -> None:
+        try:
+            value = diagnostics.run(action)
+        except Exception as exc:  # noqa: BLE001
+            value = f"诊断失败: {exc}"
+        writer.send(KIND_REPLY, {"id": call_id, "value": value})
+
+    Thread(target=flusher, name="worker-flush", daemon=True).start()
+    try:
+        while True:
+            try:
+                data = commands.recv_bytes()
+            except (EOFError, OSError):
+                break
+            request = json.loads(bytes(data[1:]).decode("utf-8"))
+            call_id, op = int(request.get("id", 0)), request.get("op")
+            if op == "dispatch":
+                Thread(target=run_dispatch, args=(call_id, request), name="worker-dispatch", daemon=True).start()
+            elif op == "stop_agent":
+                Thread(target=run_stop, args=(call_id, str(request["agent_id"])), name="worker-stop", daemon=True).start()
+            elif op == "diagnostics":
+                Thread(target=run_diagnostics, args=(call_id, str(request["action"])), name="worker-diag", daemon=True).start()
+            elif op == "prime_context":
+                runtime.prime_context(str(request["work_path"]))
+            elif op == "shutdown":
+                break
+    finally:
+        running = False
+        runtime.stop()
+        writer.send(KIND_REPLY, {"id": 0, "value": True})
+
+
+def _state(runtime, with_resources: bool = True) -> Dict[str, object]:
+    state: Dict[str, object] = {
+        "pids": runtime.runtime_info(),
+        "sessions": runtime.sessions(),
+        "usage": {agent_id: [asdict(today), asdict(total)] for agent_id, (today, total) in runtime.usage_snapshot().items()},
+    }
+    if with_resources:
+        state["resources"] = {agent_id: asdict(stats) for agent_id, stats in runtime.resource_stats().items()}
+    return state
+
+
+class _Call:
+    def __init__(self, on_stream: Optional[Callable[[AgentLogEvent], None]], targets: List[AgentConfig]) -> None:
+        self.future: "Future[object]" = Future()
+        self.on_stream = on_stream
+        self.targets = targets
+
+
+class WorkerRuntime:
+    """在子进程中运行 AgentRuntimeManager 的代理，接口与 UI 用到的部分一致。
+
+    CLI 输出的读取、JSON 解析与流回调全部在子进程里完成；事件按批以二进制帧经管道送回，
+    GUI 进程的读线程只把原始帧排队，由 UI 定时器调用 drain() 在时间预算内解码并回调。
+    dispatch 会阻塞到结果帧被 drain() 处理为止，因此不能在 UI 线程里调用。
+    """
+
+    def __init__(
+        self,
+        agents: List[AgentConfig],
+        project_root: Path,
+        settings: Optional[RuntimeSettings] = None,
+        hosts: Optional[List[HostSettings]] = None,
+    ) -> None:
+        self.agents = agents
+        self.project_root = project_root
+        self.settings = settings or RuntimeSettings()
+        self.hosts_config = hosts
+        # Capture files are plain files on disk, so the replay dialog reads them directly.
+        self.captures: Optional[CaptureStore] = None
+        if self.settings.stream_capture:
+            self.captures = CaptureStore(project_root / "logs" / "captures", self.settings.capture_keep_per_agent)
+        self._pids: Dict[str, int] = {a.agent_id: -1 for a in agents}
+        self._sessions: Dict[str, str] = {a.agent_id: (a.session_id or "") for a in agents}
+        self._resources: Dict[str, ResourceStats] = {}
+        self._usage: Dict[str, Tuple[TokenUsage, TokenUsage]] = {}
+        self._calls: Dict[int, _Call] = {}
+        self._frames: Deque[bytes] = deque()
+        # An event batch drain() ran out of time in the middle of: (payload, offset of the next event).
+        self._partial: Optional[Tuple[memoryview, int]] = None
+        self._lock = Lock()
+        self._send_lock = Lock()
+        self._ids = count(1)
+        self._proc = None
+        self._commands = None
+        self._events = None
+        self._stopping = False
+
+    def start(self) -> None:
+        with self._lock:
+            if self._proc is not None and self._proc.is_alive():
+                return
+            ctx = multiprocessing.get_context("spawn")
+            cmd_recv, cmd_send = ctx.Pipe(duplex=False)
+            evt_recv, evt_send = ctx.Pipe(duplex=False)
+            # Sessions picked up by earlier runs carry over when the worker is restarted.
+            agents = [AgentConfig(**{**asdict(a), "session_id": self._sessions.get(a.agent_id, a.session_id)}) for a in self.agents]
+            proc = ctx.Process(
+                target=_worker_main,
+                args=(cmd_recv, evt_send, agents, self.project_root, self.settings, self.hosts_config),
+                name="agent-runtime-worker",
+                daemon=True,
+            )
+            proc.start()
+            cmd_recv.close()
+            evt_send.close()
+            self._proc, self._commands, self._events = proc, cmd_send, evt_recv
+            self._stopping = False
+        Thread(target=self._read_loop, args=(evt_recv,), name="worker-reader", daemon=True).start()
+
+    def stop(self) -> None:
+        with self._lock:
+            proc, self._stopping = self._proc, True
+        if proc is None:
+            return
+        done = self._call_async("shutdown", {}, call_id=0)
+        try:
+            done.result(timeout=self.settings.stop_grace_sec + SHUTDOWN_MARGIN_SEC)
+        except Exception:  # noqa: BLE001
+            pass
+        proc.join(timeout=2)
+        if proc.is_alive():
+            proc.terminate()
+            proc.join(timeout=2)
+        with self._lock:
+            self._proc = None
+            commands, self._commands = self._commands, None
+        if commands is not None:
+            commands.close()
+        self._fail_pending("运行时工作进程已停止")
+
+    def _alive(self) -> bool:
+        return self._proc is not None and self._proc.is_alive()
+
+    def _send(self, message: Dict[str, object]) -> bool:
+        with self._send_lock:
+            if self._commands is None:
+                return False
+            try:
+                self._commands.send_bytes(_frame(KIND_CALL, message))
+            except (OSError, ValueError):
+                return False
+        return True
+
+    def _call_async(
+        self,
+        op: str,
+        payload: Dict[str, object],
+        on_stream: Optional[Callable[[AgentLogEvent], None]] = None,
+        targets: Optional[List[AgentConfig]] = None,
+        call_id: Optional[int] = None,
+    ) -> "Future[object]":
+        call_id = next(self._ids) if call_id is None else call_id
+        call = _Call(on_stream, targets or [])
+        with self._lock:
+            self._calls[call_id] = call
+        if not self._send({"id": call_id, "op": op, **payload}):
+            with self._lock:
+                self._calls.pop(call_id, None)
+            call.future.set_exception(RuntimeError("运行时工作进程不可用"))
+        return call.future
+
+    def _read_loop(self, conn) -> None:
+        while True:
+            try:
+                data = conn.recv_bytes()
+            except (EOFError, OSError):
+                break
+            kind = data[0]
+            if kind == KIND_STATE:
+                self._apply_state(json.loads(data[1:].decode("utf-8")))
+            elif kind == KIND_REPLY:
+                reply = json.loads(data[1:].decode("utf-8"))
+                if "results" in reply:
+                    # Dispatch results queue behind their log events so the UI sees them in order.
+                    with self._lock:
+                        self._frames.append(data)
+                else:
+                    self._resolve(int(reply["id"]), reply.get("value"))
+            else:
+                with self._lock:
+                    self._frames.append(data)
+        conn.close()
+        with self._lock:
+            self._frames.append(bytes((KIND_LOST,)))
+        self._resolve(0, False)
+
+    def _resolve(self, call_id: int, value: object) -> None:
+        with self._lock:
+            call = self._calls.pop(call_id, None)
+        if call is not None and not call.future.done():
+            call.future.set_result(value)
+
+    def _apply_state(self, state: Dict[str, object]) -> None:
+        with self._lock:
+            self._pids.update({str(k): int(v) for k, v in dict(state.get("pids") or {}).items()})
+            self._sessions.update({str(k): str(v) for k, v in dict(state.get("sessions") or {}).items()})
+            if "usage" in state:
+                self._usage = {
+                    agent_id: (TokenUsage(**today), TokenUsage(**total)) for agent_id, (today, total) in dict(state["usage"]).items()
+                }
+            if "resources" in state:
+                self._resources = {
+                    agent_id: ResourceStats(**{**stats, "current": ProcessSample(**stats["current"])})
+                    for agent_id, stats in dict(state["resources"]).items()
+                }
+
+    def _fail_pending(self, reason: str) -> None:
+        with self._lock:
+            calls = list(self._calls.items())
+            self._calls.clear()
+        for _, call in calls:
+            if call.future.done():
+                continue
+            if call.targets:
+                call.future.set_result([AgentResult(a.agent_id, a.role, AgentStatus.FAILED, reason) for a in call.targets])
+            else:
+                call.future.set_exception(RuntimeError(reason))
+
+    def pending_frames(self) -> int:
+        with self._lock:
+            return len(self._frames) + (self._partial is not None)
+
+    def drain(self, budget_sec: float = 0.008) -> int:
+        """在 UI 线程上处理排队的帧，超出时间预算就留到下一次；返回处理的事件条数。"""
+        deadline = time.perf_counter() + budget_sec
+        handled = 0
+        while time.perf_counter() < deadline:
+            if self._partial is not None:
+                payload, offset = self._partial
+                while offset < len(payload) and time.perf_counter() < deadline:
+                    call_id, event, offset = unpack_event(payload, offset)
+                    call = self._calls.get(call_id)
+                    if call is not None and call.on_stream is not None:
+                        call.on_stream(event)
+                    handled += 1
+                self._partial = (payload, offset) if offset < len(payload) else None
+                continue
+            with self._lock:
+                if not self._frames:
+                    break
+                data = self._frames.popleft()
+            kind = data[0]
+            if kind == KIND_EVENTS:
+                self._partial = (memoryview(data)[1:], 0)
+            elif kind == KIND_REPLY:
+                reply = json.loads(data[1:].decode("utf-8"))
+                self._apply_state(reply)
+                self._resolve(int(reply["id"]), [_result_from_dict(r) for r in reply["results"]])
+            elif kind == KIND_LOST:
+                self._fail_pending("运行时工作进程已停止" if self._stopping else "运行时工作进程意外退出，已中止本次运行")
+        return handled
+
+    def dispatch(
+        self,
+        targets: List[AgentConfig],
+        text: str,
+        work_path: str,
+        timeout_sec: int = 60,
+        on_stream: Optional[Callable[[AgentLogEvent], None]] = None,
+        isolated: bool = False,
+        hedge: bool = False,
+    ) -> List[AgentResult]:
+        if not self._stopping and not self._alive():
+            if self._proc is not None and on_stream:
+                for agent in targets:
+                    on_stream(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, "运行时工作进程已退出，正在重新启动"))
+            self.start()
+        future = self._call_async(
+            "dispatch",
+            {
+                "targets": [asdict(a) for a in targets],
+                "text": text,
+                "work_path": work_path,
+                "timeout_sec": timeout_sec,
+                "isolated": isolated,
+                "hedge": hedge,
+            },
+            on_stream,
+            targets,
+        )
+        try:
+            return list(future.result())  # type: ignore[arg-type]
+        except RuntimeError as exc:
+            return [AgentResult(a.agent_id, a.role, AgentStatus.FAILED, str(exc)) for a in targets]
+
+    def run_diagnostics(self, action: str) -> str:
+        """在工作进程里执行同名诊断动作，返回其产物路径（见 diagnostics.Diagnostics.run）。"""
+        try:
+            return str(self._call_async("diagnostics", {"action": action}).result(INFLIGHT_WAIT_SEC + SHUTDOWN_MARGIN_SEC) or "")
+        except Exception:  # noqa: BLE001
+            return ""
+
+    def prime_context(self, work_path: str, index: Optional[FileIndex] = None) -> None:
+        # The index lives in this process; the worker keeps its own.
+        self._send({"id": 0, "op": "prime_context", "work_path": work_path})
+
+    def stop_agent(self, agent_id: str) -> bool:
+        try:
+            return bool(self._call_async("stop_agent", {"agent_id": agent_id}).result(self.settings.stop_grace_sec + SHUTDOWN_MARGIN_SEC))
+        except Exception:  # noqa: BLE001
+            return False
+
+    def stop_agent_async(self, agent_id: str, on_done: Optional[Callable[[str, bool], None]] = None) -> None:
+        future = self._call_async("stop_agent", {"agent_id": agent_id})
+        if on_done is not None:
+            future.add_done_callback(lambda f: on_done(agent_id, f.exception() is None and bool(f.result())))
+
+    def runtime_info(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._pids)
+
+    def resource_stats(self) -> Dict[str, ResourceStats]:
+        with self._lock:
+            return dict(self._resources)
+
+    def usage_snapshot(self) -> Dict[str, Tuple[TokenUsage, TokenUsage]]:
+        with self._lock:
+            return dict(self._usage)
+
+    def recent_turns(self, agent_id: str, limit: int = 20, before: Optional[int] = None) -> List[Tuple[int, TranscriptTurn]]:
+        with self._lock:
+            session_id = self._sessions.get(agent_id, "").strip()
+        if not session_id:
+            return []
+        # The worker process owns the writer; a fresh reader re-reads the segment index instead of caching it.
+        return TranscriptStore(self.project_root / ".agent_sessions").read_recent(agent_id, session_id, limit, before)
+
+    def session_for(self, agent_id: str) -> str:
+        with self._lock:
+            sid = self._sessions.get(agent_id, "")
+        return sid or f"{agent_id}-pending"
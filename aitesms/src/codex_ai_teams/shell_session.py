@@ -0,0 +1,204 @@
+import codecs
+import importlib.util
+import os
+import signal
+import subprocess
+import sys
+from abc import ABC, abstractmethod
+from threading import Lock, Thread
+from typing import List, Optional
+
+from .process_group import kill_group, new_group_kwargs
+
+_WINDOWS = sys.platform.startswith("win")
+# Exec'd in the new session to adopt the pty slave (stdin) as controlling terminal, then replaced by the shell
+# under the same pid. A fresh interpreter instead of preexec_fn: Python code after fork() in a threaded GUI can deadlock.
+_CTTY_EXEC = "import fcntl, os, sys, termios; fcntl.ioctl(0, termios.TIOCSCTTY, 0); os.execvp(sys.argv[1], sys.argv[1:])"
+
+
+class ShellSession(ABC):
+    """长驻 shell 会话：命令写入同一个 shell 进程，cwd / 环境变量在命令之间保留。
+
+    输出由后台线程读取并缓存在内存中，界面定时调用 drain() 批量取走，避免每行一次跨线程信号。
+    """
+
+    def __init__(self, cwd: str, argv: List[str]) -> None:
+        self.cwd = cwd
+        self.argv = argv
+        self.proc: Optional[subprocess.Popen] = None
+        self._chunks: List[str] = []
+        self._lock = Lock()
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._reader: Optional[Thread] = None
+
+    @property
+    def pid(self) -> int:
+        return self.proc.pid if self.proc is not None else -1
+
+    @abstractmethod
+    def start(self) -> None:
+        ...
+
+    @abstractmethod
+    def _write_bytes(self, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def _read_bytes(self) -> bytes:
+        """阻塞读取一块输出；返回空串表示会话已结束。"""
+
+    def send_line(self, command: str) -> None:
+        self._write_bytes((command + "\n").encode("utf-8"))
+
+    @abstractmethod
+    def interrupt(self) -> None:
+        ...
+
+    def kill(self) -> None:
+        if self.proc is not None and self.proc.poll() is None:
+            kill_group(self.proc)
+
+    def is_alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def exit_code(self) -> Optional[int]:
+        return self.proc.poll() if self.proc is not None else None
+
+    def drain(self) -> str:
+        with self._lock:
+            if not self._chunks:
+                return ""
+            text = "".join(self._chunks)
+            self._chunks.clear()
+        return text
+
+    def close(self) -> None:
+        self.kill()
+
+    def _start_reader(self) -> None:
+        self._reader = Thread(target=self._read_loop, name=f"shell-{self.pid}", daemon=True)
+        self._reader.start()
+
+    def _read_loop(self) -> None:
+        while True:
+            try:
+                data = self._read_bytes()
+            except OSError:
+                data = b""
+            text = self._decoder.decode(data, final=not data)
+            if text:
+                with self._lock:
+                    self._chunks.append(text)
+            if not data:
+                break
+
+
+class PtyShellSession(ShellSession):
+    """POSIX 伪终端会话：shell 以伪终端为控制终端，Ctrl-C 由终端驱动发给前台进程组，与真实终端一致。"""
+
+    def start(self) -> None:
+        import pty
+
+        master, slave = pty.openpty()
+        env = dict(os.environ, TERM="dumb", PAGER="cat", GIT_PAGER="cat")
+        try:
+            self.proc = subprocess.Popen(
+                [sys.executable, "-I", "-c", _CTTY_EXEC, *self.argv],
+                cwd=self.cwd,
+                stdin=slave,
+                stdout=slave,
+                stderr=slave,
+                env=env,
+                start_new_session=True,
+            )
+        finally:
+            os.close(slave)
+        self._master = master
+        self._start_reader()
+
+    def _write_bytes(self, data: bytes) -> None:
+        os.write(self._master, data)
+
+    def _read_bytes(self) -> bytes:
+        try:
+            return os.read(self._master, 65536)
+        except OSError:
+            # EIO once every process holding the slave side has exited.
+            return b""
+
+    def interrupt(self) -> None:
+        self._write_bytes(b"\x03")
+
+    def kill(self) -> None:
+        # Interactive shells put each job in its own process group; end the foreground job too.
+        try:
+            foreground = os.tcgetpgrp(self._master)
+        except OSError:
+            foreground = -1
+        if foreground > 0 and foreground != self.pid:
+            try:
+                os.killpg(foreground, signal.SIGKILL)
+            except OSError:
+                pass
+        super().kill()
+
+    def close(self) -> None:
+        super().close()
+        if self._reader is not None:
+            self._reader.join(timeout=1)
+        try:
+            os.close(self._master)
+        except OSError:
+            pass
+
+
+class PipeShellSession(ShellSession):
+    """管道会话（Windows 或无伪终端的平台）：shell 从标准输入逐行读取命令。"""
+
+    def start(self) -> None:
+        self.proc = subprocess.Popen(
+            self.argv,
+            cwd=self.cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=0,
+            **new_group_kwargs(),
+        )
+        self._start_reader()
+
+    def _write_bytes(self, data: bytes) -> None:
+        if self.proc is not None and self.proc.stdin is not None:
+            self.proc.stdin.write(data)
+            self.proc.stdin.flush()
+
+    def _read_bytes(self) -> bytes:
+        if self.proc is None or self.proc.stdout is None:
+            return b""
+        return os.read(self.proc.stdout.fileno(), 65536)
+
+    def interrupt(self) -> None:
+        if not self.is_alive():
+            return
+        if _WINDOWS:
+            # Without a console there is no Ctrl-C; CTRL_BREAK reaches the whole group,
+            # which usually ends the session along with the running command.
+            self.proc.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            os.killpg(self.proc.pid, signal.SIGINT)
+
+
+def default_shell_argv(use_pty: bool) -> List[str]:
+    if _WINDOWS:
+        return ["powershell", "-NoLogo", "-NoProfile", "-NoExit", "-Command", "-"]
+    shell = os.environ.get("SHELL") or "/bin/sh"
+    return [shell, "-i"] if use_pty else [shell]
+
+
+def open_shell_session(cwd: str, argv: Optional[List[str]] = None) -> ShellSession:
+    """优先使用伪终端（POSIX），否则退回管道模式，并启动会话。"""
+    use_pty = not _WINDOWS and importlib.util.find_spec("pty") is not None
+    session_cls = PtyShellSession if use_pty else PipeShellSession
+    session = session_cls(cwd, argv or default_shell_argv(use_pty))
+    session.start()
+    return session
@@ -0,0 +1,213 @@
+import json
+import os
+import re
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+
+BLOCK_LINES = 256
+BLOCK_BYTES = 64 * 1024
+BLOCK_FLUSH_SEC = 1.0
+_SAFE_NAME = re.compile(r"[^0-9A-Za-z._-]+")
+
+
+@dataclass
+class CaptureInfo:
+    path: Path
+    agent_id: str
+    started: str
+    lines: int = 0
+    raw_bytes: int = 0
+    stored_bytes: int = 0
+    duration_sec: float = 0.0
+    exit_code: Optional[int] = None
+    status: str = ""
+    prompt: str = ""
+    # (compressed offset, first line number, first line ms); each block is a standalone gzip member.
+    blocks: List[Tuple[int, int, int]] = field(default_factory=list)
+
+    @property
+    def index_path(self) -> Path:
+        return self.path.with_suffix(".json")
+
+
+class CaptureWriter:
+    """单次 CLI 运行的原始输出捕获：每行带相对毫秒时间戳，按块压缩为独立的 gzip 成员追加写入。
+
+    整个文件仍是合法的 .gz（可直接 zcat），同名 .json 记录元数据与块索引（压缩偏移、首行号、时间），
+    回放时可从任意块开始解压而无需从头读起。
+    """
+
+    def __init__(self, path: Path, agent_id: str, prompt: str = "") -> None:
+        self.info = CaptureInfo(path, agent_id, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), prompt=prompt[:200])
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = path.open("wb")
+        self._started = time.monotonic()
+        self._block: List[bytes] = []
+        self._block_bytes = 0
+        self._block_first: Tuple[int, int] = (0, 0)
+        self._last_flush = self._started
+        self._lock = Lock()
+
+    def write(self, line: str) -> None:
+        ms = int((time.monotonic() - self._started) * 1000)
+        data = f"{ms}\t{line.rstrip(chr(10))}\n".encode("utf-8", errors="replace")
+        with self._lock:
+            if self._fh.closed:
+                return
+            if not self._block:
+                self._block_first = (self.info.lines, ms)
+            self._block.append(data)
+            self._block_bytes += len(data)
+            self.info.lines += 1
+            self.info.raw_bytes += len(data)
+            # The time bound keeps a slow run readable on disk while it is still going.
+            if len(self._block) >= BLOCK_LINES or self._block_bytes >= BLOCK_BYTES or time.monotonic() - self._last_flush >= BLOCK_FLUSH_SEC:
+                self._flush_block()
+
+    def _flush_block(self) -> None:
+        if not self._block:
+            return
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        member = compressor.compress(b"".join(self._block)) + compressor.flush()
+        self.info.blocks.append((self.info.stored_bytes, *self._block_first))
+        self._fh.write(member)
+        self._fh.flush()
+        self.info.stored_bytes += len(member)
+        self._block.clear()
+        self._block_bytes = 0
+        self._last_flush = time.monotonic()
+
+    def close(self, exit_code: Optional[int], status: str) -> CaptureInfo:
+        with self._lock:
+            if self._fh.closed:
+                return self.info
+            self._flush_block()
+            self._fh.close()
+            self.info.exit_code = exit_code
+            self.info.status = status
+            self.info.duration_sec = round(time.monotonic() - self._started, 3)
+        _write_index(self.info)
+        return self.info
+
+
+def _write_index(info: CaptureInfo) -> None:
+    data = {
+        "agent_id": info.agent_id,
+        "started": info.started,
+        "lines": info.lines,
+        "raw_bytes": info.raw_bytes,
+        "stored_bytes": info.stored_bytes,
+        "duration_sec": info.duration_sec,
+        "exit_code": info.exit_code,
+        "status": info.status,
+        "prompt": info.prompt,
+        "blocks": info.blocks,
+    }
+    tmp = info.index_path.with_suffix(".tmp")
+    try:
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, info.index_path)
+    except OSError:
+        pass
+
+
+def load_capture(path: Path) -> CaptureInfo:
+    """读取捕获的元数据；索引缺失（运行中或进程崩溃）时只给出文件大小，回放从头顺序解压。"""
+    info = CaptureInfo(path, path.parent.name, "")
+    try:
+        data = json.loads(info.index_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        try:
+            info.stored_bytes = path.stat().st_size
+            info.started = datetime.fromtimestamp(path.stat().st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+        except OSError:
+            pass
+        return info
+    for key in ("agent_id", "started", "lines", "raw_bytes", "stored_bytes", "duration_sec", "exit_code", "status", "prompt"):
+        if key in data:
+            setattr(info, key, data[key])
+    info.blocks = [tuple(b) for b in data.get("blocks", [])]
+    return info
+
+
+def iter_events(info: CaptureInfo, start_line: int = 0) -> Iterator[Tuple[int, str]]:
+    """按顺序产出 (相对毫秒, 原始行)；从包含 start_line 的块开始解压。"""
+    offset, line_no = 0, 0
+    for block_offset, first_line, _ in info.blocks:
+        if first_line > start_line:
+            break
+        offset, line_no = block_offset, first_line
+    try:
+        fh = info.path.open("rb")
+    except OSError:
+        return
+    with fh:
+        fh.seek(offset)
+        decompressor = zlib.decompressobj(31)
+        pending = b""
+        while True:
+            chunk = fh.read(65536)
+            if not chunk:
+                break
+            while chunk:
+                pending += decompressor.decompress(chunk)
+                # Each block is its own gzip member; restart the decoder at member boundaries.
+                chunk = decompressor.unused_data if decompressor.eof else b""
+                if decompressor.eof:
+                    decompressor = zlib.decompressobj(31)
+            *lines, pending = pending.split(b"\n")
+            for raw in lines:
+                if line_no >= start_line:
+                    ms, _, text = raw.decode("utf-8", errors="replace").partition("\t")
+                    yield (int(ms) if ms.isdigit() else 0), text
+                line_no += 1
+
+
+class CaptureStore:
+    """logs/captures/<agent_id>/ 下的捕获文件管理：新建、列出、按数量淘汰旧文件。"""
+
+    def __init__(self, root: Path, keep_per_agent: int = 200) -> None:
+        self.root = root
+        self.keep_per_agent = max(1, keep_per_agent)
+
+    def open(self, agent_id: str, pid: int, prompt: str = "") -> CaptureWriter:
+        directory = self._agent_dir(agent_id)
+        name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{pid}.log.gz"
+        self._prune(directory)
+        return CaptureWriter(directory / name, agent_id, prompt)
+
+    def _agent_dir(self, agent_id: str) -> Path:
+        return self.root / (_SAFE_NAME.sub("_", agent_id) or "agent")
+
+    def _prune(self, directory: Path) -> None:
+        try:
+            files = sorted(directory.glob("*.log.gz"))
+        except OSError:
+            return
+        for old in files[: max(0, len(files) - self.keep_per_agent + 1)]:
+            for target in (old, old.with_suffix(".json")):
+                try:
+                    target.unlink()
+                except OSError:
+                    pass
+
+    def list(self, agent_id: Optional[str] = None) -> List[CaptureInfo]:
+        """最新的在前。"""
+        if not self.root.exists():
+            return []
+        dirs = [self._agent_dir(agent_id)] if agent_id else [d for d in self.root.iterdir() if d.is_dir()]
+        paths = [p for d in dirs if d.exists() for p in d.glob("*.log.gz")]
+        paths.sort(key=lambda p: p.name, reverse=True)
+        return [load_capture(p) for p in paths]
+
+    def totals(self) -> Dict[str, int]:
+        raw = stored = 0
+        for info in self.list():
+            raw += info.raw_bytes
+            stored += info.stored_bytes
+        return {"raw_bytes": raw, "stored_bytes": stored}
@@ -0,0 +1,349 @@
+import http.client
+import json
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+MAX_MESSAGE_CHARS = 4096
+LINGER_SEC = 0.5
+MAX_PENDING = 500
+POLL_TIMEOUT_SEC = 25
+MAX_BACKOFF_SEC = 30.0
+# Telegram allows about one message per second into a chat and 20 per minute into a group.
+CHAT_RATE_PER_SEC = 1.0
+GROUP_RATE_PER_SEC = 20 / 60
+BURST = 3
+# Refill a little slower than the limit so clock skew against the server does not produce 429s at the boundary.
+RATE_SAFETY = 0.9
+
+
+class TelegramError(RuntimeError):
+    def __init__(self, message: str, retry_after: float = 0.0, status: int = 0) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status = status
+
+    @property
+    def permanent(self) -> bool:
+        """4xx（429 除外）表示请求本身有问题（如 400 文本非法、403 被移出会话），重发同一内容也不会成功。"""
+        return 400 <= self.status < 500 and self.status != 429
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多攒 capacity 个；429 时按 retry_after 整体推迟。"""
+
+    def __init__(self, rate: float, capacity: int, clock: Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._clock = clock
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def wait_time(self) -> float:
+        """距离下一个令牌可用还需等待的秒数，0 表示现在即可发送。"""
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            if self._tokens >= 1:
+                return 0.0
+            return max(self._updated - now, 0.0) + (1 - self._tokens) / self.rate
+
+    def try_take(self) -> bool:
+        with self._lock:
+            self._refill(self._clock())
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def penalize(self, sec: float) -> None:
+        with self._lock:
+            # Refill resumes only once the server's retry_after has passed.
+            self._tokens = 0.0
+            self._updated = max(self._updated, self._clock() + sec)
+
+
+class TelegramApi:
+    """Bot API 的最小客户端：POST JSON 到 {api_url}/bot{token}/{method}，复用一条 keep-alive 连接；不是线程安全的。"""
+
+    def __init__(self, token: str, api_url: str = TELEGRAM_API_URL, timeout_sec: float = 15.0) -> None:
+        parts = urlsplit(api_url.rstrip("/"))
+        if parts.scheme not in {"http", "https"} or not parts.hostname:
+            raise ValueError(f"无效的 Telegram API 地址: {api_url}")
+        self._conn_cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self._host = parts.hostname
+        self._port = parts.port
+        self._path = f"{parts.path}/bot{token}"
+        self.timeout_sec = timeout_sec
+        self._conn: Optional[http.client.HTTPConnection] = None
+
+    def call(self, method: str, params: Dict[str, object], timeout_sec: Optional[float] = None) -> object:
+        body = json.dumps(params, ensure_ascii=False).encode("utf-8")
+        if self._conn is None:
+            self._conn = self._conn_cls(self._host, self._port, timeout=timeout_sec or self.timeout_sec)
+        conn = self._conn
+        conn.timeout = timeout_sec or self.timeout_sec
+        if conn.sock is not None:
+            conn.sock.settimeout(conn.timeout)
+        try:
+            conn.request("POST", f"{self._path}/{method}", body=body, headers={"Content-Type": "application/json; charset=utf-8"})
+            resp = conn.getresponse()
+            raw = resp.read()
+            if resp.will_close:
+                self.close()
+        except (OSError, http.client.HTTPException) as exc:
+            self.close()
+            # The token is part of the URL path; keep it out of error messages.
+            raise TelegramError(f"{type(exc).__name__}: {exc}") from exc
+        try:
+            data = json.loads(raw.decode("utf-8"))
+        except (UnicodeDecodeError, ValueError) as exc:
+            raise TelegramError(f"HTTP {resp.status}：响应不是合法 JSON") from exc
+        if not isinstance(data, dict) or not data.get("ok"):
+            detail = data if not isinstance(data, dict) else data.get("description", "")
+            retry_after = float(dict(data.get("parameters") or {}).get("retry_after", 0) or 0) if isinstance(data, dict) else 0.0
+            raise TelegramError(f"HTTP {resp.status}：{detail}", retry_after, resp.status)
+        return data.get("result")
+
+    def abort(self) -> None:
+        """从其他线程打断正在进行的长轮询。"""
+        conn = self._conn
+        if conn is not None and conn.sock is not None:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def parse_command(text: str) -> Tuple[str, str]:
+    """"/ask@MyBot pm 你好" -> ("ask", "pm 你好")；不以 / 开头的普通消息返回 ("", 原文)。"""
+    text = text.strip()
+    if not text.startswith("/"):
+        return "", text
+    head, _, rest = text.partition(" ")
+    return head[1:].split("@", 1)[0].lower(), rest.strip()
+
+
+def pack_messages(pending: Deque[str], limit: int = MAX_MESSAGE_CHARS) -> Tuple[str, int]:
+    """从队首取出尽量多的条目合并为一条不超过 limit 字符的消息，返回 (消息, 合并条数)。
+
+    单条超长时只取前 limit 个字符，余下部分留在队首，下一条消息继续发送。
+    """
+    first = pending.popleft()
+    if len(first) > limit:
+        pending.appendleft(first[limit:])
+        return first[:limit], 1
+    parts = [first]
+    size = len(first)
+    while pending and size + 2 + len(pending[0]) <= limit:
+        item = pending.popleft()
+        parts.append(item)
+        size += 2 + len(item)
+    return "\n\n".join(parts), len(parts)
+
+
+@dataclass
+class BridgeStats:
+    posted: int = 0
+    sent_messages: int = 0
+    dropped: int = 0
+    rate_limited: int = 0
+    send_errors: int = 0
+    commands: int = 0
+
+    def summary(self) -> str:
+        return (
+            f"入队 {self.posted} 条，合并为 {self.sent_messages} 条消息发出，丢弃 {self.dropped} 条，"
+            f"限流 {self.rate_limited} 次，发送失败 {self.send_errors} 次，收到指令 {self.commands} 条"
+        )
+
+
+class TelegramBridge:
+    """把 agent 结果与选定日志转发到 Telegram 会话，并通过长轮询接收该会话中的指令。
+
+    post() 只把文本放进内存队列，立即返回；发送线程先等待 LINGER_SEC 收拢一批，再按令牌桶限速
+    合并成不超过 4096 字符的消息发送。队列超过 MAX_PENDING 条时丢弃最旧的条目并在下一条消息中注明。
+    只接受配置的 chat_id 发来的消息，其余一律忽略。
+    """
+
+    def __init__(
+        self,
+        token: str,
+        chat_id: str,
+        on_message: Callable[[str, str], None],
+        api_url: str = TELEGRAM_API_URL,
+        timeout_sec: float = 15.0,
+    ) -> None:
+        self.chat_id = str(chat_id).strip()
+        self.on_message = on_message
+        self._send_api = TelegramApi(token, api_url, timeout_sec)
+        self._poll_api = TelegramApi(token, api_url, POLL_TIMEOUT_SEC + timeout_sec)
+        rate = GROUP_RATE_PER_SEC if self.chat_id.startswith("-") else CHAT_RATE_PER_SEC
+        self.bucket = TokenBucket(rate * RATE_SAFETY, BURST)
+        self.stats = BridgeStats()
+        self.last_error = ""
+        self._pending: Deque[str] = deque()
+        self._dropped_unreported = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._send_loop, name="telegram-send", daemon=True),
+            threading.Thread(target=self._poll_loop, name="telegram-poll", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, flush_sec: float = 2.0) -> None:
+        """停止收发；最多用 flush_sec 秒把已排队的消息发出去。"""
+        deadline = time.monotonic() + flush_sec
+        with self._cond:
+            while self._pending and time.monotonic() < deadline:
+                self._cond.wait(0.05)
+            self._stop.set()
+            self._cond.notify_all()
+        self._poll_api.abort()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        self._send_api.close()
+        self._poll_api.close()
+
+    def post(self, text: str) -> None:
+        """非阻塞地排队一条要发送的文本。"""
+        text = text.strip()
+        if not text:
+            return
+        with self._cond:
+            self._pending.append(text)
+            self.stats.posted += 1
+            if len(self._pending) > MAX_PENDING:
+                self._pending.popleft()
+                self.stats.dropped += 1
+                self._dropped_unreported += 1
+            self._cond.notify()
+
+    def pending_count(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def _acquire_send_slot(self) -> bool:
+        while not self.bucket.try_take():
+            if self._stop.wait(max(0.01, self.bucket.wait_time())):
+                return False
+        return True
+
+    def _next_message(self) -> Optional[str]:
+        with self._cond:
+            while not self._pending and not self._stop.is_set():
+                self._cond.wait()
+            if not self._pending:
+                return None
+        # Let a burst of log lines arrive so they go out as one message instead of many.
+        self._stop.wait(LINGER_SEC)
+        # Whatever arrives while waiting for the rate limiter joins the same message.
+        if not self._acquire_send_slot():
+            return None
+        with self._cond:
+            if self._dropped_unreported:
+                self._pending.appendleft(f"（队列已满，省略了 {self._dropped_unreported} 条较早的消息）")
+                self._dropped_unreported = 0
+            text, _ = pack_messages(self._pending)
+            self._cond.notify_all()
+        return text
+
+    def _send_loop(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            text = self._next_message()
+            if text is None:
+                continue
+            while True:
+                try:
+                    self._send_api.call("sendMessage", {"chat_id": self.chat_id, "text": text, "disable_web_page_preview": True})
+                    self.stats.sent_messages += 1
+                    backoff = 1.0
+                    break
+                except TelegramError as exc:
+                    self.last_error = str(exc)
+                    if exc.permanent:
+                        # Retrying the same text would block every later message behind it.
+                        self.stats.send_errors += 1
+                        self.last_error = f"已丢弃无法发送的消息：{exc}"
+                        break
+                    if exc.retry_after:
+                        self.stats.rate_limited += 1
+                        self.bucket.penalize(exc.retry_after)
+                    else:
+                        self.stats.send_errors += 1
+                        if self._stop.wait(backoff):
+                            return
+                        backoff = min(MAX_BACKOFF_SEC, backoff * 2)
+                    if not self._acquire_send_slot():
+                        return
+
+    def _poll_loop(self) -> None:
+        offset = self._skip_backlog()
+        if offset is None:
+            return
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                updates = self._poll_api.call(
+                    "getUpdates", {"offset": offset, "timeout": POLL_TIMEOUT_SEC, "allowed_updates": ["message"]}
+                )
+                backoff = 1.0
+            except TelegramError as exc:
+                if self._stop.is_set():
+                    return
+                self.last_error = str(exc)
+                self._stop.wait(exc.retry_after or backoff)
+                backoff = min(MAX_BACKOFF_SEC, backoff * 2)
+                continue
+            for update in updates or []:
+                offset = max(offset, int(update.get("update_id", 0)) + 1)
+                message = update.get("message") or {}
+                if str(dict(message.get("chat") or {}).get("id", "")) != self.chat_id:
+                    continue
+                text = str(message.get("text") or "").strip()
+                if text:
+                    self.stats.commands += 1
+                    command, args = parse_command(text)
+                    try:
+                        self.on_message(command, args)
+                    except Exception as exc:  # noqa: BLE001
+                        self.last_error = f"指令处理失败: {exc}"
+
+    def _skip_backlog(self) -> Optional[int]:
+        """返回第一条要处理的 update_id；失败时退避重试，直到成功或桥接停止（返回 None）。"""
+        # Commands sent while the app was closed are stale; start after the newest pending update.
+        # Polling from offset 0 after a failed attempt would replay every one of them as a new dialog.
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                updates = self._poll_api.call("getUpdates", {"offset": -1, "timeout": 0})
+            except TelegramError as exc:
+                self.last_error = str(exc)
+                self._stop.wait(exc.retry_after or backoff)
+                backoff = min(MAX_BACKOFF_SEC, backoff * 2)
+                continue
+            return int(updates[-1].get("update_id", 0)) + 1 if updates else 0
+        return None
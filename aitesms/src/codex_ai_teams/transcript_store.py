@@ -0,0 +1,207 @@
+import json
+import re
+import struct
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+_OFFSET = struct.Struct("<Q")
+_SAFE_NAME = re.compile(r"[^0-9A-Za-z._-]+")
+
+
+@dataclass
+class TranscriptTurn:
+    ts: str
+    role: str
+    content: str
+    status: str = ""
+
+
+@dataclass
+class _SessionState:
+    directory: Path
+    segments: List[int] = field(default_factory=list)
+    counts: List[int] = field(default_factory=list)
+    active_bytes: int = 0
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts)
+
+
+class TranscriptStore:
+    """按 agent / session 存放的追加式对话记录。
+
+    目录结构：<root>/<agent_id>/<session_id>/000001.jsonl + 000001.idx，
+    .idx 为每条记录在 .jsonl 中的起始偏移（8 字节小端），追加为 O(1)，按序号分页读取只需定位两个偏移。
+    """
+
+    def __init__(self, root: Path, segment_bytes: int = 4 * 1024 * 1024, max_segments: int = 8) -> None:
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self._states: Dict[Tuple[str, str], _SessionState] = {}
+        self._lock = Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def append(self, agent_id: str, session_id: str, role: str, content: str, status: str = "") -> int:
+        turn = TranscriptTurn(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), role, content, status)
+        line = (json.dumps(asdict(turn), ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            state = self._state(agent_id, session_id)
+            if not state.segments or (state.active_bytes and state.active_bytes + len(line) > self.segment_bytes):
+                state.segments.append((state.segments[-1] + 1) if state.segments else 1)
+                state.counts.append(0)
+                state.active_bytes = 0
+            seg = state.segments[-1]
+            with self._data_path(state, seg).open("ab") as data, self._index_path(state, seg).open("ab") as index:
+                index.write(_OFFSET.pack(state.active_bytes))
+                data.write(line)
+            state.active_bytes += len(line)
+            state.counts[-1] += 1
+            return state.total - 1
+
+    def count(self, agent_id: str, session_id: str) -> int:
+        with self._lock:
+            return self._state(agent_id, session_id).total
+
+    def read_recent(
+        self,
+        agent_id: str,
+        session_id: str,
+        limit: int = 20,
+        before: Optional[int] = None,
+    ) -> List[Tuple[int, TranscriptTurn]]:
+        """返回 [start, before) 区间内最近 limit 条记录及其序号；before 为上一页第一条的序号。"""
+        with self._lock:
+            state = self._state(agent_id, session_id)
+            end = state.total if before is None else max(0, min(before, state.total))
+            start = max(0, end - max(0, limit))
+            return self._read_range(state, start, end)
+
+    def sessions(self, agent_id: str) -> List[str]:
+        agent_dir = self.root / self._safe(agent_id)
+        if not agent_dir.is_dir():
+            return []
+        return sorted(p.name for p in agent_dir.iterdir() if p.is_dir())
+
+    def compact(self, agent_id: str, session_id: str, keep_last: Optional[int] = None) -> None:
+        """合并分段；指定 keep_last 时只保留最近 keep_last 条。"""
+        with self._lock:
+            self._compact_locked(self._state(agent_id, session_id), keep_last)
+
+    def compact_all(self, keep_last: Optional[int] = None) -> int:
+        """合并分段数超过 max_segments 的所有 session，返回处理的 session 数。"""
+        compacted = 0
+        for agent_dir in (p for p in self.root.iterdir() if p.is_dir()):
+            for session_dir in (p for p in agent_dir.iterdir() if p.is_dir()):
+                if len(list(session_dir.glob("*.idx"))) <= self.max_segments:
+                    continue
+                with self._lock:
+                    self._compact_locked(self._state_for_dir(session_dir), keep_last)
+                compacted += 1
+        return compacted
+
+    def import_legacy(self, legacy_dir: Path) -> int:
+        """导入旧版 .agent_sessions/<agent>_<session>.json 整文件数组，已存在的 session 不重复导入。"""
+        imported = 0
+        for path in sorted(legacy_dir.glob("*.json")):
+            agent_id, sep, session_id = path.stem.partition("_")
+            if not sep or (self.root / self._safe(agent_id) / self._safe(session_id)).exists():
+                continue
+            try:
+                items = json.loads(path.read_text(encoding="utf-8-sig"))
+            except Exception:  # noqa: BLE001
+                continue
+            for item in items if isinstance(items, list) else []:
+                if isinstance(item, dict) and item.get("content"):
+                    self.append(agent_id, session_id, str(item.get("role", "")), str(item["content"]))
+                    imported += 1
+        return imported
+
+    def _state(self, agent_id: str, session_id: str) -> _SessionState:
+        return self._state_for_dir(self.root / self._safe(agent_id) / self._safe(session_id))
+
+    def _state_for_dir(self, directory: Path) -> _SessionState:
+        key = (directory.parent.name, directory.name)
+        state = self._states.get(key)
+        if state is None:
+            directory.mkdir(parents=True, exist_ok=True)
+            state = _SessionState(directory)
+            for idx_path in sorted(directory.glob("*.idx")):
+                state.segments.append(int(idx_path.stem))
+                state.counts.append(idx_path.stat().st_size // _OFFSET.size)
+            if state.segments:
+                data_path = self._data_path(state, state.segments[-1])
+                state.active_bytes = data_path.stat().st_size if data_path.exists() else 0
+            self._states[key] = state
+        return state
+
+    def _read_range(self, state: _SessionState, start: int, end: int) -> List[Tuple[int, TranscriptTurn]]:
+        out: List[Tuple[int, TranscriptTurn]] = []
+        base = 0
+        for seg, count in zip(state.segments, state.counts):
+            lo, hi = max(start, base), min(end, base + count)
+            if lo < hi:
+                for offset, turn in enumerate(self._read_segment(state, seg, lo - base, hi - base)):
+                    out.append((lo + offset, turn))
+            base += count
+            if base >= end:
+                break
+        return out
+
+    def _read_segment(self, state: _SessionState, seg: int, first: int, last: int) -> List[TranscriptTurn]:
+        with self._index_path(state, seg).open("rb") as index:
+            index.seek(first * _OFFSET.size)
+            raw = index.read((last - first + 1) * _OFFSET.size)
+        offsets = [_OFFSET.unpack_from(raw, i * _OFFSET.size)[0] for i in range(len(raw) // _OFFSET.size)]
+        with self._data_path(state, seg).open("rb") as data:
+            data.seek(offsets[0])
+            # The last requested record runs to the next offset, or to EOF when it is the segment tail.
+            blob = data.read(offsets[-1] - offsets[0]) if len(offsets) > last - first else data.read()
+        turns: List[TranscriptTurn] = []
+        # Split on raw newlines only: str.splitlines would also break on U+2028 kept by ensure_ascii=False.
+        for line in blob.split(b"\n"):
+            if line.strip():
+                item = json.loads(line.decode("utf-8", errors="replace"))
+                turns.append(TranscriptTurn(item.get("ts", ""), item.get("role", ""), item.get("content", ""), item.get("status", "")))
+        return turns[: last - first]
+
+    def _compact_locked(self, state: _SessionState, keep_last: Optional[int]) -> None:
+        total = state.total
+        start = 0 if keep_last is None else max(0, total - keep_last)
+        if len(state.segments) <= 1 and start == 0:
+            return
+        turns = [turn for _, turn in self._read_range(state, start, total)]
+        new_seg = (state.segments[-1] + 1) if state.segments else 1
+        offset = 0
+        tmp_data = self._data_path(state, new_seg).with_suffix(".jsonl.tmp")
+        tmp_index = self._index_path(state, new_seg).with_suffix(".idx.tmp")
+        with tmp_data.open("wb") as data, tmp_index.open("wb") as index:
+            for turn in turns:
+                line = (json.dumps(asdict(turn), ensure_ascii=False) + "\n").encode("utf-8")
+                index.write(_OFFSET.pack(offset))
+                data.write(line)
+                offset += len(line)
+        tmp_data.replace(self._data_path(state, new_seg))
+        tmp_index.replace(self._index_path(state, new_seg))
+        for seg in state.segments:
+            self._index_path(state, seg).unlink(missing_ok=True)
+            self._data_path(state, seg).unlink(missing_ok=True)
+        state.segments = [new_seg]
+        state.counts = [len(turns)]
+        state.active_bytes = offset
+
+    @staticmethod
+    def _safe(name: str) -> str:
+        return _SAFE_NAME.sub("_", name.strip()) or "_"
+
+    @staticmethod
+    def _data_path(state: _SessionState, seg: int) -> Path:
+        return state.directory / f"{seg:06d}.jsonl"
+
+    @staticmethod
+    def _index_path(state: _SessionState, seg: int) -> Path:
+        return state.directory / f"{seg:06d}.idx"
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple
+
+from PySide6.QtGui import QFont
+from PySide6.QtWidgets import (
+    QComboBox,
+    QGridLayout,
+    QHBoxLayout,
+    QLabel,
+    QPlainTextEdit,
+    QPushButton,
+    QVBoxLayout,
+    QWidget,
+)
+
+BUFFER_LINES = 2000
+LAYOUTS = [("1×1", 1, 1), ("2×2", 2, 2), ("3×3", 3, 3), ("4×4", 4, 4)]
+
+
+class _Tile(QWidget):
+    def __init__(self, font: QFont, parent=None) -> None:
+        super().__init__(parent)
+        self.agent_id: Optional[str] = None
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.title = QLabel()
+        self.panel = QPlainTextEdit()
+        self.panel.setReadOnly(True)
+        self.panel.setMaximumBlockCount(BUFFER_LINES)
+        self.panel.setFont(font)
+        layout.addWidget(self.title)
+        layout.addWidget(self.panel, 1)
+
+
+class AgentTerminalGrid(QWidget):
+    """按页平铺的 agent 终端：只为当前页创建编辑器，其余 agent 的输出保存在有界缓冲里，翻到该页时一次性填入。"""
+
+    def __init__(self, font: QFont, parent=None) -> None:
+        super().__init__(parent)
+        self._font = font
+        self._agents: List[Tuple[str, str]] = []
+        self._buffers: Dict[str, Deque[str]] = {}
+        self._tiles: Dict[str, _Tile] = {}
+        self._unread: Set[str] = set()
+        self._page = 0
+        self._rows, self._cols = 2, 2
+
+        self.prev_btn = QPushButton("◀")
+        self.prev_btn.clicked.connect(lambda: self.set_page(self._page - 1))
+        self.next_btn = QPushButton("▶")
+        self.next_btn.clicked.connect(lambda: self.set_page(self._page + 1))
+        self.page_label = QLabel()
+        self.layout_combo = QComboBox()
+        for label, rows, cols in LAYOUTS:
+            self.layout_combo.addItem(label, (rows, cols))
+        self.layout_combo.setCurrentIndex(1)
+        self.layout_combo.currentIndexChanged.connect(self._on_layout_changed)
+        bar = QHBoxLayout()
+        bar.addWidget(self.prev_btn)
+        bar.addWidget(self.page_label)
+        bar.addWidget(self.next_btn)
+        bar.addStretch(1)
+        bar.addWidget(self.layout_combo)
+
+        self._grid_holder = QWidget()
+        self._grid = QGridLayout(self._grid_holder)
+        self._grid.setContentsMargins(0, 0, 0, 0)
+        self._grid.setHorizontalSpacing(10)
+        self._grid.setVerticalSpacing(10)
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(bar)
+        layout.addWidget(self._grid_holder, 1)
+
+    @property
+    def page_size(self) -> int:
+        return self._rows * self._cols
+
+    @property
+    def page_count(self) -> int:
+        return max(1, -(-len(self._agents) // self.page_size))
+
+    def set_agents(self, agents: List[Tuple[str, str]]) -> None:
+        """agents: [(agent_id, 标题)]；已有 agent 的缓冲保留。"""
+        self._agents = list(agents)
+        ids = {agent_id for agent_id, _ in agents}
+        self._buffers = {agent_id: self._buffers.get(agent_id) or deque(maxlen=BUFFER_LINES) for agent_id in ids}
+        self._unread &= ids
+        self.set_page(min(self._page, self.page_count - 1))
+
+    def visible_agents(self) -> List[str]:
+        return list(self._tiles)
+
+    def buffered_lines(self) -> int:
+        return sum(len(buf) for buf in self._buffers.values())
+
+    def show_agent(self, agent_id: str) -> None:
+        ids = [agent_id for agent_id, _ in self._agents]
+        if agent_id in ids:
+            self.set_page(ids.index(agent_id) // self.page_size)
+
+    def append(self, agent_id: str, line: str) -> None:
+        buf = self._buffers.get(agent_id)
+        if buf is None:
+            return
+        buf.append(line)
+        tile = self._tiles.get(agent_id)
+        if tile is not None:
+            tile.panel.appendPlainText(line)
+        elif agent_id not in self._unread:
+            self._unread.add(agent_id)
+            self._update_page_label()
+
+    def clear_unread(self) -> None:
+        self._unread.clear()
+        self._update_page_label()
+
+    def _on_layout_changed(self) -> None:
+        first = self._page * self.page_size
+        self._rows, self._cols = self.layout_combo.currentData()
+        self.set_page(first // self.page_size)
+
+    def set_page(self, page: int) -> None:
+        self._page = max(0, min(page, self.page_count - 1))
+        start = self._page * self.page_size
+        shown = self._agents[start : start + self.page_size]
+        tiles = list(self._tiles.values())
+        # Tiles are reused across pages; only as many editors exist as fit on one page.
+        while len(tiles) < len(shown):
+            tiles.append(_Tile(self._font))
+        for tile in tiles[len(shown) :]:
+            self._grid.removeWidget(tile)
+            tile.deleteLater()
+        self._tiles = {}
+        for idx, ((agent_id, title), tile) in enumerate(zip(shown, tiles)):
+            tile.title.setText(title)
+            if tile.agent_id != agent_id:
+                tile.agent_id = agent_id
+                tile.panel.setPlaceholderText(f"{agent_id} 终端输出")
+                tile.panel.setPlainText("\n".join(self._buffers[agent_id]))
+                tile.panel.verticalScrollBar().setValue(tile.panel.verticalScrollBar().maximum())
+            self._grid.addWidget(tile, idx // self._cols, idx % self._cols)
+            self._tiles[agent_id] = tile
+            self._unread.discard(agent_id)
+        for row in range(4):
+            self._grid.setRowStretch(row, 1 if row < self._rows else 0)
+        for col in range(4):
+            self._grid.setColumnStretch(col, 1 if col < self._cols else 0)
+        self._update_page_label()
+
+    def _update_page_label(self) -> None:
+        text = f"{self._page + 1} / {self.page_count}（{len(self._agents)} 个 agent）"
+        if self._unread:
+            text += f"，其他页有新输出：{', '.join(sorted(a.upper() for a in self._unread)[:6])}"
+            if len(self._unread) > 6:
+                text += " …"
+        self.page_label.setText(text)
+        self.prev_btn.setEnabled(self._page > 0)
+        self.next_btn.setEnabled(self._page < self.page_count - 1)
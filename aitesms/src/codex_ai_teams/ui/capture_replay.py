@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import time
+from typing import Iterator, List, Optional, Tuple
+
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QFontDatabase
+from PySide6.QtWidgets import (
+    QComboBox,
+    QDialog,
+    QHBoxLayout,
+    QLabel,
+    QListWidget,
+    QListWidgetItem,
+    QPlainTextEdit,
+    QPushButton,
+    QSplitter,
+    QVBoxLayout,
+    QWidget,
+)
+
+from ..stream_capture import CaptureInfo, CaptureStore, iter_events
+
+TICK_MS = 30
+MAX_VIEW_LINES = 20000
+INSTANT_LINES_PER_TICK = 2000
+SPEEDS = [("1x", 1.0), ("4x", 4.0), ("16x", 16.0), ("64x", 64.0), ("即时", 0.0)]
+
+
+class CaptureReplayDialog(QDialog):
+    """按原始节奏（或加速）回放某次 CLI 运行的原始输出捕获；文件按需流式解压，不整体读入内存。"""
+
+    def __init__(self, store: CaptureStore, agent_ids: List[str], parent=None) -> None:
+        super().__init__(parent)
+        self.setWindowTitle("原始输出回放")
+        self.resize(1100, 650)
+        self.store = store
+        self._events: Optional[Iterator[Tuple[int, str]]] = None
+        self._next: Optional[Tuple[int, str]] = None
+        self._info: Optional[CaptureInfo] = None
+        self._base_ms = 0.0
+        self._play_started = 0.0
+        self._shown = 0
+
+        self.agent_combo = QComboBox()
+        self.agent_combo.addItem("全部", "")
+        for agent_id in agent_ids:
+            self.agent_combo.addItem(agent_id.upper(), agent_id)
+        self.agent_combo.currentIndexChanged.connect(self.reload)
+        refresh_btn = QPushButton("刷新")
+        refresh_btn.clicked.connect(self.reload)
+        self.totals_label = QLabel()
+        top = QHBoxLayout()
+        top.addWidget(self.agent_combo)
+        top.addWidget(refresh_btn)
+        top.addWidget(self.totals_label, 1)
+
+        self.capture_list = QListWidget()
+        self.capture_list.currentItemChanged.connect(lambda item, _prev: self._select(item))
+
+        self.play_btn = QPushButton("播放")
+        self.play_btn.clicked.connect(self.toggle_play)
+        self.speed_combo = QComboBox()
+        for label, speed in SPEEDS:
+            self.speed_combo.addItem(label, speed)
+        self.speed_combo.currentIndexChanged.connect(lambda _: self._rebase())
+        self.progress_label = QLabel()
+        controls = QHBoxLayout()
+        controls.addWidget(self.play_btn)
+        controls.addWidget(self.speed_combo)
+        controls.addWidget(self.progress_label, 1)
+
+        self.output = QPlainTextEdit()
+        self.output.setReadOnly(True)
+        self.output.setMaximumBlockCount(MAX_VIEW_LINES)
+        self.output.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        right = QWidget()
+        right_layout = QVBoxLayout(right)
+        right_layout.setContentsMargins(0, 0, 0, 0)
+        right_layout.addLayout(controls)
+        right_layout.addWidget(self.output, 1)
+
+        splitter = QSplitter(Qt.Horizontal)
+        splitter.addWidget(self.capture_list)
+        splitter.addWidget(right)
+        splitter.setSizes([360, 740])
+        layout = QVBoxLayout(self)
+        layout.addLayout(top)
+        layout.addWidget(splitter, 1)
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(TICK_MS)
+        self._timer.timeout.connect(self._tick)
+        self.reload()
+
+    def reload(self) -> None:
+        self._stop()
+        self.capture_list.clear()
+        infos = self.store.list(self.agent_combo.currentData() or None)
+        raw = sum(i.raw_bytes for i in infos)
+        stored = sum(i.stored_bytes for i in infos)
+        ratio = f"，压缩率 {stored / raw:.0%}" if raw else ""
+        self.totals_label.setText(f"{len(infos)} 次运行，原始 {raw / 1024:.1f} KB → 磁盘 {stored / 1024:.1f} KB{ratio}")
+        for info in infos:
+            status = info.status or "运行中/未完成"
+            text = f"{info.started}  {info.agent_id.upper()}  {status}  {info.lines} 行  {info.duration_sec:.1f}s\n{info.prompt[:60]}"
+            item = QListWidgetItem(text)
+            item.setData(Qt.UserRole, info)
+            self.capture_list.addItem(item)
+
+    def _select(self, item: Optional[QListWidgetItem]) -> None:
+        self._stop()
+        self.output.clear()
+        self._info = item.data(Qt.UserRole) if item is not None else None
+        self._events = iter_events(self._info) if self._info is not None else None
+        self._next = None
+        self._base_ms = 0.0
+        self._shown = 0
+        self._update_progress()
+
+    def toggle_play(self) -> None:
+        if self._timer.isActive():
+            self._base_ms = self._virtual_ms()
+            self._stop()
+            return
+        if self._events is None:
+            return
+        self._play_started = time.monotonic()
+        self._timer.start()
+        self.play_btn.setText("暂停")
+
+    def _stop(self) -> None:
+        self._timer.stop()
+        self.play_btn.setText("播放")
+
+    def _speed(self) -> float:
+        return float(self.speed_combo.currentData() or 0.0)
+
+    def _virtual_ms(self) -> float:
+        if not self._timer.isActive():
+            return self._base_ms
+        return self._base_ms + (time.monotonic() - self._play_started) * 1000 * self._speed()
+
+    def _rebase(self) -> None:
+        # Changing speed mid-playback continues from the current position.
+        if self._timer.isActive():
+            self._base_ms = self._virtual_ms() if self._speed() else self._base_ms
+            self._play_started = time.monotonic()
+
+    def _tick(self) -> None:
+        if self._events is None:
+            self._stop()
+            return
+        instant = self._speed() == 0.0
+        limit_ms = self._virtual_ms()
+        batch: List[str] = []
+        while len(batch) < INSTANT_LINES_PER_TICK:
+            if self._next is None:
+                self._next = next(self._events, None)
+                if self._next is None:
+                    self._events = None
+                    break
+            ms, line = self._next
+            if not instant and ms > limit_ms:
+                break
+            batch.append(f"[+{ms / 1000:8.3f}s] {line}")
+            self._base_ms = max(self._base_ms, ms) if instant else self._base_ms
+            self._next = None
+        if batch:
+            self._shown += len(batch)
+            self.output.appendPlainText("\n".join(batch))
+        if self._events is None:
+            self._stop()
+        self._update_progress()
+
+    def _update_progress(self) -> None:
+        if self._info is None:
+            self.progress_label.clear()
+            return
+        total = self._info.lines or "?"
+        done = "（已结束）" if self._events is None else ""
+        self.progress_label.setText(f"{self._shown} / {total} 行{done}")
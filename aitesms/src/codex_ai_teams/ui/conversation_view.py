@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, QRect, QSize, QSortFilterProxyModel, Qt, Signal
+from PySide6.QtGui import QColor, QFontMetrics, QPainter
+from PySide6.QtWidgets import QAbstractItemView, QListView, QStyle, QStyledItemDelegate, QStyleOptionViewItem, QTabBar, QVBoxLayout, QWidget
+
+MESSAGE_ROLE = Qt.UserRole + 1
+COLLAPSED_LINES = 6
+COLLAPSED_CHARS = 600
+
+
+@dataclass
+class ChatMessage:
+    ts: str
+    agent_id: str
+    title: str
+    content: str
+    failed: bool = False
+    expanded: bool = False
+    # (width, expanded) -> height; long replies are measured once per layout width.
+    _heights: Dict[Tuple[int, bool], int] = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def collapsible(self) -> bool:
+        return self.content.count("\n") >= COLLAPSED_LINES or len(self.content) > COLLAPSED_CHARS
+
+    def visible_text(self) -> str:
+        if self.expanded or not self.collapsible:
+            return self.content
+        preview = "\n".join(self.content.splitlines()[:COLLAPSED_LINES])[:COLLAPSED_CHARS]
+        return preview + f"\n…（共 {self.content.count(chr(10)) + 1} 行，点击展开）"
+
+
+class ConversationModel(QAbstractListModel):
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self._messages: List[ChatMessage] = []
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:  # noqa: N802
+        return 0 if parent.isValid() else len(self._messages)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        msg = self._messages[index.row()]
+        if role == MESSAGE_ROLE:
+            return msg
+        if role == Qt.DisplayRole:
+            return f"{msg.title} {msg.content}"
+        return None
+
+    def append(self, msg: ChatMessage) -> None:
+        row = len(self._messages)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._messages.append(msg)
+        self.endInsertRows()
+
+    def prepend(self, msgs: List[ChatMessage]) -> None:
+        if not msgs:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(msgs) - 1)
+        self._messages[:0] = msgs
+        self.endInsertRows()
+
+    def trim_front(self, keep: int) -> int:
+        extra = len(self._messages) - keep
+        if extra <= 0:
+            return 0
+        self.beginRemoveRows(QModelIndex(), 0, extra - 1)
+        del self._messages[:extra]
+        self.endRemoveRows()
+        return extra
+
+    def toggle_expanded(self, row: int) -> None:
+        msg = self._messages[row]
+        if not msg.collapsible:
+            return
+        msg.expanded = not msg.expanded
+        idx = self.index(row)
+        self.dataChanged.emit(idx, idx)
+
+    def messages(self) -> List[ChatMessage]:
+        return list(self._messages)
+
+    def clear(self) -> None:
+        self.beginResetModel()
+        self._messages.clear()
+        self.endResetModel()
+
+
+class AgentFilterProxy(QSortFilterProxyModel):
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self._agent_id: Optional[str] = None
+
+    def set_agent(self, agent_id: Optional[str]) -> None:
+        self._agent_id = agent_id
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:  # noqa: N802
+        if self._agent_id is None:
+            return True
+        msg = self.sourceModel().index(source_row, 0, source_parent).data(MESSAGE_ROLE)
+        return msg is not None and msg.agent_id == self._agent_id
+
+
+class MessageDelegate(QStyledItemDelegate):
+    PADDING = 6
+
+    def __init__(self, view: QListView) -> None:
+        super().__init__(view)
+        self._view = view
+        self.title_color = QColor("#2ecc71")
+        self.error_color = QColor("#ff4d4f")
+        self.meta_color = QColor("#888888")
+        self.text_color = QColor("#FFFFFF")
+
+    def _text_width(self) -> int:
+        return max(80, self._view.viewport().width() - 2 * self.PADDING)
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:  # noqa: N802
+        msg: ChatMessage = index.data(MESSAGE_ROLE)
+        width = self._text_width()
+        key = (width, msg.expanded)
+        height = msg._heights.get(key)
+        if height is None:
+            fm = QFontMetrics(option.font)
+            body = fm.boundingRect(QRect(0, 0, width, 1 << 24), Qt.TextWordWrap, msg.visible_text()).height()
+            height = fm.height() + body + 3 * self.PADDING
+            msg._heights[key] = height
+        return QSize(width, height)
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex) -> None:
+        msg: ChatMessage = index.data(MESSAGE_ROLE)
+        painter.save()
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(option.rect, QColor("#1f5f3b"))
+        fm = QFontMetrics(option.font)
+        rect = option.rect.adjusted(self.PADDING, self.PADDING, -self.PADDING, -self.PADDING)
+
+        painter.setPen(self.error_color if msg.failed else self.title_color)
+        painter.drawText(rect.left(), rect.top() + fm.ascent(), msg.title)
+        painter.setPen(self.meta_color)
+        painter.drawText(rect.left() + fm.horizontalAdvance(msg.title) + 12, rect.top() + fm.ascent(), msg.ts)
+
+        painter.setPen(self.text_color)
+        body = QRect(rect.left(), rect.top() + fm.height() + self.PADDING, rect.width(), rect.height() - fm.height())
+        painter.drawText(body, Qt.TextWordWrap, msg.visible_text())
+        painter.setPen(QColor("#222222"))
+        painter.drawLine(option.rect.bottomLeft(), option.rect.bottomRight())
+        painter.restore()
+
+
+class ConversationView(QWidget):
+    """团队对话视图：消息列表模型 + 自绘委托，只绘制可见消息，长回复默认折叠、点击展开。"""
+
+    top_reached = Signal()
+    # Rows dropped from the top once the user is back at the bottom (see append_message).
+    front_trimmed = Signal(int)
+
+    def __init__(self, parent=None, max_messages: int = 2000) -> None:
+        super().__init__(parent)
+        self.max_messages = max_messages
+        self.model = ConversationModel(self)
+        self.proxy = AgentFilterProxy(self)
+        self.proxy.setSourceModel(self.model)
+
+        self.tabs = QTabBar()
+        self.tabs.setExpanding(False)
+        self.tabs.currentChanged.connect(self._on_tab_changed)
+
+        self.list_view = QListView()
+        self.list_view.setModel(self.proxy)
+        self.list_view.setItemDelegate(MessageDelegate(self.list_view))
+        self.list_view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        self.list_view.setResizeMode(QListView.Adjust)
+        self.list_view.setLayoutMode(QListView.Batched)
+        self.list_view.setBatchSize(50)
+        self.list_view.setSelectionMode(QAbstractItemView.NoSelection)
+        self.list_view.setUniformItemSizes(False)
+        self.list_view.clicked.connect(self._on_clicked)
+        self.list_view.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+        layout.addWidget(self.tabs)
+        layout.addWidget(self.list_view)
+
+    def set_agents(self, agents: List[Tuple[Optional[str], str]]) -> None:
+        """agents: [(agent_id 或 None 表示全部, 标签)]。"""
+        self.tabs.blockSignals(True)
+        while self.tabs.count():
+            self.tabs.removeTab(0)
+        for agent_id, label in agents:
+            idx = self.tabs.addTab(label)
+            self.tabs.setTabData(idx, agent_id)
+        self.tabs.blockSignals(False)
+        self.tabs.setCurrentIndex(0)
+        self._on_tab_changed(0)
+
+    def append_message(self, msg: ChatMessage) -> int:
+        """追加一条消息，返回因超出 max_messages 从顶部移除的条数。
+
+        只在视图停在底部时裁剪：用户向上翻看（含刚分页载入的历史）时不丢弃任何消息，回到底部后再一并裁剪。
+        """
+        follow = self._at_bottom()
+        self.model.append(msg)
+        if not follow:
+            return 0
+        trimmed = self.model.trim_front(self.max_messages)
+        self.list_view.scrollToBottom()
+        return trimmed
+
+    def prepend_messages(self, msgs: List[ChatMessage]) -> None:
+        bar = self.list_view.verticalScrollBar()
+        old_max = bar.maximum()
+        self.model.prepend(msgs)
+        self.list_view.doItemsLayout()
+        bar.setValue(bar.maximum() - old_max + bar.value())
+
+    def message_count(self) -> int:
+        return self.model.rowCount()
+
+    def scroll_to_bottom(self) -> None:
+        self.list_view.scrollToBottom()
+
+    def to_plain_text(self) -> str:
+        return "\n".join(f"{m.title} {m.content}" for m in self.model.messages())
+
+    def _on_tab_changed(self, idx: int) -> None:
+        self.proxy.set_agent(self.tabs.tabData(idx) if idx >= 0 else None)
+        self.list_view.scrollToBottom()
+
+    def _on_clicked(self, index: QModelIndex) -> None:
+        self.model.toggle_expanded(self.proxy.mapToSource(index).row())
+
+    def _at_bottom(self) -> bool:
+        bar = self.list_view.verticalScrollBar()
+        return bar.value() >= bar.maximum() - 4
+
+    def _on_scrolled(self, value: int) -> None:
+        bar = self.list_view.verticalScrollBar()
+        if value == bar.minimum() and bar.maximum() > 0:
+            self.top_reached.emit()
+        elif value == bar.maximum() and self.model.rowCount() > self.max_messages:
+            trimmed = self.model.trim_front(self.max_messages)
+            self.list_view.scrollToBottom()
+            self.front_trimmed.emit(trimmed)
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QColor, QFontDatabase, QFontMetrics, QPainter
+from PySide6.QtWidgets import QCheckBox, QHBoxLayout, QLabel, QLineEdit, QScrollBar, QVBoxLayout, QWidget
+
+from ..file_preview import MAX_LINE_CHARS, MappedFile
+
+REFRESH_MS = 250
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return ""
+
+
+class _LinesCanvas(QWidget):
+    """只绘制可见窗口内的行；行内容每次绘制时从 mmap 解码。"""
+
+    def __init__(self, view: "FilePreviewView") -> None:
+        super().__init__(view)
+        self._view = view
+        self.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.setFocusPolicy(Qt.StrongFocus)
+        self.setAutoFillBackground(True)
+
+    def line_height(self) -> int:
+        return QFontMetrics(self.font()).height()
+
+    def visible_lines(self) -> int:
+        return max(1, self.height() // self.line_height())
+
+    def paintEvent(self, event) -> None:  # noqa: N802
+        view = self._view
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), self.palette().base())
+        if view.file is None:
+            painter.setPen(self.palette().color(self.foregroundRole()))
+            painter.drawText(self.rect(), Qt.AlignCenter, view.placeholder)
+            return
+        fm = QFontMetrics(self.font())
+        lh, ascent = fm.height(), fm.ascent()
+        top = view.vbar.value()
+        total = view.file.line_count
+        gutter = fm.horizontalAdvance("9" * len(str(total))) + 12
+        painter.fillRect(0, 0, gutter, self.height(), self.palette().alternateBase())
+        x_text = gutter + 6 - view.hbar.value()
+        for row, text in enumerate(view.file.lines(top, self.visible_lines() + 1)):
+            y = row * lh
+            line_no = top + row + 1
+            if line_no == view.highlight_line:
+                painter.fillRect(gutter, y, self.width() - gutter, lh, QColor(255, 230, 140, 120))
+            painter.setPen(QColor(130, 130, 130))
+            painter.drawText(0, y, gutter - 6, lh, Qt.AlignRight | Qt.AlignVCenter, str(line_no))
+            painter.setPen(self.palette().color(self.foregroundRole()))
+            painter.setClipRect(gutter, 0, self.width() - gutter, self.height())
+            painter.drawText(x_text, y + ascent, text.replace("\t", "    "))
+            painter.setClipping(False)
+
+    def wheelEvent(self, event) -> None:  # noqa: N802
+        steps = event.angleDelta().y() // 40
+        if event.modifiers() & Qt.ShiftModifier:
+            self._view.hbar.setValue(self._view.hbar.value() - steps * 20)
+        else:
+            self._view.vbar.setValue(self._view.vbar.value() - steps)
+
+    def keyPressEvent(self, event) -> None:  # noqa: N802
+        vbar, page = self._view.vbar, self.visible_lines()
+        moves = {
+            Qt.Key_Up: -1,
+            Qt.Key_Down: 1,
+            Qt.Key_PageUp: -page,
+            Qt.Key_PageDown: page,
+        }
+        if event.key() in moves:
+            vbar.setValue(vbar.value() + moves[event.key()])
+        elif event.key() == Qt.Key_Home:
+            vbar.setValue(0)
+        elif event.key() == Qt.Key_End:
+            vbar.setValue(vbar.maximum())
+        else:
+            super().keyPressEvent(event)
+
+    def resizeEvent(self, event) -> None:  # noqa: N802
+        super().resizeEvent(event)
+        self._view.update_ranges()
+
+
+class FilePreviewView(QWidget):
+    """大文件预览：mmap 打开、后台建立行索引、按可见窗口分页绘制，支持跳转行号与跟随末尾。"""
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.file: Optional[MappedFile] = None
+        self.highlight_line = 0
+        self.placeholder = ""
+        self._pending_line = 0
+        self._last_count = -1
+
+        self.info_label = QLabel()
+        self.info_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.jump_edit = QLineEdit()
+        self.jump_edit.setFixedWidth(110)
+        self.jump_edit.returnPressed.connect(self._on_jump)
+        self.follow_check = QCheckBox()
+        self.follow_check.toggled.connect(lambda on: on and self._scroll_to_end())
+        header = QHBoxLayout()
+        header.addWidget(self.info_label, 1)
+        header.addWidget(self.jump_edit)
+        header.addWidget(self.follow_check)
+
+        self.canvas = _LinesCanvas(self)
+        self.vbar = QScrollBar(Qt.Vertical)
+        self.vbar.valueChanged.connect(self._on_scrolled)
+        self.hbar = QScrollBar(Qt.Horizontal)
+        self.hbar.valueChanged.connect(lambda _: self.canvas.update())
+        body = QHBoxLayout()
+        body.setSpacing(0)
+        body.addWidget(self.canvas, 1)
+        body.addWidget(self.vbar)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(header)
+        layout.addLayout(body, 1)
+        layout.addWidget(self.hbar)
+
+        # The indexer runs off the UI thread; progress and file growth are picked up by polling.
+        self._timer = QTimer(self)
+        self._timer.setInterval(REFRESH_MS)
+        self._timer.timeout.connect(self._on_tick)
+
+    def open_file(self, path: Path, line: int = 0) -> bool:
+        self.close_file()
+        try:
+            self.file = MappedFile(path)
+        except (OSError, ValueError) as exc:
+            self.placeholder = f"无法预览：{exc}"
+            self.canvas.update()
+            self.info_label.setText(str(path))
+            return False
+        self.file.start_indexing()
+        self.highlight_line = 0
+        self._last_count = -1
+        self.vbar.setValue(0)
+        self.hbar.setValue(0)
+        self._timer.start()
+        self.update_ranges()
+        if line > 0:
+            self.jump_to_line(line)
+        self._update_info()
+        self.canvas.update()
+        return True
+
+    def close_file(self) -> None:
+        self._timer.stop()
+        self._pending_line = 0
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.info_label.clear()
+        self.canvas.update()
+
+    def jump_to_line(self, line: int) -> None:
+        """跳到第 line 行（1 起）；该行尚未被索引时，索引推进到后再跳转。"""
+        if self.file is None or line <= 0:
+            return
+        self.follow_check.setChecked(False)
+        self.highlight_line = line
+        if line > self.file.line_count and not self.file.index_complete:
+            self._pending_line = line
+            return
+        self._pending_line = 0
+        self.update_ranges()
+        self.vbar.setValue(max(0, line - 1 - self.canvas.visible_lines() // 3))
+        self.canvas.update()
+
+    def update_ranges(self) -> None:
+        if self.file is None:
+            self.vbar.setRange(0, 0)
+            self.hbar.setRange(0, 0)
+            return
+        self.vbar.setPageStep(self.canvas.visible_lines())
+        self.vbar.setRange(0, max(0, self.file.line_count - self.canvas.visible_lines()))
+        char_width = QFontMetrics(self.canvas.font()).horizontalAdvance("m")
+        self.hbar.setRange(0, max(0, MAX_LINE_CHARS * char_width - self.canvas.width() // 2))
+        self.hbar.setPageStep(self.canvas.width())
+
+    def _on_jump(self) -> None:
+        text = self.jump_edit.text().strip()
+        if text.isdigit():
+            self.jump_to_line(int(text))
+
+    def _on_scrolled(self, value: int) -> None:
+        # Scrolling away from the end by hand stops following the tail.
+        if self.follow_check.isChecked() and value < self.vbar.maximum():
+            self.follow_check.setChecked(False)
+        self.canvas.update()
+
+    def _scroll_to_end(self) -> None:
+        self.update_ranges()
+        self.vbar.setValue(self.vbar.maximum())
+
+    def _on_tick(self) -> None:
+        if self.file is None:
+            return
+        grown = self.file.refresh()
+        count = self.file.line_count
+        if not grown and count == self._last_count and self.file.index_complete and not self._pending_line:
+            return
+        self._last_count = count
+        self.update_ranges()
+        if self._pending_line:
+            self.jump_to_line(self._pending_line)
+        elif self.follow_check.isChecked():
+            self.vbar.setValue(self.vbar.maximum())
+        self._update_info()
+        self.canvas.update()
+
+    def _update_info(self) -> None:
+        f = self.file
+        if f is None:
+            return
+        kind = "二进制（十六进制）" if f.is_binary else f.encoding
+        parts = [f.path.name, _format_size(f.size), kind, f"{f.line_count} 行"]
+        if not f.index_complete:
+            parts.append(f"索引中 {f.indexed_bytes * 100 // max(1, f.size)}%")
+        self.info_label.setText(" · ".join(parts))
@@ -1,30 +1,35 @@
 ﻿import csv
-import subprocess
+import re
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 
 from PySide6.QtCore import QEvent, QObject, Qt, Signal, QTimer
-from PySide6.QtGui import QColor, QFont
+from threading import Event
+from PySide6.QtGui import QColor, QFont, QTextCursor
 from PySide6.QtWidgets import (
     QApplication,
     QComboBox,
     QFileDialog,
     QFileSystemModel,
     QFormLayout,
-    QGridLayout,
     QHBoxLayout,
     QHeaderView,
     QLabel,
     QLineEdit,
     QListWidget,
+    QListWidgetItem,
     QMainWindow,
     QMessageBox,
+    QPlainTextEdit,
     QPushButton,
     QSpinBox,
     QSplitter,
     QStackedWidget,
+    QTabWidget,
     QTableWidget,
     QTableWidgetItem,
     QTextEdit,
@@ -34,17 +39,38 @@ from PySide6.QtWidgets import (
 )
 
 from ..agent_runtime import AgentRuntimeManager
-from ..config import BridgeSettings, Settings, load_settings, save_settings
+from ..config import BridgeSettings, Settings, load_settings, save_settings, validate_agents
+from ..control_api import ControlApiServer
+from ..diagnostics import diagnostics, profiled
+from ..file_index import FileIndex
+from ..log_store import ChatRecord, LogStore
 from ..models import AgentConfig, AgentLogEvent, AgentResult, AgentStatus, LogEntry
+from ..orchestrator import Orchestrator, StageRun
+from ..runtime_worker import WorkerRuntime
+from ..shell_session import ShellSession, open_shell_session
+from ..stream_capture import CaptureStore
+from ..telegram_bridge import TelegramBridge
+from ..usage import format_tokens
+from .agent_terminals import AgentTerminalGrid
 from .app_icon import load_app_icon
+from .capture_replay import CaptureReplayDialog
+from .conversation_view import ChatMessage, ConversationView
+from .file_preview_view import FilePreviewView
+from .watchdog import EventLoopWatchdog
+
+_ANSI_ESCAPE = re.compile(r"\x1b(?:\[[0-?]*[ -/]*[@-~]|\][^\x07\x1b]*(?:\x07|\x1b\\)|[@-Z\\-_])")
 
 
 class EventBus(QObject):
     agent_updated = Signal(object)
     agent_log = Signal(object)
-    terminal_output = Signal(str)
-    command_finished = Signal()
     dialog_finished = Signal()
+    agent_stopped = Signal(str, bool)
+    file_index_changed = Signal()
+    content_matches = Signal(int, object)
+    diagnostics_done = Signal(str)
+    telegram_message = Signal(str, str)
+    api_dialog_started = Signal(list)
 
 
 class MainWindow(QMainWindow):
@@ -54,24 +80,43 @@ class MainWindow(QMainWindow):
         "be": "后端工程师",
         "qa": "测试工程师",
     }
-
-    def __init__(self) -> None:
+    LOG_PAGE_SIZE = 500
+    MEMBER_BADGE_LIMIT = 12
+    LOG_MEMORY_LIMIT = 5000
+    EXEC_LOG_LIMIT = 40
+    CHAT_PAGE_SIZE = 100
+    TERMINAL_RESTORE_TURNS = 20
+    SHELL_MAX_LINES = 5000
+    SHELL_HISTORY_LIMIT = 500
+    RUNTIME_EVENT_INTERVAL_MS = 30
+    TELEGRAM_HELP = (
+        "直接发送文字：发给团队页当前选择的对象\n"
+        "/ask <agent|all|workflow> <内容>：发给指定 agent、全部 agent 或按工作流执行\n"
+        "/status：各 agent 状态与今日 token 用量\n"
+        "/stop <agent>：让 agent 休息并停止其正在运行的任务\n"
+        "/join <agent>：让 agent 重新参与"
+    )
+
+    def __init__(self, project_root: Optional[Path] = None) -> None:
         super().__init__()
         self.setWindowTitle("Codex AI Teams")
         self.resize(1440, 860)
 
-        self.project_root = Path(__file__).resolve().parents[3]
+        # Overridable so headless harnesses can run against a scratch copy of the config and logs.
+        self.project_root = project_root or Path(__file__).resolve().parents[3]
         self.setWindowIcon(load_app_icon(self.project_root))
         self.config_path = self.project_root / "config" / "teams.yaml"
         self.settings = load_settings(self.config_path)
-        self.runtime = AgentRuntimeManager(self.settings.agents, self.project_root)
+        self._runtime_event_timer = QTimer(self)
+        self._runtime_event_timer.timeout.connect(self._drain_runtime_events)
+        self.runtime = self._make_runtime()
         self.runtime.start()
 
         self.logs: List[LogEntry] = []
         self._agent_row_map: Dict[str, int] = {}
         self._row_agent_map: Dict[int, str] = {}
         self._agent_log_buffers: Dict[str, List[str]] = {}
-        self._terminal_panels: Dict[str, QTextEdit] = {}
+        self._agents_by_id: Dict[str, AgentConfig] = {a.agent_id: a for a in self.settings.agents}
         self._status_combo_map: Dict[str, QComboBox] = {}
         self._stopped_agents: Set[str] = {a.agent_id for a in self.settings.agents if not a.enabled}
         self._exec_log_font = QFont("Consolas", 9)
@@ -90,6 +135,7 @@ class MainWindow(QMainWindow):
                 "team_chat": "团队对话",
                 "chat_target": "对话目标",
                 "chat_all": "全部成员",
+                "chat_workflow": "团队流程（按阶段依赖执行）",
                 "chat_ph": "输入消息，可群发或单发给指定成员",
                 "send_chat": "发送消息",
                 "warn_title": "提示",
@@ -117,6 +163,13 @@ class MainWindow(QMainWindow):
                 "col_status": "状态",
                 "col_exec_log": "执行日志",
                 "col_control": "参与设置",
+                "col_cpu": "CPU（峰值）",
+                "col_mem": "内存 RSS（峰值）",
+                "col_fds": "文件句柄（峰值）",
+                "col_tokens": "Token 今日（累计）",
+                "tokens_tip": "今日：{today}\n累计：{total}（{turns} 轮）",
+                "tokens_soft": "已超过软预算 {limit}",
+                "tokens_hard": "已达硬预算 {limit}，新请求会被拒绝",
                 "control_join": "参与",
                 "control_rest": "休息",
                 "col_temp": "温度",
@@ -125,20 +178,46 @@ class MainWindow(QMainWindow):
                 "col_session": "Session ID",
                 "col_extra": "其他参数",
                 "col_enabled": "启用",
+                "col_host": "运行主机",
                 "logs_title": "日志列表",
                 "filter": "状态筛选",
                 "all": "全部",
                 "normal": "normal",
                 "error": "error",
                 "export_csv": "导出 CSV",
+                "replay_capture": "回放原始输出",
                 "csv_ok": "日志已导出：{path}",
+                "ui_lag": "界面延迟 {ms:.0f} ms",
+                "diag_menu": "诊断",
+                "diag_sampling": "采样剖析（全部线程）",
+                "diag_hot_paths": "热点函数 cProfile",
+                "diag_snapshot": "记录内存快照",
+                "diag_memory_diff": "对比最近两次内存快照",
+                "diag_saved": "诊断结果：{paths}",
+                "diag_snapshot_taken": "已记录内存快照 {paths}",
+                "diag_nothing": "没有可写出的诊断结果（热点函数未被调用，或内存快照不足两次）",
+                "stall_saved": "界面卡顿 {sec:.1f}s，诊断已保存：{path}",
                 "files_title": "文件浏览",
                 "choose_path": "选择工作路径",
+                "file_search_ph": "搜索文件名（模糊匹配，含 / 时匹配整条路径）或文件内容",
+                "search_name": "文件名",
+                "search_content": "文件内容",
+                "index_building": "正在索引…",
+                "index_ready": "已索引 {n} 个文件",
+                "search_results": "{n} 条结果（{ms:.0f} ms）",
+                "content_searching": "正在搜索内容… {n} 条",
+                "content_done": "{n} 条内容匹配",
+                "jump_line_ph": "跳转到行号",
+                "follow_tail": "跟随末尾",
+                "preview_hint": "点击左侧文件预览内容",
                 "terminal_title": "终端",
-                "cmd_ph": "输入命令并运行，例如：dir",
+                "cmd_ph": "输入命令并回车，在当前终端会话中执行（↑/↓ 历史命令，Ctrl+C 中断）",
                 "run_cmd": "运行命令",
-                "running_cmd": "正在执行命令：{cmd}",
-                "cmd_done": "命令执行完成",
+                "new_shell": "新建终端",
+                "interrupt_cmd": "中断 (Ctrl+C)",
+                "kill_shell": "结束会话",
+                "shell_tab": "终端 {n} (PID {pid})",
+                "shell_exited": "[会话已结束，退出码 {code}]",
             },
             "en": {
                 "main_title": "Codex AI Teams",
@@ -153,6 +232,7 @@ class MainWindow(QMainWindow):
                 "team_chat": "Team Chat",
                 "chat_target": "Target",
                 "chat_all": "All Members",
+                "chat_workflow": "Team Workflow (staged)",
                 "chat_ph": "Enter message for all or one member",
                 "send_chat": "Send",
                 "warn_title": "Notice",
@@ -180,6 +260,13 @@ class MainWindow(QMainWindow):
                 "col_status": "Status",
                 "col_exec_log": "Execution Log",
                 "col_control": "Participation",
+                "col_cpu": "CPU (peak)",
+                "col_mem": "RSS (peak)",
+                "col_fds": "Open FDs (peak)",
+                "col_tokens": "Tokens today (total)",
+                "tokens_tip": "Today: {today}\nTotal: {total} ({turns} turns)",
+                "tokens_soft": "Over soft budget {limit}",
+                "tokens_hard": "Hard budget {limit} reached; new requests are refused",
                 "control_join": "Join",
                 "control_rest": "Rest",
                 "col_temp": "Temperature",
@@ -188,20 +275,46 @@ class MainWindow(QMainWindow):
                 "col_session": "Session ID",
                 "col_extra": "Extra Params",
                 "col_enabled": "Enabled",
+                "col_host": "Host",
                 "logs_title": "Logs",
                 "filter": "Filter",
                 "all": "all",
                 "normal": "normal",
                 "error": "error",
                 "export_csv": "Export CSV",
+                "replay_capture": "Replay Raw Output",
                 "csv_ok": "CSV exported: {path}",
+                "ui_lag": "UI lag {ms:.0f} ms",
+                "diag_menu": "Diagnostics",
+                "diag_sampling": "Sampling Profiler (All Threads)",
+                "diag_hot_paths": "Hot-Path cProfile",
+                "diag_snapshot": "Take Memory Snapshot",
+                "diag_memory_diff": "Diff Last Two Memory Snapshots",
+                "diag_saved": "Diagnostics written: {paths}",
+                "diag_snapshot_taken": "Memory snapshot taken: {paths}",
+                "diag_nothing": "Nothing to write (no hot path ran, or fewer than two memory snapshots)",
+                "stall_saved": "UI stalled for {sec:.1f}s, diagnostics saved: {path}",
                 "files_title": "File Explorer",
                 "choose_path": "Choose Work Path",
+                "file_search_ph": "Search file names (fuzzy; include / to match whole paths) or contents",
+                "search_name": "File name",
+                "search_content": "Content",
+                "index_building": "Indexing...",
+                "index_ready": "{n} files indexed",
+                "search_results": "{n} results ({ms:.0f} ms)",
+                "content_searching": "Searching contents... {n}",
+                "content_done": "{n} content matches",
+                "jump_line_ph": "Go to line",
+                "follow_tail": "Follow tail",
+                "preview_hint": "Click a file to preview it",
                 "terminal_title": "Terminal",
-                "cmd_ph": "Enter command, e.g. dir",
+                "cmd_ph": "Enter a command to run in the current shell session (Up/Down history, Ctrl+C interrupt)",
                 "run_cmd": "Run Command",
-                "running_cmd": "Running command: {cmd}",
-                "cmd_done": "Command done",
+                "new_shell": "New Shell",
+                "interrupt_cmd": "Interrupt (Ctrl+C)",
+                "kill_shell": "Kill Session",
+                "shell_tab": "Shell {n} (PID {pid})",
+                "shell_exited": "[session exited with code {code}]",
             },
         }
         self._lang = "zh"
@@ -209,16 +322,29 @@ class MainWindow(QMainWindow):
         self.bus = EventBus()
         self.bus.agent_updated.connect(self.handle_agent_update)
         self.bus.agent_log.connect(self.handle_agent_log)
-        self.bus.terminal_output.connect(self._append_terminal_output)
-        self.bus.command_finished.connect(self._on_command_finished)
         self.bus.dialog_finished.connect(self._on_dialog_finished)
+        self.bus.agent_stopped.connect(self._on_agent_stopped)
+        self.bus.file_index_changed.connect(self._on_file_index_changed)
+        self.bus.content_matches.connect(self._on_content_matches)
+        self.bus.diagnostics_done.connect(self._on_diagnostics_done)
+        self.bus.telegram_message.connect(self._on_telegram_message)
+        self.bus.api_dialog_started.connect(self._on_api_dialog_started)
+        self._dialogs_running = 0
+        self.telegram: Optional[TelegramBridge] = None
+        self.control_api: Optional[ControlApiServer] = None
 
         self._normal_color = QColor("#2ecc71")
         self._error_color = QColor("#ff4d4f")
         self._stopped_color = QColor("#faad14")
         self.logs_dir = self.project_root / "logs"
         self.logs_dir.mkdir(parents=True, exist_ok=True)
+        diagnostics.out_dir = self.logs_dir / "diagnostics"
         self.runtime_log_path = self.logs_dir / "runtime.log"
+        self.log_store = LogStore(self.logs_dir / "history.db", mirror_path=self.runtime_log_path)
+        self._log_has_more = True
+        self._chat_loaded = 0
+        self._chat_has_more = True
+        self._history_paging_ready = False
 
         root = QWidget()
         self.setCentralWidget(root)
@@ -261,14 +387,196 @@ class MainWindow(QMainWindow):
         splitter.addWidget(left_panel)
         splitter.addWidget(self.pages)
         splitter.setSizes([250, 1190])
+        self._build_diagnostics_menu()
 
         self._refresh_i18n()
         self._reload_agent_rows()
+        self._restore_history()
+        self._on_work_path_changed()
         QTimer.singleShot(0, self._fit_agent_rows)
 
+        self.lag_label = QLabel()
+        self.statusBar().addPermanentWidget(self.lag_label)
+        self.watchdog = EventLoopWatchdog(self.logs_dir / "stalls", parent=self)
+        self.watchdog.lag_changed.connect(self._on_ui_lag)
+        self.watchdog.stall_reported.connect(self._on_ui_stall)
+        self.watchdog.start()
+
+        self._resource_timer = QTimer(self)
+        self._resource_timer.timeout.connect(self._refresh_resource_columns)
+        if self.settings.runtime.monitor_interval_sec > 0:
+            self._resource_timer.start(max(250, int(self.settings.runtime.monitor_interval_sec * 1000)))
+        self._start_telegram()
+        self._start_control_api()
+
+    def _start_telegram(self) -> None:
+        """配置了 telegram_token 与 telegram_chat_id 时启动（或按新配置重启）Telegram 桥接。"""
+        if self.telegram is not None:
+            self.telegram.stop(flush_sec=0)
+            self.telegram = None
+        bridge = self.settings.bridge
+        if not bridge.telegram_token or not bridge.telegram_chat_id:
+            return
+        try:
+            self.telegram = TelegramBridge(
+                bridge.telegram_token,
+                bridge.telegram_chat_id,
+                self.bus.telegram_message.emit,
+                bridge.telegram_api_url,
+                min(30, bridge.timeout_sec),
+            )
+        except ValueError as exc:
+            self._add_log("telegram", AgentStatus.FAILED.value, f"Telegram 桥接未启动：{exc}")
+            return
+        self.telegram.start()
+        self._add_log("telegram", AgentStatus.IDLE.value, f"Telegram 桥接已启动，会话 {bridge.telegram_chat_id}")
+
+    def _start_control_api(self) -> None:
+        """api.enabled 时在本机启动控制 API；API 派发的日志与结果经事件总线回到界面，再由界面发布给订阅者。"""
+        api = self.settings.api
+        if not api.enabled:
+            return
+        try:
+            self.control_api = ControlApiServer(
+                api,
+                lambda: self.runtime,
+                lambda: self.settings,
+                lambda: self.path_edit.text().strip() or str(self.project_root),
+                on_log=self.bus.agent_log.emit,
+                on_result=self.bus.agent_updated.emit,
+                can_dispatch=lambda agent_id: agent_id not in self._stopped_agents,
+                on_started=self.bus.api_dialog_started.emit,
+                on_finished=self.bus.dialog_finished.emit,
+            )
+        except (OSError, ValueError) as exc:
+            self._add_log("api", AgentStatus.FAILED.value, f"控制 API 未启动：{exc}")
+            return
+        self.control_api.start()
+        self._add_log("api", AgentStatus.IDLE.value, f"控制 API 已启动：{self.control_api.address}")
+        if self.control_api.token_generated:
+            self._add_log("api", AgentStatus.IDLE.value, f"未配置 api.token，本次口令：{self.control_api.token}")
+
+    def _on_api_dialog_started(self, agent_ids: List[str]) -> None:
+        # Same bookkeeping as a dialog started here: rows show RUNNING and the send button waits for it.
+        self._dialog_started()
+        for agent_id in agent_ids:
+            row = self._agent_row_map.get(agent_id)
+            if row is not None:
+                self._set_agent_status(row, AgentStatus.RUNNING.value)
+
+    def _on_telegram_message(self, command: str, args: str) -> None:
+        """处理 Telegram 会话发来的消息（已切回 GUI 线程），回复同样经桥接队列发送。"""
+        if self.telegram is None:
+            return
+        reply = self.telegram.post
+        if command in ("", "ask"):
+            target_id = self.chat_target_combo.currentData()
+            text = args
+            if command == "ask":
+                head, _, rest = args.partition(" ")
+                aliases = {"all": "__all__", "workflow": "__workflow__"}
+                if head in aliases or head in self._agents_by_id:
+                    target_id, text = aliases.get(head, head), rest.strip()
+            if not text:
+                reply("消息内容为空。\n" + self.TELEGRAM_HELP)
+            elif not self._start_dialog(target_id, text, "（Telegram）"):
+                reply(self._texts[self._lang]["warn_no_active_agent"])
+            return
+        if command == "status":
+            usage = self.runtime.usage_snapshot()
+            lines = []
+            for agent in self.settings.agents:
+                row = self._agent_row_map.get(agent.agent_id)
+                item = self.agent_table.item(row, 2) if row is not None else None
+                today = usage[agent.agent_id][0].total if agent.agent_id in usage else 0
+                lines.append(f"{agent.agent_id}（{self._role_cn(agent)}）：{item.text() if item else '-'}，今日 {format_tokens(today)} tokens")
+            reply("\n".join(lines) + "\n" + self.telegram.stats.summary())
+            return
+        if command in ("stop", "join"):
+            combo = self._status_combo_map.get(args.strip())
+            if combo is None:
+                reply(f"没有名为 {args.strip() or '（空）'} 的 agent")
+                return
+            # Same path as the participation combo on the team page, so the table stays in sync.
+            combo.setCurrentIndex(1 if command == "stop" else 0)
+            reply(f"{args.strip()} 已{'休息' if command == 'stop' else '参与'}")
+            return
+        reply(self.TELEGRAM_HELP)
+
+    def _make_runtime(self):
+        if not self.settings.runtime.worker_process:
+            self._runtime_event_timer.stop()
+            return AgentRuntimeManager(self.settings.agents, self.project_root, self.settings.runtime, self.settings.hosts)
+        self._runtime_event_timer.start(self.RUNTIME_EVENT_INTERVAL_MS)
+        return WorkerRuntime(self.settings.agents, self.project_root, self.settings.runtime, self.settings.hosts)
+
+    def _drain_runtime_events(self) -> None:
+        if not isinstance(self.runtime, WorkerRuntime):
+            return
+        self.runtime.drain()
+
+    def _on_ui_lag(self, lag_ms: float) -> None:
+        self.lag_label.setText(self._texts[self._lang]["ui_lag"].format(ms=lag_ms))
+        color = self._normal_color if lag_ms < 100 else self._stopped_color if lag_ms < 500 else self._error_color
+        self.lag_label.setStyleSheet(f"color: {color.name()};")
+
+    def _on_ui_stall(self, path: str, duration: float) -> None:
+        self.statusBar().showMessage(self._texts[self._lang]["stall_saved"].format(sec=duration, path=path), 15000)
+
+    def _build_diagnostics_menu(self) -> None:
+        self._diag_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="diagnostics")
+        self.diag_menu = self.menuBar().addMenu("")
+        self.diag_sampling_action = self.diag_menu.addAction("")
+        self.diag_sampling_action.setCheckable(True)
+        self.diag_sampling_action.toggled.connect(lambda on: self._run_diagnostics("start_sampling" if on else "stop_sampling"))
+        self.diag_hot_paths_action = self.diag_menu.addAction("")
+        self.diag_hot_paths_action.setCheckable(True)
+        self.diag_hot_paths_action.toggled.connect(lambda on: self._run_diagnostics("start_hot_paths" if on else "stop_hot_paths"))
+        self.diag_menu.addSeparator()
+        self.diag_snapshot_action = self.diag_menu.addAction("")
+        self.diag_snapshot_action.triggered.connect(lambda: self._run_diagnostics("snapshot"))
+        self.diag_memory_diff_action = self.diag_menu.addAction("")
+        self.diag_memory_diff_action.triggered.connect(lambda: self._run_diagnostics("memory_diff"))
+
+    def _run_diagnostics(self, action: str) -> None:
+        runtime = self.runtime
+
+        def worker() -> None:
+            # Stopping the hot-path profiler waits for threads to hand back their data; keep it off the UI thread.
+            outputs = [diagnostics.run(action)]
+            if isinstance(runtime, WorkerRuntime):
+                outputs.append(runtime.run_diagnostics(action))
+            if action.startswith("stop_") or action in ("snapshot", "memory_diff"):
+                self.bus.diagnostics_done.emit(f"{action}\n" + "\n".join(x for x in outputs if x))
+
+        # One worker keeps actions in click order, so a diff always sees the snapshot taken just before it.
+        self._diag_pool.submit(worker)
+
+    def _on_diagnostics_done(self, message: str) -> None:
+        t = self._texts[self._lang]
+        action, _, paths = message.partition("\n")
+        if not paths:
+            text = t["diag_nothing"]
+        else:
+            text = t["diag_snapshot_taken" if action == "snapshot" else "diag_saved"].format(paths="；".join(paths.splitlines()))
+        self.statusBar().showMessage(text, 20000)
+
     def closeEvent(self, event):  # noqa: N802
+        self.watchdog.stop()
+        if self.telegram is not None:
+            self.telegram.stop(flush_sec=1.0)
+        if self.control_api is not None:
+            self.control_api.close()
+        diagnostics.close()
         self._persist_settings()
+        for session in self._shell_sessions.values():
+            session.close()
+        self._content_cancel.set()
+        if self.file_index is not None:
+            self.file_index.stop()
+        self.file_preview.close_file()
         self.runtime.stop()
+        self.log_store.close()
         super().closeEvent(event)
 
     def resizeEvent(self, event):  # noqa: N802
@@ -280,7 +588,7 @@ class MainWindow(QMainWindow):
             """
             QMainWindow, QWidget { background-color: #000000; color: #FFFFFF; }
             QLabel { color: #FFFFFF; }
-            QListWidget, QLineEdit, QTextEdit, QTableWidget, QComboBox, QSpinBox, QTreeView {
+            QListWidget, QListView, QLineEdit, QTextEdit, QTableWidget, QComboBox, QSpinBox, QTreeView {
                 background-color: #111111;
                 color: #FFFFFF;
                 border: 1px solid #333333;
@@ -321,7 +629,7 @@ class MainWindow(QMainWindow):
         table_block = QWidget()
         table_layout = QVBoxLayout(table_block)
         self.lbl_agent_table = QLabel()
-        self.agent_table = QTableWidget(0, 5)
+        self.agent_table = QTableWidget(0, 9)
         self.agent_table.verticalHeader().setVisible(True)
         self.agent_table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
         self.agent_table.verticalHeader().setDefaultSectionSize(105)
@@ -348,10 +656,11 @@ class MainWindow(QMainWindow):
         chat_top.addStretch(1)
         chat_layout.addLayout(chat_top)
 
-        self.chat_history = QTextEdit()
-        self.chat_history.setReadOnly(True)
-        self.chat_history.setMinimumHeight(180)
-        chat_layout.addWidget(self.chat_history)
+        self.conversation = ConversationView()
+        self.conversation.setMinimumHeight(180)
+        self.conversation.top_reached.connect(self._load_older_chat)
+        self.conversation.front_trimmed.connect(self._on_chat_trimmed)
+        chat_layout.addWidget(self.conversation)
 
         chat_send_row = QHBoxLayout()
         self.chat_input = QTextEdit()
@@ -404,7 +713,7 @@ class MainWindow(QMainWindow):
         layout.addLayout(form)
 
         self.lbl_agents_cfg = QLabel()
-        self.cfg_agent_table = QTableWidget(0, 8)
+        self.cfg_agent_table = QTableWidget(0, 9)
         self.cfg_agent_table.verticalHeader().setVisible(False)
         self.cfg_agent_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         layout.addWidget(self.lbl_agents_cfg)
@@ -432,6 +741,9 @@ class MainWindow(QMainWindow):
         top.addWidget(self.lbl_filter)
         top.addWidget(self.log_filter)
         top.addWidget(self.export_csv_btn)
+        self.replay_capture_btn = QPushButton()
+        self.replay_capture_btn.clicked.connect(self.open_capture_replay)
+        top.addWidget(self.replay_capture_btn)
         top.addStretch(1)
         layout.addLayout(top)
 
@@ -439,6 +751,7 @@ class MainWindow(QMainWindow):
         self.logs_table.setHorizontalHeaderLabels(["Time", "Agent", "Status", "Level", "Message"])
         self.logs_table.verticalHeader().setVisible(False)
         self.logs_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.logs_table.verticalScrollBar().valueChanged.connect(self._on_logs_scrolled)
         layout.addWidget(self.logs_table)
         return page
 
@@ -456,13 +769,49 @@ class MainWindow(QMainWindow):
         top.addWidget(self.path_edit)
         top.addWidget(self.choose_path_btn)
         layout.addLayout(top)
+        self.path_edit.editingFinished.connect(self._on_work_path_changed)
+
+        search_row = QHBoxLayout()
+        self.file_search_edit = QLineEdit()
+        self.file_search_edit.textChanged.connect(lambda _: self._file_search_timer.start())
+        self.file_search_mode = QComboBox()
+        self.file_search_mode.currentIndexChanged.connect(lambda _: self._file_search_timer.start())
+        self.lbl_file_index = QLabel()
+        search_row.addWidget(self.file_search_edit, 1)
+        search_row.addWidget(self.file_search_mode)
+        search_row.addWidget(self.lbl_file_index)
+        layout.addLayout(search_row)
+        # Debounce keystrokes: a search runs once typing pauses for a moment.
+        self._file_search_timer = QTimer(self)
+        self._file_search_timer.setSingleShot(True)
+        self._file_search_timer.setInterval(60)
+        self._file_search_timer.timeout.connect(self._run_file_search)
+
+        self.file_results = QListWidget()
+        self.file_results.itemActivated.connect(self._open_search_result)
+        self.file_results.itemClicked.connect(self._open_search_result)
 
         self.fs_model = QFileSystemModel(self)
         self.fs_model.setRootPath(str(self.project_root))
         self.file_tree = QTreeView()
         self.file_tree.setModel(self.fs_model)
         self.file_tree.setRootIndex(self.fs_model.index(str(self.project_root)))
-        layout.addWidget(self.file_tree)
+        self.file_tree.clicked.connect(self._preview_tree_index)
+
+        browse_splitter = QSplitter(Qt.Vertical)
+        browse_splitter.addWidget(self.file_results)
+        browse_splitter.addWidget(self.file_tree)
+        browse_splitter.setSizes([160, 540])
+        self.file_preview = FilePreviewView()
+        files_splitter = QSplitter(Qt.Horizontal)
+        files_splitter.addWidget(browse_splitter)
+        files_splitter.addWidget(self.file_preview)
+        files_splitter.setSizes([420, 680])
+        layout.addWidget(files_splitter, 1)
+
+        self.file_index: Optional[FileIndex] = None
+        self._content_cancel = Event()
+        self._content_generation = 0
         return page
 
     def _build_terminal_page(self) -> QWidget:
@@ -474,24 +823,39 @@ class MainWindow(QMainWindow):
 
         top = QHBoxLayout()
         self.cmd_input = QLineEdit()
+        self.cmd_input.returnPressed.connect(self.run_command)
+        self.cmd_input.installEventFilter(self)
         self.run_cmd_btn = QPushButton()
         self.run_cmd_btn.clicked.connect(self.run_command)
+        self.new_shell_btn = QPushButton()
+        self.new_shell_btn.clicked.connect(self.new_shell_tab)
+        self.interrupt_btn = QPushButton()
+        self.interrupt_btn.clicked.connect(self.interrupt_shell)
+        self.kill_shell_btn = QPushButton()
+        self.kill_shell_btn.clicked.connect(self.kill_shell)
         top.addWidget(self.cmd_input)
         top.addWidget(self.run_cmd_btn)
+        top.addWidget(self.new_shell_btn)
+        top.addWidget(self.interrupt_btn)
+        top.addWidget(self.kill_shell_btn)
         layout.addLayout(top)
 
-        self.terminal_grid_holder = QWidget()
-        self.terminal_grid = QGridLayout(self.terminal_grid_holder)
-        self.terminal_grid.setContentsMargins(0, 0, 0, 0)
-        self.terminal_grid.setHorizontalSpacing(10)
-        self.terminal_grid.setVerticalSpacing(10)
-        layout.addWidget(self.terminal_grid_holder, 1)
-
-        self.terminal_output = QTextEdit()
-        self.terminal_output.setReadOnly(True)
-        self.terminal_output.setPlaceholderText("系统命令输出")
-        self.terminal_output.setMaximumHeight(150)
-        layout.addWidget(self.terminal_output)
+        self.agent_terminals = AgentTerminalGrid(self._exec_log_font)
+        layout.addWidget(self.agent_terminals, 1)
+
+        # Long-lived shell sessions, one per tab; output is pulled from the sessions by a timer.
+        self.shell_tabs = QTabWidget()
+        self.shell_tabs.setTabsClosable(True)
+        self.shell_tabs.tabCloseRequested.connect(self._close_shell_tab)
+        self.shell_tabs.setMinimumHeight(220)
+        layout.addWidget(self.shell_tabs, 1)
+        self._shell_sessions: Dict[QWidget, ShellSession] = {}
+        self._shell_counter = 0
+        self._shell_timer = QTimer(self)
+        self._shell_timer.timeout.connect(self._pump_shell_output)
+        self.shell_history_path = self.logs_dir / "shell_history.txt"
+        self._cmd_history: List[str] = self._load_shell_history()
+        self._history_pos = len(self._cmd_history)
         return page
 
     def _on_lang_changed(self) -> None:
@@ -510,7 +874,17 @@ class MainWindow(QMainWindow):
 
         self.lbl_agent_table.setText(t["agent_table"])
         self.agent_table.setHorizontalHeaderLabels(
-            [t["col_agent"], t["col_role"], t["col_status"], t["col_exec_log"], t["col_control"]]
+            [
+                t["col_agent"],
+                t["col_role"],
+                t["col_status"],
+                t["col_exec_log"],
+                t["col_control"],
+                t["col_cpu"],
+                t["col_mem"],
+                t["col_fds"],
+                t["col_tokens"],
+            ]
         )
         self.lbl_team_chat.setText(t["team_chat"])
         self.lbl_chat_target.setText(t["chat_target"])
@@ -535,6 +909,7 @@ class MainWindow(QMainWindow):
                 t["col_session"],
                 t["col_extra"],
                 t["col_enabled"],
+                t["col_host"],
             ]
         )
         self.save_cfg_btn.setText(t["save_config"])
@@ -548,13 +923,34 @@ class MainWindow(QMainWindow):
         self.log_filter.addItem(t["error"], "error")
         self.log_filter.blockSignals(False)
         self.export_csv_btn.setText(t["export_csv"])
+        self.replay_capture_btn.setText(t["replay_capture"])
 
         self.lbl_files_title.setText(t["files_title"])
         self.choose_path_btn.setText(t["choose_path"])
+        self.file_search_edit.setPlaceholderText(t["file_search_ph"])
+        self.file_preview.jump_edit.setPlaceholderText(t["jump_line_ph"])
+        self.file_preview.follow_check.setText(t["follow_tail"])
+        self.file_preview.placeholder = t["preview_hint"]
+        mode = self.file_search_mode.currentIndex()
+        self.file_search_mode.blockSignals(True)
+        self.file_search_mode.clear()
+        self.file_search_mode.addItems([t["search_name"], t["search_content"]])
+        self.file_search_mode.setCurrentIndex(max(0, mode))
+        self.file_search_mode.blockSignals(False)
+        self._on_file_index_changed()
 
         self.lbl_terminal_title.setText(t["terminal_title"])
         self.cmd_input.setPlaceholderText(t["cmd_ph"])
         self.run_cmd_btn.setText(t["run_cmd"])
+        self.new_shell_btn.setText(t["new_shell"])
+        self.interrupt_btn.setText(t["interrupt_cmd"])
+        self.kill_shell_btn.setText(t["kill_shell"])
+
+        self.diag_menu.setTitle(t["diag_menu"])
+        self.diag_sampling_action.setText(t["diag_sampling"])
+        self.diag_hot_paths_action.setText(t["diag_hot_paths"])
+        self.diag_snapshot_action.setText(t["diag_snapshot"])
+        self.diag_memory_diff_action.setText(t["diag_memory_diff"])
 
     def _switch_page(self, idx: int) -> None:
         if idx >= 0:
@@ -570,6 +966,13 @@ class MainWindow(QMainWindow):
                     return False
                 self.send_team_message()
                 return True
+        if event.type() == QEvent.KeyPress and watched is self.cmd_input:
+            if event.key() in (Qt.Key_Up, Qt.Key_Down):
+                self._step_history(-1 if event.key() == Qt.Key_Up else 1)
+                return True
+            if event.key() == Qt.Key_C and event.modifiers() & Qt.ControlModifier and not self.cmd_input.hasSelectedText():
+                self.interrupt_shell()
+                return True
         if watched is self.agent_table.viewport() and event.type() == QEvent.Resize:
             QTimer.singleShot(0, self._fit_agent_rows)
         return super().eventFilter(watched, event)
@@ -589,12 +992,19 @@ class MainWindow(QMainWindow):
         self._agent_row_map.clear()
         self._row_agent_map.clear()
         self._agent_log_buffers.clear()
-        self._terminal_panels.clear()
+        self._agents_by_id = {a.agent_id: a for a in self.settings.agents}
         self._status_combo_map.clear()
         self._stopped_agents = {a.agent_id for a in self.settings.agents if not a.enabled}
 
         self.chat_target_combo.clear()
         self.chat_target_combo.addItem(self._texts[self._lang]["chat_all"], "__all__")
+        if self.settings.workflow:
+            self.chat_target_combo.addItem(self._texts[self._lang]["chat_workflow"], "__workflow__")
+
+        self.conversation.set_agents(
+            [(None, self._texts[self._lang]["chat_all"])]
+            + [(a.agent_id, f"{a.agent_id.upper()} {self._role_cn(a)}") for a in self.settings.agents]
+        )
 
         for i, agent in enumerate(self.settings.agents):
             self._agent_row_map[agent.agent_id] = i
@@ -603,9 +1013,10 @@ class MainWindow(QMainWindow):
 
             self.chat_target_combo.addItem(f"{agent.agent_id} ({self._role_cn(agent)})", agent.agent_id)
 
-            badge = QLabel(f"{agent.agent_id}（{self._role_cn(agent)}）")
-            badge.setStyleSheet("padding:4px 8px;border:1px solid #2ecc71;color:#2ecc71;")
-            self.member_row.addWidget(badge)
+            if i < self.MEMBER_BADGE_LIMIT:
+                badge = QLabel(f"{agent.agent_id}（{self._role_cn(agent)}）")
+                badge.setStyleSheet("padding:4px 8px;border:1px solid #2ecc71;color:#2ecc71;")
+                self.member_row.addWidget(badge)
 
             self.agent_table.setItem(i, 0, QTableWidgetItem(agent.agent_id))
             self.agent_table.setItem(i, 1, QTableWidgetItem(f"{agent.role} / {self._role_cn(agent)}"))
@@ -621,7 +1032,10 @@ class MainWindow(QMainWindow):
             self.cfg_agent_table.setItem(i, 5, QTableWidgetItem(agent.session_id))
             self.cfg_agent_table.setItem(i, 6, QTableWidgetItem(agent.extra_params))
             self.cfg_agent_table.setItem(i, 7, QTableWidgetItem("true" if agent.enabled else "false"))
+            self.cfg_agent_table.setItem(i, 8, QTableWidgetItem(agent.host))
 
+        if len(self.settings.agents) > self.MEMBER_BADGE_LIMIT:
+            self.member_row.addWidget(QLabel(f"+{len(self.settings.agents) - self.MEMBER_BADGE_LIMIT}"))
         self.member_row.addStretch(1)
         self._rebuild_terminal_panels()
         self.agent_table.viewport().installEventFilter(self)
@@ -637,39 +1051,60 @@ class MainWindow(QMainWindow):
         for agent in self.settings.agents:
             pid = pid_map.get(agent.agent_id, -1)
             self._append_agent_log_line(agent.agent_id, f"独立CLI进程 PID={pid}, session_id={self.runtime.session_for(agent.agent_id)}")
+        self.agent_terminals.clear_unread()
         self._fit_agent_rows()
+        self._refresh_usage_column()
 
     def _rebuild_terminal_panels(self) -> None:
-        while self.terminal_grid.count():
-            item = self.terminal_grid.takeAt(0)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-
-        self._terminal_panels.clear()
-        for idx, agent in enumerate(self.settings.agents[:4]):
-            block = QWidget()
-            block_layout = QVBoxLayout(block)
-            block_layout.setContentsMargins(0, 0, 0, 0)
-            title = QLabel(f"{agent.agent_id.upper()} / {self._role_cn(agent)}")
-            panel = QTextEdit()
-            panel.setReadOnly(True)
-            panel.setPlaceholderText(f"{agent.agent_id} 终端输出")
-            panel.setFont(self._exec_log_font)
-            block_layout.addWidget(title)
-            block_layout.addWidget(panel)
-            self.terminal_grid.addWidget(block, idx // 2, idx % 2)
-            self._terminal_panels[agent.agent_id] = panel
-
-        self.terminal_grid.setRowStretch(0, 1)
-        self.terminal_grid.setRowStretch(1, 1)
-        self.terminal_grid.setColumnStretch(0, 1)
-        self.terminal_grid.setColumnStretch(1, 1)
+        self.agent_terminals.set_agents([(a.agent_id, f"{a.agent_id.upper()} / {self._role_cn(a)}") for a in self.settings.agents])
 
     def _append_agent_terminal_line(self, agent_id: str, line: str) -> None:
-        panel = self._terminal_panels.get(agent_id)
-        if panel is not None:
-            panel.append(line)
+        self.agent_terminals.append(agent_id, line)
+
+    def _refresh_resource_columns(self) -> None:
+        for agent_id, stats in self.runtime.resource_stats().items():
+            row = self._agent_row_map.get(agent_id)
+            if row is None:
+                continue
+            cur = stats.current
+            cells = [
+                f"{cur.cpu_percent:.1f}% ({stats.peak_cpu_percent:.1f}%)",
+                f"{cur.rss_bytes / 1048576:.1f} MB ({stats.peak_rss_bytes / 1048576:.1f} MB)",
+                f"{cur.open_fds} ({stats.peak_open_fds})",
+            ]
+            for offset, text in enumerate(cells):
+                item = self.agent_table.item(row, 5 + offset)
+                if item is None:
+                    self.agent_table.setItem(row, 5 + offset, QTableWidgetItem(text))
+                elif item.text() != text:
+                    item.setText(text)
+        self._refresh_usage_column()
+
+    def _refresh_usage_column(self) -> None:
+        t = self._texts[self._lang]
+        runtime = self.settings.runtime
+        for agent_id, (today, total) in self.runtime.usage_snapshot().items():
+            row = self._agent_row_map.get(agent_id)
+            if row is None:
+                continue
+            text = f"{format_tokens(today.total)} ({format_tokens(total.total)})"
+            tip = t["tokens_tip"].format(today=today.describe(), total=total.describe(), turns=total.turns)
+            color = self._normal_color
+            if runtime.token_budget_hard > 0 and today.total >= runtime.token_budget_hard:
+                tip += "\n" + t["tokens_hard"].format(limit=runtime.token_budget_hard)
+                color = self._error_color
+            elif runtime.token_budget_soft > 0 and today.total >= runtime.token_budget_soft:
+                tip += "\n" + t["tokens_soft"].format(limit=runtime.token_budget_soft)
+                color = self._stopped_color
+            item = self.agent_table.item(row, 8)
+            if item is None:
+                item = QTableWidgetItem()
+                self.agent_table.setItem(row, 8, item)
+            # The tooltip carries the exact counts, so it changes whenever the rounded text might not.
+            if item.toolTip() != tip:
+                item.setText(text)
+                item.setToolTip(tip)
+                item.setForeground(color)
 
     def _fit_agent_rows(self) -> None:
         row_count = self.agent_table.rowCount()
@@ -706,7 +1141,7 @@ class MainWindow(QMainWindow):
         if combo:
             self._set_status_combo_color(combo, status)
         row = self._agent_row_map.get(agent_id)
-        agent = next((a for a in self.settings.agents if a.agent_id == agent_id), None)
+        agent = self._agents_by_id.get(agent_id)
 
         if status == AgentStatus.STOPPED.value:
             self._stopped_agents.add(agent_id)
@@ -715,12 +1150,8 @@ class MainWindow(QMainWindow):
             if row is not None:
                 self.cfg_agent_table.setItem(row, 7, QTableWidgetItem("false"))
                 self._set_agent_status(row, AgentStatus.STOPPED.value)
-            stopped = self.runtime.stop_agent(agent_id)
-            msg = "已切换为 STOPPED，后续不会派发任务"
-            if stopped:
-                msg = "已切换为 STOPPED，并停止当前执行中的任务"
-            self._append_agent_log_line(agent_id, msg)
-            self._add_log(agent_id, AgentStatus.STOPPED.value, msg)
+            # Terminating a process group can take the full grace period; keep it off the UI thread.
+            self.runtime.stop_agent_async(agent_id, self.bus.agent_stopped.emit)
             return
 
         if agent_id in self._stopped_agents:
@@ -734,6 +1165,13 @@ class MainWindow(QMainWindow):
             self._append_agent_log_line(agent_id, msg)
             self._add_log(agent_id, status, msg)
 
+    def _on_agent_stopped(self, agent_id: str, stopped: bool) -> None:
+        msg = "已切换为 STOPPED，后续不会派发任务"
+        if stopped:
+            msg = "已切换为 STOPPED，并停止当前执行中的任务（含其子进程）"
+        self._append_agent_log_line(agent_id, msg)
+        self._add_log(agent_id, AgentStatus.STOPPED.value, msg)
+
     def _set_agent_status(self, row: int, status: str) -> None:
         agent_id = self._row_agent_map.get(row)
         if not agent_id:
@@ -756,7 +1194,7 @@ class MainWindow(QMainWindow):
         if buf is None:
             return
         buf.append(line)
-        if len(buf) > 40:
+        if len(buf) > self.EXEC_LOG_LIMIT:
             del buf[0]
         row = self._agent_row_map.get(agent_id)
         if row is not None:
@@ -768,37 +1206,64 @@ class MainWindow(QMainWindow):
         item.setFont(self._exec_log_font)
         return item
 
+    @profiled
     def _add_log(self, agent_id: str, status: str, message: str) -> None:
         level = "error" if status == AgentStatus.FAILED.value else "normal"
         ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        self.logs.append(
-            LogEntry(
-                ts=ts,
-                agent_id=agent_id,
-                status=status,
-                level=level,
-                message=message,
-            )
+        entry = LogEntry(
+            ts=ts,
+            agent_id=agent_id,
+            status=status,
+            level=level,
+            message=message,
         )
-        try:
-            with self.runtime_log_path.open("a", encoding="utf-8") as f:
-                f.write(f"{ts}\t{agent_id}\t{status}\t{level}\t{message}\n")
-        except Exception:
-            pass
-        self._refresh_log_table()
-
+        bar = self.logs_table.verticalScrollBar()
+        # While the user is scrolled up (possibly through paged-in history) nothing is trimmed, or the rows
+        # they are reading would vanish; the excess goes once they are back at the bottom.
+        follow = bar.value() >= bar.maximum() - 1
+        self.logs.append(entry)
+        self.log_store.add_log(entry)
+        # Only the changed rows are touched; rebuilding every row per line made broadcasts quadratic.
+        selected = self._log_filter_level()
+        if selected in ("all", entry.level):
+            row = self.logs_table.rowCount()
+            self.logs_table.insertRow(row)
+            self._set_log_row(row, entry)
+        if follow:
+            self._trim_logs()
+            self.logs_table.scrollToBottom()
+
+    def _trim_logs(self) -> None:
+        if len(self.logs) <= self.LOG_MEMORY_LIMIT:
+            return
+        # Older rows stay in the database and are paged back in when scrolling up.
+        trimmed = self.logs[: len(self.logs) - self.LOG_MEMORY_LIMIT]
+        del self.logs[: len(trimmed)]
+        self._log_has_more = True
+        selected = self._log_filter_level()
+        dropped = min(self.logs_table.rowCount(), sum(1 for x in trimmed if selected in ("all", x.level)))
+        for _ in range(dropped):
+            self.logs_table.removeRow(0)
+
+    def _log_filter_level(self) -> str:
+        return str(self.log_filter.currentData()) if self.log_filter.count() else "all"
+
+    def _set_log_row(self, i: int, x: LogEntry) -> None:
+        self.logs_table.setItem(i, 0, QTableWidgetItem(x.ts))
+        self.logs_table.setItem(i, 1, QTableWidgetItem(x.agent_id))
+        self.logs_table.setItem(i, 2, QTableWidgetItem(x.status))
+        level_item = QTableWidgetItem(x.level)
+        level_item.setForeground(self._error_color if x.level == "error" else self._normal_color)
+        self.logs_table.setItem(i, 3, level_item)
+        self.logs_table.setItem(i, 4, QTableWidgetItem(x.message))
+
+    @profiled
     def _refresh_log_table(self) -> None:
-        selected = str(self.log_filter.currentData()) if self.log_filter.count() else "all"
-        rows = [x for x in self.logs if selected == "all" or x.level == selected]
+        selected = self._log_filter_level()
+        rows = [x for x in self.logs if selected in ("all", x.level)]
         self.logs_table.setRowCount(len(rows))
         for i, x in enumerate(rows):
-            self.logs_table.setItem(i, 0, QTableWidgetItem(x.ts))
-            self.logs_table.setItem(i, 1, QTableWidgetItem(x.agent_id))
-            self.logs_table.setItem(i, 2, QTableWidgetItem(x.status))
-            level_item = QTableWidgetItem(x.level)
-            level_item.setForeground(self._error_color if x.level == "error" else self._normal_color)
-            self.logs_table.setItem(i, 3, level_item)
-            self.logs_table.setItem(i, 4, QTableWidgetItem(x.message))
+            self._set_log_row(i, x)
 
     def send_team_message(self) -> None:
         text = self.chat_input.toPlainText().strip()
@@ -807,25 +1272,34 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, t["warn_title"], t["warn_chat_empty"])
             return
 
-        target_id = self.chat_target_combo.currentData()
-        self.send_chat_btn.setEnabled(False)
         self.chat_input.clear()
+        if not self._start_dialog(self.chat_target_combo.currentData(), text):
+            QMessageBox.warning(self, t["warn_title"], t["warn_no_active_agent"])
+
+    def _start_dialog(self, target_id: str, text: str, source: str = "") -> bool:
+        """把消息发给目标（agent_id、__all__ 或 __workflow__）；没有可参与的 agent 时返回 False。"""
+        if target_id == "__workflow__":
+            if all(stage.agent_id in self._stopped_agents for stage in self.settings.workflow):
+                return False
+            self._dialog_started()
+            self._run_workflow(text)
+            return True
 
         if target_id == "__all__":
             targets = [a for a in self.settings.agents if a.agent_id not in self._stopped_agents]
         else:
-            targets = [a for a in self.settings.agents if a.agent_id == target_id and a.agent_id not in self._stopped_agents]
+            agent = self._agents_by_id.get(target_id)
+            targets = [agent] if agent is not None and agent.agent_id not in self._stopped_agents else []
 
         if not targets:
-            self.send_chat_btn.setEnabled(True)
-            QMessageBox.warning(self, t["warn_title"], t["warn_no_active_agent"])
-            return
+            return False
 
+        self._dialog_started()
         for agent in targets:
             row = self._agent_row_map.get(agent.agent_id)
             if row is not None:
                 self._set_agent_status(row, AgentStatus.RUNNING.value)
-            self.bus.agent_log.emit(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"收到对话：{text}"))
+            self.bus.agent_log.emit(AgentLogEvent(agent.agent_id, agent.role, AgentStatus.RUNNING, f"收到对话{source}：{text}"))
 
         import threading
 
@@ -844,10 +1318,50 @@ class MainWindow(QMainWindow):
                 self.bus.dialog_finished.emit()
 
         threading.Thread(target=worker, daemon=True).start()
+        return True
+
+    def _dialog_started(self) -> None:
+        # Dialogs from Telegram or the API can overlap with one started here; the button waits for all of them,
+        # and the runtime queues turns that target the same agent.
+        self._dialogs_running += 1
+        self.send_chat_btn.setEnabled(False)
+
+    def _run_workflow(self, text: str) -> None:
+        work_path = self.path_edit.text().strip() or str(self.project_root)
+        timeout_sec = max(30, self.settings.bridge.timeout_sec)
+        stopped = set(self._stopped_agents)
+        orchestrator = Orchestrator(self.settings.agents)
+
+        def runner(agent: AgentConfig, prompt: str) -> AgentResult:
+            if agent.agent_id in stopped:
+                return AgentResult(agent.agent_id, agent.role, AgentStatus.FAILED, self._texts[self._lang]["warn_no_active_agent"])
+            return self.runtime.dispatch([agent], prompt, work_path, timeout_sec, self.bus.agent_log.emit)[0]
+
+        def on_stage_update(run: StageRun, result: AgentResult) -> None:
+            self.bus.agent_updated.emit(result)
+
+        import threading
+
+        def worker() -> None:
+            try:
+                report = orchestrator.run_workflow(text, self.settings.workflow, on_stage_update, self.bus.agent_log.emit, runner)
+                for line in report.summary_lines():
+                    self.bus.agent_log.emit(AgentLogEvent("team", "Workflow", AgentStatus.DONE, line))
+            finally:
+                orchestrator.close()
+                self.bus.dialog_finished.emit()
+
+        threading.Thread(target=worker, daemon=True).start()
 
     def handle_agent_log(self, event: AgentLogEvent) -> None:
         self._append_agent_log_line(event.agent_id, event.message)
         self._add_log(event.agent_id, event.status.value, event.message)
+        if self.telegram is not None:
+            level = self.settings.bridge.telegram_log_level
+            if level == "all" or (level == "error" and event.status == AgentStatus.FAILED):
+                self.telegram.post(f"[{event.agent_id}] {event.message}")
+        if self.control_api is not None:
+            self.control_api.publish_log(event)
 
     def handle_agent_update(self, result: AgentResult) -> None:
         row = self._agent_row_map.get(result.agent_id)
@@ -855,26 +1369,112 @@ class MainWindow(QMainWindow):
             self._set_agent_status(row, result.status.value)
         short = result.content.splitlines()[0] if result.content else ""
         self._append_agent_log_line(result.agent_id, f"结果：{short}")
+        # Metrics may hold only token usage: no monitor sample without psutil, from remote hosts, or when monitoring is off.
+        if "peak_cpu_percent" in result.metrics:
+            self._append_agent_log_line(
+                result.agent_id,
+                f"资源峰值：CPU {result.metrics['peak_cpu_percent']}% / "
+                f"内存 {result.metrics['peak_rss_mb']} MB / 文件句柄 {result.metrics['peak_open_fds']}",
+            )
         self._add_log(result.agent_id, result.status.value, result.content)
-        role_cn = next((self._role_cn(a) for a in self.settings.agents if a.agent_id == result.agent_id), result.role)
-        self.chat_history.append(f"[{result.agent_id.upper()} {role_cn}] {result.content.strip()}")
+        record = ChatRecord(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), result.agent_id, "assistant", result.content.strip())
+        message = self._chat_message(record, failed=result.status == AgentStatus.FAILED)
+        self._append_chat(message)
+        if self.telegram is not None:
+            self.telegram.post(f"{message.title} {result.status.value}\n{message.content}")
+        if self.control_api is not None:
+            self.control_api.publish_result(result)
+        self.log_store.add_chat(record)
         if result.content.strip():
             self._append_agent_terminal_line(result.agent_id, f"最终回复:\n{result.content.strip()}")
         sid = self.runtime.session_for(result.agent_id)
-        sid_updated = False
-        for agent in self.settings.agents:
-            if agent.agent_id == result.agent_id and "pending" not in sid:
-                if agent.session_id != sid:
-                    agent.session_id = sid
-                    sid_updated = True
-                break
+        agent = self._agents_by_id.get(result.agent_id)
+        sid_updated = agent is not None and "pending" not in sid and agent.session_id != sid
+        if sid_updated:
+            agent.session_id = sid
         if row is not None and "pending" not in sid:
             self.cfg_agent_table.setItem(row, 5, QTableWidgetItem(sid))
         if sid_updated:
             self._persist_settings()
 
+    def _chat_message(self, record: ChatRecord, failed: bool = False) -> ChatMessage:
+        agent = self._agents_by_id.get(record.agent_id)
+        role_cn = self._role_cn(agent) if agent is not None else record.agent_id
+        return ChatMessage(record.ts, record.agent_id, f"[{record.agent_id.upper()} {role_cn}]", record.content.strip(), failed)
+
+    def _append_chat(self, message: ChatMessage) -> None:
+        self._chat_loaded += 1
+        self._on_chat_trimmed(self.conversation.append_message(message))
+
+    def _on_chat_trimmed(self, trimmed: int) -> None:
+        if trimmed:
+            # Messages dropped from the top are re-read from the store when the user scrolls back.
+            self._chat_loaded -= trimmed
+            self._chat_has_more = True
+
+    def _restore_history(self) -> None:
+        # Only the newest page of each table is read at startup; the rest is paged in on scroll.
+        self.logs = self.log_store.recent_logs(self.LOG_PAGE_SIZE)
+        self._log_has_more = len(self.logs) == self.LOG_PAGE_SIZE
+        self._refresh_log_table()
+        self.logs_table.scrollToBottom()
+
+        records = self.log_store.recent_chat(self.CHAT_PAGE_SIZE)
+        self._chat_loaded = len(records)
+        self._chat_has_more = len(records) == self.CHAT_PAGE_SIZE
+        self.conversation.prepend_messages([self._chat_message(r) for r in records])
+        self.conversation.scroll_to_bottom()
+        self._history_paging_ready = True
+        self._restore_terminal_history()
+
+    def _restore_terminal_history(self) -> None:
+        # The chat view is the cross-agent timeline from the log store; each agent terminal instead starts
+        # with the tail of that agent's current Codex session, prompts included, from the transcript store.
+        for agent in self.settings.agents:
+            try:
+                turns = self.runtime.recent_turns(agent.agent_id, self.TERMINAL_RESTORE_TURNS)
+            except (OSError, ValueError):
+                continue
+            for _idx, turn in turns:
+                label = "用户" if turn.role == "user" else f"回复 {turn.status}".strip()
+                self._append_agent_terminal_line(agent.agent_id, f"[{turn.ts}] {label}:\n{turn.content.strip()}")
+        self.agent_terminals.clear_unread()
+
+    def _on_logs_scrolled(self, value: int) -> None:
+        bar = self.logs_table.verticalScrollBar()
+        if value == bar.maximum() and value > bar.minimum():
+            self._trim_logs()
+            return
+        if not self._history_paging_ready or not self._log_has_more or value != bar.minimum() or bar.maximum() == 0:
+            return
+        self.log_store.flush(0.5)
+        older = self.log_store.recent_logs(self.LOG_PAGE_SIZE, skip=len(self.logs))
+        self._log_has_more = len(older) == self.LOG_PAGE_SIZE
+        if not older:
+            return
+        self.logs[:0] = older
+        self._refresh_log_table()
+        selected = self._log_filter_level()
+        shown = sum(1 for x in older if selected in ("all", x.level))
+        if shown and shown < self.logs_table.rowCount():
+            self.logs_table.scrollToItem(self.logs_table.item(shown, 0), QTableWidget.PositionAtTop)
+
+    def _load_older_chat(self) -> None:
+        if not self._history_paging_ready or not self._chat_has_more:
+            return
+        self.log_store.flush(0.5)
+        older = self.log_store.recent_chat(self.CHAT_PAGE_SIZE, skip=self._chat_loaded)
+        self._chat_has_more = len(older) == self.CHAT_PAGE_SIZE
+        if not older:
+            return
+        self._chat_loaded += len(older)
+        self.conversation.prepend_messages([self._chat_message(r) for r in older])
+
     def _on_dialog_finished(self) -> None:
-        self.send_chat_btn.setEnabled(True)
+        self._dialogs_running = max(0, self._dialogs_running - 1)
+        if not self._dialogs_running:
+            self.send_chat_btn.setEnabled(True)
+        self._refresh_usage_column()
 
     def save_config(self) -> None:
         t = self._texts[self._lang]
@@ -890,6 +1490,10 @@ class MainWindow(QMainWindow):
                 extra_params = self.cfg_agent_table.item(row, 6).text().strip()
                 enabled_raw = self.cfg_agent_table.item(row, 7).text().strip().lower()
                 enabled = enabled_raw in {"1", "true", "yes", "y", "on"}
+                host_item = self.cfg_agent_table.item(row, 8)
+                host = host_item.text().strip() if host_item is not None else ""
+                if host not in {"", "auto"} | {h.name for h in self.settings.hosts}:
+                    raise ValueError(f"agent {agent_id} 引用了未配置的主机: {host}")
                 agents.append(
                     AgentConfig(
                         agent_id=agent_id,
@@ -900,8 +1504,10 @@ class MainWindow(QMainWindow):
                         session_id=session_id,
                         extra_params=extra_params,
                         enabled=enabled,
+                        host=host,
                     )
                 )
+            validate_agents(agents, self.settings.app.max_agents)
 
             self.settings = Settings(
                 app=self.settings.app,
@@ -912,14 +1518,24 @@ class MainWindow(QMainWindow):
                     retry=self.cfg_retry.value(),
                     telegram_token=self.cfg_telegram_token.text().strip(),
                     telegram_chat_id=self.cfg_telegram_chat_id.text().strip(),
+                    telegram_api_url=self.settings.bridge.telegram_api_url,
+                    telegram_log_level=self.settings.bridge.telegram_log_level,
                 ),
                 agents=agents,
+                workflow=self.settings.workflow,
+                runtime=self.settings.runtime,
+                hosts=self.settings.hosts,
+                api=self.settings.api,
             )
             save_settings(self.config_path, self.settings)
-            self.runtime.stop()
-            self.runtime = AgentRuntimeManager(self.settings.agents, self.project_root)
+            import threading
+
+            threading.Thread(target=self.runtime.stop, daemon=True).start()
+            self.runtime = self._make_runtime()
             self.runtime.start()
+            self.runtime.prime_context(self.path_edit.text().strip() or str(self.project_root), self.file_index)
             self._reload_agent_rows()
+            self._start_telegram()
             QMessageBox.information(self, t["warn_title"], t["save_ok"])
         except Exception as exc:  # noqa: BLE001
             QMessageBox.critical(self, t["warn_title"], t["save_fail"].format(err=str(exc)))
@@ -934,75 +1550,226 @@ class MainWindow(QMainWindow):
         logs_dir = self.project_root / "logs"
         logs_dir.mkdir(parents=True, exist_ok=True)
         path = logs_dir / f"logs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        self.log_store.flush()
         with path.open("w", newline="", encoding="utf-8-sig") as f:
             writer = csv.writer(f)
             writer.writerow(["time", "agent", "status", "level", "message"])
-            for row in self.logs:
+            for row in self.log_store.iter_logs():
                 writer.writerow([row.ts, row.agent_id, row.status, row.level, row.message])
         QMessageBox.information(self, self._texts[self._lang]["warn_title"], self._texts[self._lang]["csv_ok"].format(path=path))
 
+    def open_capture_replay(self) -> None:
+        # Captures written earlier stay viewable even after stream_capture is switched off.
+        store = self.runtime.captures or CaptureStore(self.project_root / "logs" / "captures")
+        dialog = CaptureReplayDialog(store, [a.agent_id for a in self.settings.agents], self)
+        dialog.exec()
+
     def choose_work_path(self) -> None:
         chosen = QFileDialog.getExistingDirectory(self, self._texts[self._lang]["choose_path"], self.path_edit.text().strip())
         if chosen:
             self.path_edit.setText(chosen)
-            self.file_tree.setRootIndex(self.fs_model.index(chosen))
+            self._on_work_path_changed()
 
-    def run_command(self) -> None:
-        cmd = self.cmd_input.text().strip()
-        if not cmd:
+    def _on_work_path_changed(self) -> None:
+        root = Path(self.path_edit.text().strip() or str(self.project_root))
+        if not root.is_dir():
+            return
+        self.file_tree.setRootIndex(self.fs_model.index(str(root)))
+        if self.file_index is not None and self.file_index.root == root:
+            self.runtime.prime_context(str(root), self.file_index)
+            return
+        if self.file_index is not None:
+            self.file_index.stop()
+        self.file_index = FileIndex(root, on_changed=self.bus.file_index_changed.emit)
+        self.file_index.start()
+        self.runtime.prime_context(str(root), self.file_index)
+        self._on_file_index_changed()
+
+    def _on_file_index_changed(self) -> None:
+        t = self._texts[self._lang]
+        index = getattr(self, "file_index", None)
+        if index is None or not index.ready:
+            self.lbl_file_index.setText(t["index_building"])
+            return
+        self.lbl_file_index.setText(t["index_ready"].format(n=index.file_count))
+        if self.file_search_mode.currentIndex() == 0 and self.file_search_edit.text().strip():
+            self._run_file_search()
+
+    def _run_file_search(self) -> None:
+        t = self._texts[self._lang]
+        query = self.file_search_edit.text().strip()
+        self._content_cancel.set()
+        self.file_results.clear()
+        if not query or self.file_index is None or not self.file_index.ready:
+            return
+        root = self.file_index.root
+        if self.file_search_mode.currentIndex() == 0:
+            started = time.perf_counter()
+            paths = self.file_index.search(query)
+            for rel in paths:
+                item = QListWidgetItem(rel)
+                item.setData(Qt.UserRole, str(root / rel))
+                self.file_results.addItem(item)
+            self.lbl_file_index.setText(t["search_results"].format(n=len(paths), ms=(time.perf_counter() - started) * 1000))
             return
-        self.run_cmd_btn.setEnabled(False)
-        self.terminal_output.clear()
-        self.bus.terminal_output.emit(self._texts[self._lang]["running_cmd"].format(cmd=cmd))
 
+        # Content search reads files, so it streams from a worker and is cancelled by the next keystroke.
+        self._content_cancel = cancel = Event()
+        self._content_generation += 1
+        generation, index = self._content_generation, self.file_index
+        self.lbl_file_index.setText(t["content_searching"].format(n=0))
         import threading
 
         def worker() -> None:
-            try:
-                try:
-                    proc = subprocess.Popen(
-                        ["powershell", "-NoProfile", "-Command", cmd],
-                        shell=False,
-                        cwd=self.path_edit.text().strip() or str(self.project_root),
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        encoding="utf-8",
-                        errors="replace",
-                        bufsize=1,
-                    )
-                except Exception:
-                    proc = subprocess.Popen(
-                        cmd,
-                        shell=True,
-                        cwd=self.path_edit.text().strip() or str(self.project_root),
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        encoding="utf-8",
-                        errors="replace",
-                        bufsize=1,
-                    )
-                if proc.stdout:
-                    for line in proc.stdout:
-                        if line:
-                            self.bus.terminal_output.emit(line.rstrip())
-                return_code = proc.wait()
-                if return_code != 0:
-                    self.bus.terminal_output.emit(f"命令退出码: {return_code}")
-                self.bus.terminal_output.emit(self._texts[self._lang]["cmd_done"])
-            except Exception as exc:  # noqa: BLE001
-                self.bus.terminal_output.emit(f"命令执行失败: {exc}")
-            finally:
-                self.bus.command_finished.emit()
+            batch, last_emit = [], time.monotonic()
+            for match in index.search_content(query, cancel):
+                batch.append(match)
+                if len(batch) >= 50 or time.monotonic() - last_emit > 0.1:
+                    self.bus.content_matches.emit(generation, batch)
+                    batch, last_emit = [], time.monotonic()
+            if not cancel.is_set():
+                self.bus.content_matches.emit(generation, batch + [None])
 
         threading.Thread(target=worker, daemon=True).start()
 
-    def _append_terminal_output(self, text: str) -> None:
-        self.terminal_output.append(text)
+    def _on_content_matches(self, generation: int, matches: list) -> None:
+        if generation != self._content_generation or self.file_index is None:
+            return
+        t = self._texts[self._lang]
+        finished = bool(matches) and matches[-1] is None
+        for match in matches:
+            if match is None:
+                continue
+            item = QListWidgetItem(f"{match.path}:{match.line_no}: {match.line}")
+            item.setData(Qt.UserRole, str(self.file_index.root / match.path))
+            item.setData(Qt.UserRole + 1, match.line_no)
+            self.file_results.addItem(item)
+        count = self.file_results.count()
+        if finished:
+            self.lbl_file_index.setText(t["content_done"].format(n=count))
+        else:
+            self.lbl_file_index.setText(t["content_searching"].format(n=count))
+
+    def _open_search_result(self, item: QListWidgetItem) -> None:
+        path = item.data(Qt.UserRole)
+        if not path:
+            return
+        index = self.fs_model.index(path)
+        if index.isValid():
+            self.file_tree.setCurrentIndex(index)
+            self.file_tree.scrollTo(index)
+        self.file_preview.open_file(Path(path), item.data(Qt.UserRole + 1) or 0)
+
+    def _preview_tree_index(self, index) -> None:
+        if not self.fs_model.isDir(index):
+            self.file_preview.open_file(Path(self.fs_model.filePath(index)))
 
-    def _on_command_finished(self) -> None:
-        self.run_cmd_btn.setEnabled(True)
+    def run_command(self) -> None:
+        cmd = self.cmd_input.text().strip()
+        if not cmd:
+            return
+        session = self._current_shell_session()
+        if session is None or not session.is_alive():
+            self.new_shell_tab()
+            session = self._current_shell_session()
+            if session is None:
+                return
+        if not self._cmd_history or self._cmd_history[-1] != cmd:
+            self._cmd_history.append(cmd)
+            del self._cmd_history[: -self.SHELL_HISTORY_LIMIT]
+            try:
+                with self.shell_history_path.open("a", encoding="utf-8") as f:
+                    f.write(cmd.replace("\n", " ") + "\n")
+            except OSError:
+                pass
+        self._history_pos = len(self._cmd_history)
+        self.cmd_input.clear()
+        try:
+            session.send_line(cmd)
+        except OSError as exc:
+            self._append_shell_text(self.shell_tabs.currentWidget(), f"\n命令执行失败: {exc}\n")
+
+    def new_shell_tab(self) -> None:
+        t = self._texts[self._lang]
+        try:
+            session = open_shell_session(self.path_edit.text().strip() or str(self.project_root))
+        except Exception as exc:  # noqa: BLE001
+            QMessageBox.critical(self, t["warn_title"], f"命令执行失败: {exc}")
+            return
+        panel = QPlainTextEdit()
+        panel.setReadOnly(True)
+        panel.setFont(self._exec_log_font)
+        panel.setMaximumBlockCount(self.SHELL_MAX_LINES)
+        self._shell_sessions[panel] = session
+        self._shell_counter += 1
+        idx = self.shell_tabs.addTab(panel, t["shell_tab"].format(n=self._shell_counter, pid=session.pid))
+        self.shell_tabs.setCurrentIndex(idx)
+        if not self._shell_timer.isActive():
+            self._shell_timer.start(50)
+
+    def interrupt_shell(self) -> None:
+        session = self._current_shell_session()
+        if session is not None and session.is_alive():
+            session.interrupt()
+
+    def kill_shell(self) -> None:
+        session = self._current_shell_session()
+        if session is not None:
+            session.kill()
+
+    def _close_shell_tab(self, index: int) -> None:
+        panel = self.shell_tabs.widget(index)
+        session = self._shell_sessions.pop(panel, None)
+        if session is not None:
+            session.close()
+        self.shell_tabs.removeTab(index)
+        panel.deleteLater()
+        if not self._shell_sessions:
+            self._shell_timer.stop()
+
+    def _current_shell_session(self) -> Optional[ShellSession]:
+        return self._shell_sessions.get(self.shell_tabs.currentWidget())
+
+    def _pump_shell_output(self) -> None:
+        # One timer tick moves everything each reader thread buffered since the last tick.
+        for panel, session in list(self._shell_sessions.items()):
+            text = session.drain()
+            if text:
+                self._append_shell_text(panel, self._clean_shell_text(text))
+            if not session.is_alive() and panel.property("exited") is not True:
+                panel.setProperty("exited", True)
+                text = session.drain()
+                self._append_shell_text(
+                    panel,
+                    self._clean_shell_text(text) + "\n" + self._texts[self._lang]["shell_exited"].format(code=session.exit_code()),
+                )
+
+    @staticmethod
+    def _clean_shell_text(text: str) -> str:
+        text = _ANSI_ESCAPE.sub("", text).replace("\r\n", "\n")
+        return text.replace("\r", "")
+
+    def _append_shell_text(self, panel: QPlainTextEdit, text: str) -> None:
+        bar = panel.verticalScrollBar()
+        follow = bar.value() >= bar.maximum() - 2
+        cursor = panel.textCursor()
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertText(text)
+        if follow:
+            bar.setValue(bar.maximum())
+
+    def _load_shell_history(self) -> List[str]:
+        try:
+            lines = self.shell_history_path.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            return []
+        return [line for line in lines if line.strip()][-self.SHELL_HISTORY_LIMIT :]
+
+    def _step_history(self, delta: int) -> None:
+        if not self._cmd_history:
+            return
+        self._history_pos = max(0, min(len(self._cmd_history), self._history_pos + delta))
+        self.cmd_input.setText(self._cmd_history[self._history_pos] if self._history_pos < len(self._cmd_history) else "")
 
 
 def run_app() -> None:
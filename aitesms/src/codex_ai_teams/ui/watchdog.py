@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import Dict, List, Optional, Tuple
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+TICK_MS = 100
+SAMPLE_INTERVAL_SEC = 0.02
+STALL_THRESHOLD_SEC = 0.5
+LAG_WINDOW_TICKS = 10
+KEEP_REPORTS = 50
+TOP_STACKS = 3
+
+_UI_DIR = str(Path(__file__).resolve().parent)
+
+Frame = Tuple[str, int, str]
+
+
+def _stack(frame: Optional[FrameType]) -> Tuple[Frame, ...]:
+    out: List[Frame] = []
+    while frame is not None:
+        out.append((frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name))
+        frame = frame.f_back
+    out.reverse()
+    return tuple(out)
+
+
+def _ui_chain(stack: Tuple[Frame, ...]) -> List[str]:
+    """栈中属于 ui 包的函数，外层在前，例如 main_window.handle_agent_log → main_window._add_log。"""
+    chain: List[str] = []
+    for filename, _, name in stack:
+        if filename.startswith(_UI_DIR):
+            label = f"{Path(filename).stem}.{name}"
+            if label not in chain:
+                chain.append(label)
+    return chain
+
+
+class EventLoopWatchdog(QObject):
+    """监测 Qt 事件循环延迟：主线程定时器记录心跳，采样线程发现心跳停顿超过阈值后持续抓取主线程栈，
+    卡顿结束时把停在哪个 UI 函数、各自耗时与常见调用栈写入 logs/stalls/。"""
+
+    lag_changed = Signal(float)
+    stall_reported = Signal(str, float)
+
+    def __init__(self, report_dir: Path, threshold_sec: float = STALL_THRESHOLD_SEC, parent=None) -> None:
+        super().__init__(parent)
+        self.report_dir = report_dir
+        self.threshold_sec = threshold_sec
+        self._main_ident = threading.main_thread().ident
+        self._last_tick = time.perf_counter()
+        self._window_lag = 0.0
+        self._ticks = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._on_tick)
+
+    def start(self) -> None:
+        self._last_tick = time.perf_counter()
+        self._timer.start(TICK_MS)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample_loop, name="ui-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._timer.stop()
+        self._stop.set()
+
+    def _on_tick(self) -> None:
+        now = time.perf_counter()
+        lag = max(0.0, now - self._last_tick - TICK_MS / 1000)
+        self._last_tick = now
+        self._window_lag = max(self._window_lag, lag)
+        self._ticks += 1
+        if self._ticks >= LAG_WINDOW_TICKS:
+            self.lag_changed.emit(self._window_lag * 1000)
+            self._window_lag = 0.0
+            self._ticks = 0
+
+    def _sample_loop(self) -> None:
+        samples: List[Tuple[Frame, ...]] = []
+        stall_from = 0.0
+        while not self._stop.wait(SAMPLE_INTERVAL_SEC):
+            last = self._last_tick
+            silent = time.perf_counter() - last - TICK_MS / 1000
+            if silent >= self.threshold_sec:
+                if not samples:
+                    stall_from = last
+                frame = sys._current_frames().get(self._main_ident)
+                samples.append(_stack(frame))
+                continue
+            if samples and last > stall_from:
+                # The heartbeat came back: the stall lasted from the tick before it until this one.
+                duration = last - stall_from - TICK_MS / 1000
+                path = self._write_report(samples, duration)
+                samples = []
+                if path is not None:
+                    self.stall_reported.emit(str(path), duration)
+
+    def _write_report(self, samples: List[Tuple[Frame, ...]], duration: float) -> Optional[Path]:
+        started = datetime.now().timestamp() - duration
+        lines = [
+            f"主线程卡顿 {duration:.2f}s，开始于 {datetime.fromtimestamp(started).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}",
+            f"阈值 {self.threshold_sec:.2f}s；超过阈值后每 {SAMPLE_INTERVAL_SEC * 1000:.0f}ms 采样一次，共 {len(samples)} 次",
+            "",
+            "卡顿期间所在的 UI 函数（含子调用，耗时按采样占比折算到整段卡顿）：",
+        ]
+        per_function: Counter = Counter()
+        for stack in samples:
+            per_function.update(_ui_chain(stack))
+        if per_function:
+            for label, hits in per_function.most_common():
+                lines.append(f"  {label:<48} {duration * hits / len(samples):6.2f}s  {hits * 100 // len(samples):3d}%")
+        else:
+            lines.append("  （未落在 UI 代码中，可能在 Qt 内部或其他模块）")
+        lines += ["", "最常见的调用栈（按函数归并，行号取最后一次采样）："]
+        # Group by function chain; the same loop sampled at different lines is one hot path.
+        groups: Dict[Tuple[Tuple[str, str], ...], Tuple[Frame, ...]] = {}
+        hits_by_chain: Counter = Counter()
+        for stack in samples:
+            chain = tuple((filename, name) for filename, _, name in stack)
+            groups[chain] = stack
+            hits_by_chain[chain] += 1
+        for chain, hits in hits_by_chain.most_common(TOP_STACKS):
+            lines.append(f"[{hits} 次，{hits * 100 // len(samples)}%]")
+            lines += [f'  File "{filename}", line {lineno}, in {name}' for filename, lineno, name in groups[chain]]
+        try:
+            self.report_dir.mkdir(parents=True, exist_ok=True)
+            path = self.report_dir / f"stall-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.txt"
+            path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+            for old in sorted(self.report_dir.glob("stall-*.txt"))[:-KEEP_REPORTS]:
+                old.unlink()
+        except OSError:
+            return None
+        return path
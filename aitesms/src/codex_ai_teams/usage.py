@@ -0,0 +1,191 @@
+import json
+import os
+from dataclasses import asdict, dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+KEEP_DAYS = 90
+KEEP_SESSIONS_PER_AGENT = 50
+
+
+@dataclass
+class TokenUsage:
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+    turns: int = 0
+
+    @classmethod
+    def from_event(cls, usage: Dict[str, object]) -> "TokenUsage":
+        """解析 turn.completed 事件里的 usage 字段；缺失或非法的值按 0 计。"""
+
+        def count(name: str) -> int:
+            try:
+                return max(0, int(usage.get(name) or 0))
+            except (TypeError, ValueError):
+                return 0
+
+        return cls(count("input_tokens"), count("cached_input_tokens"), count("output_tokens"), 1)
+
+    @property
+    def total(self) -> int:
+        # Codex reports cached tokens as part of input_tokens, so they are not added again.
+        return self.input_tokens + self.output_tokens
+
+    def add(self, other: "TokenUsage") -> None:
+        self.input_tokens += other.input_tokens
+        self.cached_input_tokens += other.cached_input_tokens
+        self.output_tokens += other.output_tokens
+        self.turns += other.turns
+
+    def as_metrics(self) -> Dict[str, float]:
+        return {
+            "input_tokens": self.input_tokens,
+            "cached_input_tokens": self.cached_input_tokens,
+            "output_tokens": self.output_tokens,
+            "turns": self.turns,
+        }
+
+    @classmethod
+    def from_metrics(cls, metrics: Dict[str, float]) -> Optional["TokenUsage"]:
+        if "input_tokens" not in metrics:
+            return None
+        return cls(
+            int(metrics.get("input_tokens", 0)),
+            int(metrics.get("cached_input_tokens", 0)),
+            int(metrics.get("output_tokens", 0)),
+            int(metrics.get("turns", 0)),
+        )
+
+    def describe(self) -> str:
+        return f"输入 {self.input_tokens}（缓存 {self.cached_input_tokens}） / 输出 {self.output_tokens} tokens"
+
+
+def format_tokens(count: int) -> str:
+    if count >= 1_000_000:
+        return f"{count / 1_000_000:.1f}M"
+    if count >= 1000:
+        return f"{count / 1000:.1f}k"
+    return str(count)
+
+
+@dataclass
+class BudgetCheck:
+    used: int
+    soft: int
+    hard: int
+
+    @property
+    def over_soft(self) -> bool:
+        return self.soft > 0 and self.used >= self.soft
+
+    @property
+    def over_hard(self) -> bool:
+        return self.hard > 0 and self.used >= self.hard
+
+
+def _usage(row: Dict[str, object]) -> TokenUsage:
+    try:
+        return TokenUsage(**row)
+    except TypeError:
+        return TokenUsage()
+
+
+class UsageLedger:
+    """按 agent、会话、自然日累计 Codex 的 token 用量，保存在 JSON 文件中，重启后继续累计。
+
+    日预算按本地日期计：soft 超出后每次调度都提示，hard 超出后拒绝启动新的 CLI 运行。0 表示不限。
+    """
+
+    def __init__(self, path: Optional[Path] = None, soft_daily: int = 0, hard_daily: int = 0) -> None:
+        self.path = path
+        self.soft_daily = max(0, soft_daily)
+        self.hard_daily = max(0, hard_daily)
+        self._totals: Dict[str, TokenUsage] = {}
+        self._sessions: Dict[str, Dict[str, TokenUsage]] = {}
+        self._days: Dict[str, Dict[str, TokenUsage]] = {}
+        self._lock = Lock()
+        self._load()
+
+    def _load(self) -> None:
+        if self.path is None or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        self._totals = {agent_id: _usage(row) for agent_id, row in dict(data.get("agents") or {}).items()}
+        self._sessions = {
+            agent_id: {sid: _usage(row) for sid, row in dict(rows).items()}
+            for agent_id, rows in dict(data.get("sessions") or {}).items()
+        }
+        self._days = {
+            day: {agent_id: _usage(row) for agent_id, row in dict(rows).items()}
+            for day, rows in dict(data.get("days") or {}).items()
+        }
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            data = {
+                "agents": {agent_id: asdict(u) for agent_id, u in self._totals.items()},
+                "sessions": {agent_id: {sid: asdict(u) for sid, u in rows.items()} for agent_id, rows in self._sessions.items()},
+                "days": {day: {agent_id: asdict(u) for agent_id, u in rows.items()} for day, rows in self._days.items()},
+            }
+        tmp = self.path.with_suffix(".tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def record(self, agent_id: str, session_id: str, usage: TokenUsage) -> BudgetCheck:
+        """累计一次运行的用量，返回记账后该 agent 当天的预算状态。"""
+        today = date.today().isoformat()
+        with self._lock:
+            self._totals.setdefault(agent_id, TokenUsage()).add(usage)
+            sessions = self._sessions.setdefault(agent_id, {})
+            # Re-inserted on every turn so the oldest idle sessions are the ones trimmed.
+            session = sessions.pop(session_id, TokenUsage())
+            session.add(usage)
+            sessions[session_id] = session
+            for old in list(sessions)[:-KEEP_SESSIONS_PER_AGENT]:
+                del sessions[old]
+            self._days.setdefault(today, {}).setdefault(agent_id, TokenUsage()).add(usage)
+            cutoff = (date.today() - timedelta(days=KEEP_DAYS)).isoformat()
+            for day in [d for d in self._days if d < cutoff]:
+                del self._days[day]
+        self._save()
+        return self.check(agent_id)
+
+    def today(self, agent_id: str) -> TokenUsage:
+        with self._lock:
+            row = self._days.get(date.today().isoformat(), {}).get(agent_id)
+            return TokenUsage(**asdict(row)) if row is not None else TokenUsage()
+
+    def total(self, agent_id: str) -> TokenUsage:
+        with self._lock:
+            row = self._totals.get(agent_id)
+            return TokenUsage(**asdict(row)) if row is not None else TokenUsage()
+
+    def session(self, agent_id: str, session_id: str) -> TokenUsage:
+        with self._lock:
+            row = self._sessions.get(agent_id, {}).get(session_id)
+            return TokenUsage(**asdict(row)) if row is not None else TokenUsage()
+
+    def check(self, agent_id: str) -> BudgetCheck:
+        return BudgetCheck(self.today(agent_id).total, self.soft_daily, self.hard_daily)
+
+    def snapshot(self) -> Dict[str, Tuple[TokenUsage, TokenUsage]]:
+        """各 agent 的 (当天, 累计) 用量；从未记账的 agent 不在结果中。"""
+        today = date.today().isoformat()
+        with self._lock:
+            days = self._days.get(today, {})
+            return {
+                agent_id: (TokenUsage(**asdict(days.get(agent_id, TokenUsage()))), TokenUsage(**asdict(total)))
+                for agent_id, total in self._totals.items()
+            }
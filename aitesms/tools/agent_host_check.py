@@ -0,0 +1,98 @@
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_PATH = PROJECT_ROOT / "src"
+if str(SRC_PATH) not in sys.path:
+    sys.path.insert(0, str(SRC_PATH))
+
+from codex_ai_teams.agent_host import AgentHostServer  # noqa: E402
+from codex_ai_teams.agent_runtime import AgentRuntimeManager  # noqa: E402
+from codex_ai_teams.config import DEFAULT_CODEX_JS, HostSettings, RuntimeSettings  # noqa: E402
+from codex_ai_teams.models import AgentConfig, AgentStatus  # noqa: E402
+from codex_ai_teams.remote_runtime import HostClient, run_remote  # noqa: E402
+
+
+def check(client: HostClient, work_path: str, slow_text: str) -> bool:
+    """依次检查 hello、错误口令、run、runtime_info 与 stop；返回是否全部通过。"""
+    failures = []
+
+    def expect(name: str, ok: bool, detail: object) -> None:
+        print(f"{'通过' if ok else '失败'} {name}: {detail}")
+        if not ok:
+            failures.append(name)
+
+    hello = client.request("hello")
+    expect("hello", hello.get("version") is not None, {k: hello.get(k) for k in ("host", "version", "running", "cpus")})
+
+    if client.settings.token:
+        wrong = HostClient(HostSettings(client.settings.name, client.settings.address, client.settings.token + "x"))
+        try:
+            wrong.request("hello")
+            expect("错误口令被拒绝", False, "请求被接受")
+        except RuntimeError as exc:
+            expect("错误口令被拒绝", True, exc)
+
+    agent = AgentConfig("host-check", "Host Check")
+    logs = []
+    reply = run_remote(client, agent, "", "ping", work_path, 60, logs.append, False)
+    result = reply["result"]
+    expect("run", result.status == AgentStatus.DONE, f"{result.status.value} {result.content[:60]!r}，日志 {len(logs)} 条，会话 {reply['session_id']}")
+
+    info = client.request("runtime_info")
+    pid = dict(info.get("pids") or {}).get(agent.agent_id, -1)
+    expect("runtime_info", pid == reply["pid"] and pid > 0, f"pid {pid}，会话 {dict(info.get('sessions') or {}).get(agent.agent_id)}")
+
+    # Stop a run that is still going: start it on its own connection, then stop it from another.
+    slow = AgentConfig("host-check-stop", "Host Check")
+    outcome = {}
+    runner = threading.Thread(
+        target=lambda: outcome.update(run_remote(client, slow, "", slow_text, work_path, 60, None, True)), daemon=True
+    )
+    runner.start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline and int(client.request("hello").get("running", 0)) == 0:
+        time.sleep(0.05)
+    stopped = client.request("stop", {"agent_id": slow.agent_id}).get("stopped")
+    runner.join(timeout=30)
+    status = outcome["result"].status.value if outcome else "无结果"
+    expect("stop", bool(stopped) and status != AgentStatus.DONE.value, f"stopped={stopped}，运行结果 {status}")
+    return not failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="在本机对 agent 主机守护进程做一次往返检查：hello、run、runtime_info、stop")
+    parser.add_argument("--address", default="", help="检查已启动的守护进程（host:port）；留空则在本机临时启动一个")
+    parser.add_argument("--token", default="check-token", help="与守护进程一致的口令；临时守护进程也使用它")
+    parser.add_argument("--codex-js", default=DEFAULT_CODEX_JS, help="临时守护进程使用的 codex.js")
+    parser.add_argument("--work-path", default="", help="run 使用的工作路径，默认为临时目录")
+    parser.add_argument("--slow-text", default="请详细解释这个仓库的结构", help="stop 检查用的任务，需要运行数秒以上")
+    args = parser.parse_args()
+
+    work_path = args.work_path or tempfile.mkdtemp(prefix="agent-host-check-")
+    server = runtime = None
+    address = args.address
+    if not address:
+        runtime = AgentRuntimeManager([], Path(work_path), RuntimeSettings(codex_js=args.codex_js, adaptive_timeout=False))
+        runtime.start()
+        server = AgentHostServer(("127.0.0.1", 0), runtime, args.token)
+        threading.Thread(target=server.serve_forever, name="agent-host", daemon=True).start()
+        address = f"127.0.0.1:{server.server_address[1]}"
+        print(f"临时守护进程 {address}，根目录 {work_path}")
+    try:
+        ok = check(HostClient(HostSettings("check", address, args.token)), work_path, args.slow_text)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            runtime.stop()
+    print("全部通过" if ok else "存在失败项")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_PATH = PROJECT_ROOT / "src"
+if str(SRC_PATH) not in sys.path:
+    sys.path.insert(0, str(SRC_PATH))
+
+from codex_ai_teams.bridge_adapter import BridgeAdapter  # noqa: E402
+from codex_ai_teams.models import AgentConfig  # noqa: E402
+
+
+class FakeBridge:
+    """本地模拟的 bridge：POST /v1/agents/<id>/execute 回显任务，可模拟延迟、503 与流式输出；GET /stats 返回各 agent 的执行次数。"""
+
+    def __init__(self, latency_sec: float, fail_rate: float, chunks: int) -> None:
+        self.latency_sec = latency_sec
+        self.fail_rate = fail_rate
+        self.chunks = max(1, chunks)
+        self.executions: Dict[str, int] = {}
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def accept(self, agent_id: str) -> bool:
+        with self._lock:
+            if random.random() < self.fail_rate:
+                self.rejected += 1
+                return False
+            self.executions[agent_id] = self.executions.get(agent_id, 0) + 1
+            return True
+
+
+def make_handler(bridge: FakeBridge):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt: str, *args) -> None:  # noqa: A002
+            pass
+
+        def _reply(self, status: int, data: object) -> None:
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            try:
+                self.wfile.write(body)
+            except OSError:
+                # The client gave up (e.g. its read timeout fired); the run still counts as executed.
+                self.close_connection = True
+
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path == "/stats":
+                self._reply(200, {"executions": bridge.executions, "rejected_503": bridge.rejected})
+            else:
+                self._reply(404, {"error": "Not Found"})
+
+        def do_POST(self) -> None:  # noqa: N802
+            parts = self.path.strip("/").split("/")
+            length = int(self.headers.get("Content-Length", 0) or 0)
+            try:
+                request = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+            except ValueError:
+                self._reply(400, {"error": "invalid JSON"})
+                return
+            if len(parts) != 4 or parts[:2] != ["v1", "agents"] or parts[3] != "execute":
+                self._reply(404, {"error": f"unknown path {self.path}"})
+                return
+            if not bridge.accept(parts[2]):
+                self._reply(503, {"error": "busy"})
+                return
+            content = f"[{parts[2]}] 已处理：{request.get('text', '')}"
+            if not request.get("stream"):
+                time.sleep(bridge.latency_sec)
+                self._reply(200, {"status": "DONE", "content": content})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            step = max(1, len(content) // bridge.chunks)
+            for start in range(0, len(content), step):
+                time.sleep(bridge.latency_sec / bridge.chunks)
+                line = {"type": "delta", "text": content[start : start + step]}
+                self.wfile.write((json.dumps(line, ensure_ascii=False) + "\n").encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write((json.dumps({"type": "result", "status": "DONE", "content": ""}) + "\n").encode("utf-8"))
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地模拟 bridge 服务，用于调试 BridgeAdapter（把 bridge.bridge_url 指向它）")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="每次执行的模拟耗时")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="按此概率返回 503（不计为执行，客户端会重试）")
+    parser.add_argument("--chunks", type=int, default=4, help="流式响应拆成的片段数")
+    parser.add_argument("--check", action="store_true", help="启动后用 BridgeAdapter 自测普通与流式请求，并核对每个任务只执行一次")
+    args = parser.parse_args()
+
+    bridge = FakeBridge(args.latency_ms / 1000, args.fail_rate, args.chunks)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(bridge))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-bridge", daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    if args.check:
+        adapter = BridgeAdapter(url, timeout_sec=10, retry=3, backoff_sec=0.05)
+        agents = [AgentConfig(f"a{i}", "Agent") for i in range(4)]
+        chunks = []
+        results = [adapter.execute(a, "ping") for a in agents]
+        results += [adapter.execute(a, "stream", on_chunk=chunks.append) for a in agents]
+        adapter.close()
+        for result in results:
+            print(f"{result.agent_id} {result.status.value} {result.content}")
+        print(json.dumps({"chunks": len(chunks), "executions": bridge.executions, "rejected_503": bridge.rejected}, ensure_ascii=False))
+        server.shutdown()
+        duplicated = [agent_id for agent_id, count in bridge.executions.items() if count > 2]
+        sys.exit(1 if duplicated or any(r.status.value != "DONE" for r in results) else 0)
+    print(f"Fake bridge: {url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(json.dumps({"executions": bridge.executions, "rejected_503": bridge.rejected}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
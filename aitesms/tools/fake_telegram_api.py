@@ -0,0 +1,154 @@
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+
+class FakeBotApi:
+    """本地模拟的 Telegram Bot API：记录 sendMessage、按会话限速返回 429、支持 getUpdates 长轮询与注入入站消息。"""
+
+    def __init__(self, token: str, rate_per_sec: float, burst: int, latency_sec: float) -> None:
+        self.token = token
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self.latency_sec = latency_sec
+        self.sent: List[Dict[str, object]] = []
+        self.rejected = 0
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._updates: List[Dict[str, object]] = []
+        self._next_update = 1
+        self._cond = threading.Condition()
+
+    def inject(self, chat_id: str, text: str) -> int:
+        with self._cond:
+            update_id = self._next_update
+            self._next_update += 1
+            chat = int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id
+            self._updates.append(
+                {"update_id": update_id, "message": {"message_id": update_id, "date": int(time.time()), "chat": {"id": chat}, "text": text}}
+            )
+            self._cond.notify_all()
+        return update_id
+
+    def send_message(self, params: Dict[str, object]) -> Dict[str, object]:
+        chat_id = str(params.get("chat_id", ""))
+        text = str(params.get("text", ""))
+        if not text or len(text) > 4096:
+            return {"ok": False, "error_code": 400, "description": f"Bad Request: message length {len(text)}"}
+        now = time.monotonic()
+        with self._cond:
+            # Same model as the real limit: a bucket of burst messages refilled at rate per second.
+            tokens, updated = self._buckets.get(chat_id, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated) * self.rate_per_sec)
+            if tokens < 1:
+                self._buckets[chat_id] = (tokens, now)
+                self.rejected += 1
+                retry_after = max(1, int((1 - tokens) / self.rate_per_sec + 0.999))
+                return {
+                    "ok": False,
+                    "error_code": 429,
+                    "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }
+            self._buckets[chat_id] = (tokens - 1, now)
+            message = {"message_id": len(self.sent) + 1, "chat": {"id": chat_id}, "text": text, "at": time.time()}
+            self.sent.append(message)
+        print(json.dumps({"sent": chat_id, "chars": len(text), "text": text[:200]}, ensure_ascii=False), flush=True)
+        return {"ok": True, "result": message}
+
+    def get_updates(self, params: Dict[str, object]) -> Dict[str, object]:
+        offset = int(params.get("offset", 0) or 0)
+        deadline = time.monotonic() + float(params.get("timeout", 0) or 0)
+        with self._cond:
+            while True:
+                if offset < 0:
+                    pending = self._updates[offset:]
+                else:
+                    pending = [u for u in self._updates if int(u["update_id"]) >= offset]
+                remaining = deadline - time.monotonic()
+                if pending or remaining <= 0:
+                    return {"ok": True, "result": pending}
+                self._cond.wait(remaining)
+
+
+def make_handler(api: FakeBotApi):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt: str, *args) -> None:  # noqa: A002
+            pass
+
+        def _reply(self, status: int, data: object) -> None:
+            body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self) -> None:  # noqa: N802
+            if self.path == "/sent":
+                self._reply(200, {"sent": api.sent, "rejected": api.rejected})
+            else:
+                self._reply(404, {"ok": False, "description": "Not Found"})
+
+        def do_POST(self) -> None:  # noqa: N802
+            length = int(self.headers.get("Content-Length", 0) or 0)
+            try:
+                params = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+            except ValueError:
+                self._reply(400, {"ok": False, "error_code": 400, "description": "Bad Request: invalid JSON"})
+                return
+            if self.path == "/inject":
+                self._reply(200, {"ok": True, "update_id": api.inject(str(params.get("chat_id", "")), str(params.get("text", "")))})
+                return
+            prefix, _, method = self.path.rpartition("/")
+            if prefix != f"/bot{api.token}":
+                self._reply(401, {"ok": False, "error_code": 401, "description": "Unauthorized"})
+                return
+            if api.latency_sec:
+                time.sleep(api.latency_sec)
+            if method == "sendMessage":
+                data = api.send_message(params)
+            elif method == "getUpdates":
+                data = api.get_updates(params)
+            else:
+                data = {"ok": False, "error_code": 404, "description": f"Not Found: method {method}"}
+            self._reply(200 if data.get("ok") else int(data.get("error_code", 400)), data)
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地模拟 Telegram Bot API，用于调试 Telegram 桥接（把 bridge.telegram_api_url 指向它）")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token", default="test-token", help="需与 bridge.telegram_token 一致")
+    parser.add_argument("--chat-id", default="1000", help="从标准输入读入的每一行作为该会话发来的消息")
+    parser.add_argument("--rate", type=float, default=1.0, help="每个会话每秒允许的消息数，超出返回 429")
+    parser.add_argument("--burst", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每个请求的模拟网络延迟")
+    args = parser.parse_args()
+
+    api = FakeBotApi(args.token, args.rate, args.burst, args.latency_ms / 1000)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-telegram", daemon=True).start()
+    print(f"Fake Bot API: http://127.0.0.1:{args.port}（token {args.token}，会话 {args.chat_id}）；输入文字回车即作为入站消息", flush=True)
+    try:
+        for line in sys.stdin:
+            if line.strip():
+                api.inject(args.chat_id, line.strip())
+        # With stdin closed (e.g. run in the background) keep serving until interrupted.
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(json.dumps({"sent": len(api.sent), "rejected_429": api.rejected}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+from pathlib import Path
+import argparse
+import gc
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+SRC_PATH = PROJECT_ROOT / "src"
+if str(SRC_PATH) not in sys.path:
+    sys.path.insert(0, str(SRC_PATH))
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+from codex_ai_teams.config import load_settings, save_settings, validate_agents  # noqa: E402
+from codex_ai_teams.models import AgentConfig, AgentLogEvent, AgentResult, AgentStatus  # noqa: E402
+from codex_ai_teams.ui.agent_terminals import BUFFER_LINES  # noqa: E402
+from codex_ai_teams.ui.main_window import MainWindow  # noqa: E402
+
+try:
+    import psutil  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    psutil = None
+
+REPORT_VERSION = 1
+CHUNK_EVENTS = 200
+WORDS = "agent build test deploy review merge patch cache index query render stream retry session".split()
+
+
+def rss_mb() -> float:
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1048576
+    try:
+        pages = int(Path("/proc/self/statm").read_text().split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0.0
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1048576
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def prepare_root(agents: int) -> Path:
+    """在临时目录里放一份配置，按需补足 agent 数量；soak 不触碰项目自己的日志与会话。"""
+    root = Path(tempfile.mkdtemp(prefix="codex-soak-"))
+    (root / "config").mkdir()
+    config_path = root / "config" / "teams.yaml"
+    shutil.copy(PROJECT_ROOT / "config" / "teams.yaml", config_path)
+    settings = load_settings(config_path)
+    settings.app.max_agents = max(settings.app.max_agents, agents) if settings.app.max_agents else 0
+    for i in range(len(settings.agents), agents):
+        settings.agents.append(AgentConfig(f"soak{i}", f"SOAK{i} Agent"))
+    del settings.agents[agents:]
+    for agent in settings.agents:
+        agent.session_id = ""
+    # Events are injected straight into the bus; no CLI runs, so the runtime stays in-process.
+    settings.runtime.worker_process = False
+    validate_agents(settings.agents, settings.app.max_agents)
+    save_settings(config_path, settings)
+    return root
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+class SoakRun:
+    def __init__(self, args: argparse.Namespace, app: QApplication, window: MainWindow) -> None:
+        self.args = args
+        self.app = app
+        self.w = window
+        self.rng = random.Random(args.seed)
+        self.agents = [(a.agent_id, a.role) for a in window.settings.agents]
+        self.samples: List[Dict[str, float]] = []
+        self.events = 0
+        self._op_ms: List[float] = []
+        self._lag_ms = 0.0
+        window.watchdog.lag_changed.connect(self._on_lag)
+
+    def _on_lag(self, lag_ms: float) -> None:
+        self._lag_ms = max(self._lag_ms, lag_ms)
+
+    def _emit(self, agent_id: str, role: str, result: bool) -> None:
+        start = time.perf_counter()
+        if result:
+            lines = [sentence(self.rng, self.rng.randint(5, 40)) for _ in range(self.rng.randint(1, self.args.result_lines))]
+            status = AgentStatus.FAILED if self.rng.random() < 0.05 else AgentStatus.DONE
+            self.w.bus.agent_updated.emit(AgentResult(agent_id, role, status, "\n".join(lines)))
+        else:
+            self.w.bus.agent_log.emit(AgentLogEvent(agent_id, role, AgentStatus.RUNNING, sentence(self.rng, self.rng.randint(3, 30))))
+        self._op_ms.append((time.perf_counter() - start) * 1000)
+        self.events += 1
+
+    def _simulate_minute(self) -> None:
+        pending = 0
+        for agent_id, role in self.agents:
+            for _ in range(self.args.lines_per_min):
+                self._emit(agent_id, role, False)
+                pending += 1
+                if pending >= CHUNK_EVENTS:
+                    # Let timers, the watchdog and queued signals run, as the live event loop would.
+                    self.app.processEvents()
+                    pending = 0
+            if self.rng.random() < 1 / max(1, self.args.result_every_min):
+                self._emit(agent_id, role, True)
+        self.app.processEvents()
+
+    def sample(self, sim_min: int) -> Dict[str, float]:
+        gc.collect()
+        w = self.w
+        sample = {
+            "sim_min": sim_min,
+            "events": self.events,
+            "rss_mb": round(rss_mb(), 2),
+            "objects": len(gc.get_objects()),
+            "logs": len(w.logs),
+            "log_rows": w.logs_table.rowCount(),
+            "chat_rows": w.conversation.message_count(),
+            "terminal_lines": w.agent_terminals.buffered_lines(),
+            "exec_log_lines": sum(len(buf) for buf in w._agent_log_buffers.values()),
+            "lag_ms_max": round(self._lag_ms, 1),
+            "op_ms_p50": round(percentile(self._op_ms, 0.5), 3),
+            "op_ms_p95": round(percentile(self._op_ms, 0.95), 3),
+            "op_ms_max": round(max(self._op_ms, default=0.0), 3),
+        }
+        self._op_ms = []
+        self._lag_ms = 0.0
+        self.samples.append(sample)
+        return sample
+
+    def run(self) -> None:
+        total_min = int(self.args.sim_hours * 60)
+        self.sample(0)
+        for minute in range(1, total_min + 1):
+            self._simulate_minute()
+            if minute % self.args.sample_every_min == 0 or minute == total_min:
+                s = self.sample(minute)
+                print(
+                    f"[{minute / 60:6.2f}h] events={s['events']:>8} rss={s['rss_mb']:8.1f}MB objects={s['objects']:>8} "
+                    f"lag={s['lag_ms_max']:7.1f}ms op p95={s['op_ms_p95']:.3f}ms",
+                    flush=True,
+                )
+
+    def limits(self) -> Dict[str, int]:
+        w = self.w
+        n = len(self.agents)
+        # Scrolling back pages older rows in on top of the in-memory limit; the soak never scrolls.
+        return {
+            "logs": w.LOG_MEMORY_LIMIT,
+            "log_rows": w.LOG_MEMORY_LIMIT,
+            "chat_rows": w.conversation.max_messages,
+            "terminal_lines": BUFFER_LINES * n,
+            "exec_log_lines": w.EXEC_LOG_LIMIT * n,
+        }
+
+
+def evaluate(samples: List[Dict[str, float]], limits: Dict[str, int], args: argparse.Namespace) -> Dict[str, object]:
+    warm = [s for s in samples if s["sim_min"] >= args.warmup_min]
+    baseline, last = (warm[0], warm[-1]) if len(warm) >= 2 else (samples[0], samples[-1])
+    rss_growth = last["rss_mb"] - baseline["rss_mb"]
+    object_growth_pct = (last["objects"] - baseline["objects"]) * 100 / max(1, baseline["objects"])
+    measured = samples[1:] or samples
+    summary = {
+        "events": last["events"],
+        "baseline_sim_min": baseline["sim_min"],
+        "rss_mb_baseline": baseline["rss_mb"],
+        "rss_mb_final": last["rss_mb"],
+        "rss_growth_mb": round(rss_growth, 2),
+        "objects_baseline": baseline["objects"],
+        "objects_final": last["objects"],
+        "object_growth_pct": round(object_growth_pct, 2),
+        "lag_ms_max": max(s["lag_ms_max"] for s in measured),
+        "op_ms_p95_max": max(s["op_ms_p95"] for s in measured),
+        "op_ms_p50_median": round(statistics.median(s["op_ms_p50"] for s in measured), 3),
+    }
+    violations: List[str] = []
+    if rss_growth > args.max_rss_growth_mb:
+        violations.append(f"RSS 增长 {rss_growth:.1f} MB，超过预算 {args.max_rss_growth_mb} MB")
+    if object_growth_pct > args.max_object_growth_pct:
+        violations.append(f"对象数增长 {object_growth_pct:.1f}%，超过预算 {args.max_object_growth_pct}%")
+    if summary["lag_ms_max"] > args.max_lag_ms:
+        violations.append(f"事件循环最大延迟 {summary['lag_ms_max']} ms，超过预算 {args.max_lag_ms} ms")
+    if summary["op_ms_p95_max"] > args.max_op_p95_ms:
+        violations.append(f"界面操作 p95 {summary['op_ms_p95_max']} ms，超过预算 {args.max_op_p95_ms} ms")
+    for key, limit in limits.items():
+        peak = max(s[key] for s in samples)
+        if peak > limit:
+            violations.append(f"{key} 峰值 {peak} 超过上限 {limit}（缓冲未按上限裁剪）")
+    return {"summary": summary, "violations": violations, "passed": not violations}
+
+
+def compare(report: Dict[str, object], baseline_path: Path) -> None:
+    old = json.loads(baseline_path.read_text(encoding="utf-8"))
+    print(f"\n与 {baseline_path} 对比：")
+    for key, value in dict(report["summary"]).items():
+        before = dict(old.get("summary") or {}).get(key)
+        if isinstance(value, (int, float)) and isinstance(before, (int, float)):
+            print(f"  {key:<20} {before:>12} → {value:>12}  ({value - before:+.3f})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="无界面长时间压测：向 MainWindow 注入合成日志与结果，检查内存与延迟是否稳定")
+    parser.add_argument("--sim-hours", type=float, default=8.0, help="模拟的运行时长（小时）")
+    parser.add_argument("--agents", type=int, default=8)
+    parser.add_argument("--lines-per-min", type=int, default=30, help="每个 agent 每模拟分钟的日志行数")
+    parser.add_argument("--result-every-min", type=int, default=5, help="每个 agent 平均多少模拟分钟产出一次结果")
+    parser.add_argument("--result-lines", type=int, default=40, help="单次结果的最大行数")
+    parser.add_argument("--sample-every-min", type=int, default=15, help="采样间隔（模拟分钟）")
+    parser.add_argument("--warmup-min", type=int, default=60, help="基线取自该模拟时刻之后的第一次采样，之前缓冲尚在填充")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=64.0)
+    parser.add_argument("--max-object-growth-pct", type=float, default=10.0)
+    parser.add_argument("--max-lag-ms", type=float, default=500.0)
+    parser.add_argument("--max-op-p95-ms", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--report", type=Path, default=None, help="报告 JSON，默认 logs/soak/soak-<时间>.json")
+    parser.add_argument("--compare", type=Path, default=None, help="与之前的报告对比摘要指标")
+    parser.add_argument("--keep-root", action="store_true", help="保留临时工作目录以便检查")
+    args = parser.parse_args()
+
+    root = prepare_root(args.agents)
+    app = QApplication(sys.argv[:1])
+    window = MainWindow(project_root=root)
+    window.show()
+    app.processEvents()
+    soak = SoakRun(args, app, window)
+    started = datetime.now()
+    t0 = time.monotonic()
+    try:
+        soak.run()
+    finally:
+        window.close()
+        app.processEvents()
+        if not args.keep_root:
+            shutil.rmtree(root, ignore_errors=True)
+
+    limits = soak.limits()
+    result = evaluate(soak.samples, limits, args)
+    report: Dict[str, object] = {
+        "version": REPORT_VERSION,
+        "started": started.isoformat(timespec="seconds"),
+        "wall_sec": round(time.monotonic() - t0, 1),
+        "python": sys.version.split()[0],
+        "config": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        "limits": limits,
+        "samples": soak.samples,
+        **result,
+    }
+    report_path: Optional[Path] = args.report or PROJECT_ROOT / "logs" / "soak" / f"soak-{started.strftime('%Y%m%d-%H%M%S')}.json"
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    report_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    print(f"\n报告：{report_path}（耗时 {report['wall_sec']}s）")
+    for key, value in dict(result["summary"]).items():
+        print(f"  {key:<20} {value}")
+    if args.compare is not None:
+        compare(report, args.compare)
+    for line in result["violations"]:
+        print(f"FAIL: {line}")
+    print("PASS" if result["passed"] else "FAIL")
+    sys.exit(0 if result["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()